@@ -1,11 +1,19 @@
 import os
 import sys
 import json
-import time
 import pandas as pd
-from sdcclient import IbmAuthHelper, SdMonitorClient
 from datetime import datetime
 
+# The metric cache and sources are shared with SMART-MARS
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "project", "SMART-MARS"))
+from metric_cache import MetricCache
+from metrics_source import SysdigMetricsSource, create_metrics_source
+
+# Where metrics come from: "sysdig" (IBM Cloud Monitoring) or "replay" (recorded datasets)
+METRICS_SOURCE = "sysdig"
+REPLAY_DIR = "datasets_high"
+REPLAY_SPEEDUP = 100
+
 SLEEP = 60
 SERVICE_TO_USE = [
     'acmeair-mainservice',
@@ -20,46 +28,40 @@ def bytes_to_mb(bytes_value):
     return mb_value
 
 class Monitor:
-    def __init__(self, url, api_key, guid):
-        # Create a client object using the IBM Cloud API credentials
-        ibm_headers = IbmAuthHelper.get_headers(url, api_key, guid)
-        self.sdclient = SdMonitorClient(sdc_url=url, custom_headers=ibm_headers)
-
+    def __init__(self, url, api_key, guid, source=None):
         # Sysdig Data API Query Parameters
         # Pull the latest 5 minutes of data
         self.START = -SLEEP
         self.END = 0
         self.SAMPLING = 10
         self.FILTER = 'kube_namespace_name="group-4"' # None
+
+        # Metrics source, IBM Cloud Monitoring unless a replay source is given
+        self.source = source or SysdigMetricsSource(url, api_key, guid, self.FILTER)
+
+        # Samples already fetched, only the delta since the last seen sample is queried
+        self.cache = MetricCache(SLEEP, self.SAMPLING)
     
     # Function to fetch data from IBM Cloud
     def fetch_data_from_ibm(self, id, aggregation):
-        # Specify the metric to query
-        metric = [
-            # segmentation metric
-            {"id": "kubernetes.deployment.name"},
-            # Specify the ID for keys, and ID with aggregation for values
-            {"id": id,
-            "aggregations": {
-                "time": aggregation,
-                "group": "avg"
-            }}
-            # {"id": "cpu.used.percent", "aggregations": {"time": "timeAvg", "group": "avg"}}
-            ]
-
-        # Query the metric
-        ok, res = self.sdclient.get_data(metrics=metric,  # metrics list
-                                        start_ts=self.START,  # start_ts = 600 seconds ago
-                                        end_ts=self.END,
-                                        sampling_s=self.SAMPLING,
-                                        filter=self.FILTER)  # end_ts = now
-        # print("Raw response data:", res)
-        # Check if the query was successful
-        if ok:
-            data = res
-        else:
-            print(res)
-            sys.exit(1)
+        key = id + "_" + aggregation
+        query_range = self.cache.query_range(key, self.source.now())
+        # Query the metric, unless the cached window is already up to date
+        if query_range is not None:
+            start_ts, end_ts = query_range
+            ok, res = self.source.get_data(id, aggregation,
+                                           start_ts,  # last cached sample, or SLEEP seconds ago
+                                           end_ts,  # now
+                                           self.SAMPLING)
+            # print("Raw response data:", res)
+            # Check if the query was successful
+            if ok:
+                self.cache.ingest(key, res)
+            else:
+                print(res)
+                sys.exit(1)
+        # The analysis sees the full window from the cache
+        data = self.cache.get_window(key)
         
         # Create a directory to store the datasets if it does not exist
         if not os.path.exists('datasets'):
@@ -265,10 +267,17 @@ def main():
         ("jvm.gc.global.time", "avg")
     ]
 
-    monitor = Monitor(URL, APIKEY, GUID)
+    source = None
+    if METRICS_SOURCE == "replay":
+        source = create_metrics_source("replay", data_dir=REPLAY_DIR, speedup=REPLAY_SPEEDUP, start_offset=SLEEP)
+    monitor = Monitor(URL, APIKEY, GUID, source)
     analyzer = Analyzer(core_metrics)
 
+    # Cycles fire every SLEEP seconds on sampling boundaries of the clock of the source, whatever the processing
+    # time: a replay then covers every recorded sample, and the loop stops after its last one
+    scheduler = monitor.source.scheduler(SLEEP, monitor.SAMPLING)
     while True:
+        tick = scheduler.wait()
         # Fetch data from IBM
         for id in avg_metric_ids:
             monitor.fetch_data_from_ibm(id, "avg")
@@ -280,8 +289,9 @@ def main():
             monitor.fetch_data_from_ibm(id, "max")
         print(f"Pulling metrics from IBM Cloud")
         analyzer.process_data()
-        # Sleep for 5 minutes (300 seconds)
-        time.sleep(SLEEP)
+        scheduler.finish(tick)
+        if monitor.source.finished(tick.scheduled):
+            break
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
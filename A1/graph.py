@@ -1,90 +1,131 @@
+import argparse
 import json
+import os
+
+import numpy as np
+import matplotlib
+
+matplotlib.use('Agg')  # Figures are written to files, no display needed
+import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
-import datetime
+
+# Define the services to plot
+SERVICES_TO_PLOT = [
+    'acmeair-mainservice',
+    'acmeair-authservice',
+    'acmeair-flightservice',
+    'acmeair-customerservice',
+    'acmeair-bookingservice'
+]
+
+METRIC_FILES = [
+    'memory_limit_used_percent_avg_metric.json',
+    'cpu_quota_used_percent_avg_metric.json',
+    'jvm_gc_global_time_avg_metric.json',
+    'net_http_request_time_max_metric.json',
+    'net_request_count_in_sum_metric.json'
+]
+
+TITLES = [
+    'Memory Limit Used Percent',
+    'CPU Quota Used Percent',
+    'JVM GC Global Time',
+    'Net HTTP Request Time Max',
+    'Net Request Count In Sum'
+]
+
 
 # Load JSON data
 def load_data(file_path):
+    """
+    Decode a Sysdig metric file into arrays.
+
+    :param file_path: JSON file with {"data": [{"t": timestamp, "d": [service, value]}, ...]}.
+    :return: Timestamps (int64), service names and values (float64), one entry per sample.
+    """
     with open(file_path, 'r') as file:
-        return json.load(file)
+        entries = json.load(file)['data']
+    timestamps = np.fromiter((entry['t'] for entry in entries), dtype=np.int64, count=len(entries))
+    services = np.array([entry['d'][0] or 'Unknown' for entry in entries])
+    values = np.array([entry['d'][1] for entry in entries], dtype=np.float64)
+    return timestamps, services, np.nan_to_num(values)
+
+
+def pivot(timestamps, services, values, services_to_plot=SERVICES_TO_PLOT):
+    """
+    Sum the samples into a (time x service) matrix, one row per distinct timestamp in time order and one column per
+    plotted service. A service without a sample at a timestamp counts 0.
+
+    :return: Sorted distinct timestamps and the matrix.
+    """
+    times, rows = np.unique(timestamps, return_inverse=True)
+    columns = {service: i for i, service in enumerate(services_to_plot)}
+    column = np.array([columns.get(service, -1) for service in services], dtype=np.int64)
+    plotted = column >= 0
+    matrix = np.zeros((len(times), len(services_to_plot)))
+    np.add.at(matrix, (rows[plotted], column[plotted]), values[plotted])
+    return times, matrix
+
 
 # Process and plot data
-def plot_graph(data, ax, title):
-    # Extract time and values
-    metrics = {}
-
-    # Define the services to plot
-    services_to_plot = [
-        'acmeair-mainservice',
-        'acmeair-authservice',
-        'acmeair-flightservice',
-        'acmeair-customerservice',
-        'acmeair-bookingservice'
-    ]
-
-    for entry in data['data']:
-        timestamp = datetime.datetime.fromtimestamp(entry['t'])
-        time_str = timestamp.strftime('%H:%M:%S')
-        
-        if time_str not in metrics:
-            metrics[time_str] = {}
-        
-        service_name = entry['d'][0] if entry['d'][0] else 'Unknown'
-        value = entry['d'][1]
-        
-        if service_name in services_to_plot:
-            if service_name not in metrics[time_str]:
-                metrics[time_str][service_name] = 0
-            metrics[time_str][service_name] += value
-    
-    sorted_times = sorted(metrics)
-
-    for service in services_to_plot:
-        service_data = [metrics[time].get(service, 0) for time in sorted_times]
-        ax.plot(sorted(metrics), service_data, label=service)
-    
+def plot_graph(data, ax, title, services_to_plot=SERVICES_TO_PLOT):
+    times, matrix = pivot(*data, services_to_plot)
+    # Integer timestamps on a date axis, so runs across midnight stay in order
+    dates = (times * 1000).astype('datetime64[ms]')
+    lines = ax.plot(dates, matrix)
+    for line, service in zip(lines, services_to_plot):
+        line.set_label(service)
+
     ax.set_xlabel('Time')
     ax.set_ylabel('Value')
     ax.set_title(title)
-    ax.set_xticks(range(0, len(sorted_times), 3))
-    ax.set_xticklabels([sorted_times[i] for i in range(0, len(sorted_times), 3)], rotation=45, fontsize=8)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+    ax.tick_params(axis='x', labelrotation=45, labelsize=8)
     ax.legend()
 
-# Main function to generate the combined graph
-def main():
-    file_paths = [
-        'datasets/memory_limit_used_percent_avg_metric.json',
-        'datasets/cpu_quota_used_percent_avg_metric.json',
-        'datasets/jvm_gc_global_time_avg_metric.json',
-        'datasets/net_http_request_time_max_metric.json',
-        'datasets/net_request_count_in_sum_metric.json'
-    ]
-
-    titles = [
-        'Memory Limit Used Percent',
-        'CPU Quota Used Percent',
-        'JVM GC Global Time',
-        'Net HTTP Request Time Max',
-        'Net Request Count In Sum'
-    ]
-
-    # Create a figure with 2 rows and 3 columns (6 subplots)
+
+def plot_datasets(datasets_dir, output):
+    """
+    Plot the five metric files of a datasets directory in one figure.
+
+    :param datasets_dir: Directory with the metric JSON files, e.g. datasets_high.
+    :param output: Path of the figure.
+    """
+    # Create a figure with 3 rows and 2 columns (6 subplots)
     fig, axes = plt.subplots(nrows=3, ncols=2, figsize=(12, 18))
 
     # Flatten the axes array for easy iteration
     axes = axes.flatten()
 
     # Loop over file paths, load data, and plot in each subplot
-    for i, file_path in enumerate(file_paths):
-        data = load_data(file_path)
-        plot_graph(data, axes[i], titles[i])
+    for ax, file_name, title in zip(axes, METRIC_FILES, TITLES):
+        plot_graph(load_data(os.path.join(datasets_dir, file_name)), ax, title)
 
     # Hide the last subplot since we only have 5 datasets
     axes[-1].axis('off')
 
     # Adjust layout to prevent overlap and save the figure
-    plt.tight_layout()
-    plt.savefig('combined_metrics_graph.png')
-    plt.show()
+    fig.suptitle(os.path.basename(os.path.normpath(datasets_dir)))
+    fig.tight_layout()
+    fig.savefig(output)
+    plt.close(fig)
+    print(f"Saved {output}")
+
+
+# Main function to generate the combined graph of each datasets directory
+def main():
+    parser = argparse.ArgumentParser(description='Plot the metrics of one or more datasets directories')
+    parser.add_argument('datasets', nargs='*', default=['datasets'],
+                        help='Directories with the metric JSON files, e.g. datasets_low datasets_medium datasets_high')
+    parser.add_argument('--out-dir', default='.', help='Directory of the figures')
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for datasets_dir in args.datasets:
+        name = os.path.basename(os.path.normpath(datasets_dir))
+        output = 'combined_metrics_graph.png' if name == 'datasets' else f'{name}_combined_metrics_graph.png'
+        plot_datasets(datasets_dir, os.path.join(args.out_dir, output))
+
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,11 +1,20 @@
 import os
 import sys
 import json
-import time
+import subprocess
 import pandas as pd
-from sdcclient import IbmAuthHelper, SdMonitorClient
 from datetime import datetime
-import subprocess
+from performance_model import CONFIG_FILE, load_or_fit
+
+# The metric cache and sources are shared with SMART-MARS
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "project", "SMART-MARS"))
+from metric_cache import MetricCache
+from metrics_source import SysdigMetricsSource, create_metrics_source
+
+# Where metrics come from: "sysdig" (IBM Cloud Monitoring) or "replay" (recorded datasets)
+METRICS_SOURCE = "sysdig"
+REPLAY_DIR = "datasets_high_load"
+REPLAY_SPEEDUP = 100
 
 SLEEP = 500
 SERVICE_TO_USE = [
@@ -18,51 +27,52 @@ SERVICE_TO_USE = [
 
 SERVICE_CONFIG = [{"cpu": 500, "memory": 256, "replica": 1} for _ in range(len(SERVICE_TO_USE))]
 
+# Performance model used by the Planner to predict the effect of an adaptation
+PERFORMANCE_MODEL = "performance_model.npz"
+PERFORMANCE_DATASETS = ["datasets", "datasets_adaption", "datasets_high_load", "datasets_high_load_no_adaptation"]
+
 def bytes_to_mb(bytes_value):
     mb_value = bytes_value / (1024 * 1024)
     return mb_value
 
 class Monitor:
-    def __init__(self, url, api_key, guid):
-        # Create a client object using the IBM Cloud API credentials
-        ibm_headers = IbmAuthHelper.get_headers(url, api_key, guid)
-        self.sdclient = SdMonitorClient(sdc_url=url, custom_headers=ibm_headers)
-
+    def __init__(self, url, api_key, guid, source=None):
         # Sysdig Data API Query Parameters
         # Pull the latest 5 minutes of data
         self.START = -SLEEP
         self.END = 0
         self.SAMPLING = 10
         self.FILTER = 'kube_namespace_name="group-4"' # None
+
+        # Metrics source, IBM Cloud Monitoring unless a replay source is given
+        self.source = source or SysdigMetricsSource(url, api_key, guid, self.FILTER)
+
+        # Samples already fetched, only the delta since the last seen sample is queried
+        self.cache = MetricCache(SLEEP, self.SAMPLING)
+
+        # Configuration of each service over time, saved with the datasets for the performance model
+        self.config_history = []
     
     # Function to fetch data from IBM Cloud
     def fetch_data_from_ibm(self, id, aggregation):
-        # Specify the metric to query
-        metric = [
-            # segmentation metric
-            {"id": "kubernetes.deployment.name"},
-            # Specify the ID for keys, and ID with aggregation for values
-            {"id": id,
-            "aggregations": {
-                "time": aggregation,
-                "group": "avg"
-            }}
-            # {"id": "cpu.used.percent", "aggregations": {"time": "timeAvg", "group": "avg"}}
-            ]
-
-        # Query the metric
-        ok, res = self.sdclient.get_data(metrics=metric,  # metrics list
-                                        start_ts=self.START,  # start_ts = 600 seconds ago
-                                        end_ts=self.END,
-                                        sampling_s=self.SAMPLING,
-                                        filter=self.FILTER)  # end_ts = now
-        # print("Raw response data:", res)
-        # Check if the query was successful
-        if ok:
-            data = res
-        else:
-            print(res)
-            sys.exit(1)
+        key = id + "_" + aggregation
+        query_range = self.cache.query_range(key, self.source.now())
+        # Query the metric, unless the cached window is already up to date
+        if query_range is not None:
+            start_ts, end_ts = query_range
+            ok, res = self.source.get_data(id, aggregation,
+                                           start_ts,  # last cached sample, or SLEEP seconds ago
+                                           end_ts,  # now
+                                           self.SAMPLING)
+            # print("Raw response data:", res)
+            # Check if the query was successful
+            if ok:
+                self.cache.ingest(key, res)
+            else:
+                print(res)
+                sys.exit(1)
+        # The analysis sees the full window from the cache
+        data = self.cache.get_window(key)
         
         # Create a directory to store the datasets if it does not exist
         if not os.path.exists('datasets'):
@@ -74,6 +84,18 @@ class Monitor:
         with open(filename, "w") as outfile: 
             json.dump(data, outfile)
 
+    def record_config(self, configurations):
+        """
+        Record the configuration applied to each service from now on, in the same format as the metric files.
+        """
+        now = int(self.source.now())
+        for service, config in zip(SERVICE_TO_USE, configurations):
+            self.config_history.append({"t": now, "d": [service, config["cpu"], config["memory"], config["replica"]]})
+        if not os.path.exists('datasets'):
+            os.mkdir('datasets')
+        with open(os.path.join("datasets", CONFIG_FILE), "w") as outfile:
+            json.dump({"data": self.config_history}, outfile)
+
 
 class Analyzer:
     def __init__(self, metrics):
@@ -131,6 +153,8 @@ class Analyzer:
         return self.utility_preference_linear(gc_time, 0, 500)
 
     def utility_preference_cost(self, cost):
+        if cost is None:
+            return 1  # Keeping the configuration costs nothing more
         if cost == "cpu" or cost == "memory":
             return 1
         else:
@@ -169,8 +193,49 @@ class Analyzer:
 
 
 class Planner:
-    def __init__(self, analyzer):
+    def __init__(self, analyzer, performance_model=None):
         self.analyzer = analyzer  # Store a reference to the Analyzer instance
+        self.performance_model = performance_model  # Predicts the effect of a candidate configuration
+
+    def predict_adaption_option(self, current_status, current_config,
+                                max_replicas=4, min_replicas=1, min_cpu=100, min_memory=256, margin=0.05):
+        """
+        Pick the configuration with the highest predicted utility using the performance model.
+        The candidates are the current configuration and the same steps used by make_adaption_option,
+        a step is only taken if its utility beats keeping the current configuration by margin.
+
+        Returns:
+        - Adjusted CPU, memory, and replica count actions, or None to keep the current configuration
+        """
+        cpu = current_config["cpu"]
+        memory = current_config["memory"]
+        replica = current_config["replica"]
+        candidates = [
+            ("cpu", {"cpu": cpu + 100, "memory": memory, "replica": replica}),
+            ("cpu", {"cpu": cpu - 100, "memory": memory, "replica": replica}),
+            ("memory", {"cpu": cpu, "memory": memory + 256, "replica": replica}),
+            ("memory", {"cpu": cpu, "memory": memory - 256, "replica": replica}),
+            ("pod", {"cpu": cpu + 500, "memory": memory + 256, "replica": replica + 1}),
+            ("pod", {"cpu": cpu - 500, "memory": memory - 256, "replica": replica - 1}),
+        ]
+
+        keep_utility = self.analyzer.calculate_utility(
+            *self.performance_model.what_if(current_status, current_config, current_config), None)
+        best_config = None
+        best_utility = keep_utility + margin
+        for cost, config in candidates:
+            if not (min_replicas <= config["replica"] <= max_replicas) or config["cpu"] < min_cpu or config["memory"] < min_memory:
+                continue
+            predicted = self.performance_model.what_if(current_status, current_config, config)
+            utility = self.analyzer.calculate_utility(*predicted, cost)
+            if utility > best_utility:
+                best_config, best_utility = config, utility
+
+        if best_config is None:
+            print("The current configuration is predicted to be the best, keeping it")
+            return None
+        current_config.update(best_config)
+        return current_config
     
     def make_adaption_option(self, current_status, current_config,
                      cpu_upper_threshold=80, cpu_lower_threshold=10, 
@@ -196,6 +261,10 @@ class Planner:
         Returns:
         - Adjusted CPU, memory, and replica count actions
         """
+        if self.performance_model is not None:
+            return self.predict_adaption_option(current_status, current_config, max_replicas=max_replicas,
+                                                min_replicas=min_replicas, min_cpu=min_cpu, min_memory=min_memory)
+
         cpu_util = current_status[0]
         mem_util = current_status[1]
         latency = current_status[2]
@@ -318,15 +387,24 @@ def main():
     ]
 
     # Instantiate the Monitor, Analyzer, Planner, and Executor
-    monitor = Monitor(URL, APIKEY, GUID)
+    source = None
+    if METRICS_SOURCE == "replay":
+        source = create_metrics_source("replay", data_dir=REPLAY_DIR, speedup=REPLAY_SPEEDUP, start_offset=SLEEP)
+    monitor = Monitor(URL, APIKEY, GUID, source)
     analyzer = Analyzer(core_metrics)
-    planner = Planner(analyzer)  # Pass analyzer instance
+    performance_model = load_or_fit(PERFORMANCE_MODEL, [d for d in PERFORMANCE_DATASETS if os.path.isdir(d)])
+    planner = Planner(analyzer, performance_model)  # Pass analyzer instance
     executor = Executor()
 
     current_configurations = SERVICE_CONFIG
     executor.execute(current_configurations)
+    monitor.record_config(current_configurations)
 
+    # Cycles fire every SLEEP seconds on sampling boundaries of the clock of the source, whatever the processing
+    # time: a replay then covers every recorded sample, and the loop stops after its last one
+    scheduler = monitor.source.scheduler(SLEEP, monitor.SAMPLING)
     while True:
+        tick = scheduler.wait()
         # Fetch data for average metrics
         for id in avg_metric_ids:
             monitor.fetch_data_from_ibm(id, "avg")
@@ -349,9 +427,12 @@ def main():
             if adaptation_options[i] != None:
                 # If there is adaption, replace current GLOBAL store configuration
                 current_configurations[i] = adaptation_options[i]
+        monitor.record_config(current_configurations)
 
 
-        time.sleep(SLEEP)  # Wait before the next cycle
+        scheduler.finish(tick)
+        if monitor.source.finished(tick.scheduled):
+            break
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
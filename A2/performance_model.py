@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+# Metric files written by Monitor.fetch_data_from_ibm, keyed by the name used in the model
+METRIC_FILES = {
+    "cpu": "cpu_quota_used_percent_avg_metric.json",
+    "memory": "memory_limit_used_percent_avg_metric.json",
+    "latency": "net_http_request_time_max_metric.json",
+    "tps": "net_request_count_in_sum_metric.json",
+    "gc_time": "jvm_gc_global_time_avg_metric.json"
+}
+
+# Configuration of each service over time, written next to the metric files by Monitor.record_config:
+# {"data": [{"t": timestamp, "d": [service, cpu, memory, replica]}, ...]}
+CONFIG_FILE = "service_config.json"
+
+# Regression features, all derived from (load, cpu, memory, replica).
+# Load is spread over the replicas and expressed relative to the allocated CPU (millicores)
+# and memory (Mi), so that a what-if on the configuration moves along the fitted curve.
+FEATURES = ["bias", "load", "cpu_pressure", "cpu_pressure_sq", "memory_pressure"]
+
+# Features whose coefficient can not be negative: more resources per request never make things worse,
+# so a what-if that adds CPU, memory or replicas can only lower the predicted cpu, memory, latency and gc_time
+MONOTONE = ["cpu_pressure", "cpu_pressure_sq", "memory_pressure"]
+
+# The effect of the CPU and of the memory can only be told apart if the recorded configurations vary
+# independently of the load, i.e. if the (standardized) load, cpu_pressure and memory_pressure are not collinear
+IDENTIFIED = ["load", "cpu_pressure", "memory_pressure"]
+MAX_CONDITION = 1e6
+
+# Features used for each predicted metric
+TARGETS = {
+    "cpu": ["bias", "cpu_pressure"],
+    "memory": ["bias", "memory_pressure"],
+    "latency": ["bias", "cpu_pressure", "cpu_pressure_sq", "memory_pressure"],
+    "tps": ["bias", "load"],
+    "gc_time": ["bias", "memory_pressure"]
+}
+
+
+def load_config(dataset_dir):
+    """
+    Load the configuration history recorded with a dataset.
+
+    :return: Dictionary of (sorted timestamps, [cpu, memory, replica] rows) keyed by service, or None if the
+             dataset has no configuration file.
+    """
+    file_path = os.path.join(dataset_dir, CONFIG_FILE)
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'r') as file:
+        data = json.load(file)
+    history = {}
+    for entry in sorted(data["data"], key=lambda entry: entry['t']):
+        times, configs = history.setdefault(entry['d'][0], ([], []))
+        times.append(entry['t'])
+        configs.append(entry['d'][1:4])
+    return {service: (np.array(times), np.array(configs, dtype=np.float64)) for service, (times, configs) in history.items()}
+
+
+def load_dataset(dataset_dir, services=None, config=None):
+    """
+    Load the metric JSON files of a dataset directory and join them per (service, timestamp), with the
+    configuration each sample was recorded with.
+
+    :param dataset_dir: Directory holding the *_metric.json files (e.g. "datasets_high_load").
+    :param services: Optional list of services to keep.
+    :param config: Configuration ({"cpu", "memory", "replica"}) of the whole run, used only when the dataset
+                   has no configuration file. Without either, the configuration arrays are None.
+    :return: Dictionary of numpy arrays keyed by metric name and by "config_cpu", "config_memory" and
+             "config_replica", one entry per joined sample.
+    """
+    series = {}
+    for name, file_name in METRIC_FILES.items():
+        file_path = os.path.join(dataset_dir, file_name)
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+        with open(file_path, 'r') as file:
+            data = json.load(file)
+        series[name] = {(entry['d'][0], entry['t']): entry['d'][1] for entry in data["data"]
+                        if services is None or entry['d'][0] in services}
+
+    # Keep only the samples for which every metric was reported
+    keys = set.intersection(*(set(values) for values in series.values()))
+    keys = sorted(keys, key=lambda key: (key[0], key[1]))
+
+    # Configuration in effect at each sample: the last one recorded at or before it
+    history = load_config(dataset_dir)
+    configs = None
+    if history is not None:
+        configs = np.full((len(keys), 3), np.nan)
+        for i, (service, timestamp) in enumerate(keys):
+            if service in history:
+                times, rows = history[service]
+                index = np.searchsorted(times, timestamp, side="right") - 1
+                if index >= 0:
+                    configs[i] = rows[index]
+        # Samples from before the first recorded configuration are unknown
+        known = ~np.isnan(configs[:, 0])
+        keys = [key for key, keep in zip(keys, known) if keep]
+        configs = configs[known]
+    elif config is not None:
+        configs = np.tile([config["cpu"], config["memory"], config["replica"]], (len(keys), 1)).astype(np.float64)
+
+    result = {name: np.array([values[key] for key in keys], dtype=np.float64) for name, values in series.items()}
+    for j, name in enumerate(["config_cpu", "config_memory", "config_replica"]):
+        result[name] = configs[:, j] if configs is not None else None
+    return result
+
+
+class PerformanceModel:
+    def __init__(self, ridge=1e-6):
+        """
+        Linear performance model of a service fitted on the recorded datasets.
+
+        The model keeps the normal equations (X^T X, X^T y) instead of the samples, so it can be
+        fitted incrementally batch by batch and persisted in a few hundred bytes.
+
+        :param ridge: Ridge regularization added to the diagonal when solving.
+        """
+        self.ridge = ridge
+        self.xtx = np.zeros((len(FEATURES), len(FEATURES)))
+        self.xty = np.zeros((len(FEATURES), len(TARGETS)))
+        self.n_samples = 0
+        self.coefficients = None
+        self._columns = {target: [FEATURES.index(f) for f in features] for target, features in TARGETS.items()}
+
+    @staticmethod
+    def features(load, cpu, memory, replica):
+        """
+        Build the feature matrix. All arguments may be scalars or numpy arrays.
+
+        :return: Array of shape (n_samples, len(FEATURES)).
+        """
+        load, cpu, memory, replica = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64)
+                                                           for v in (load, cpu, memory, replica)))
+        load_per_replica = load / np.maximum(replica, 1)
+        cpu_pressure = 100 * load_per_replica / np.maximum(cpu, 1)
+        memory_pressure = 100 * load_per_replica / np.maximum(memory, 1)
+        return np.column_stack([np.ones_like(load), load, cpu_pressure, cpu_pressure ** 2, memory_pressure])
+
+    def partial_fit(self, load, cpu, memory, replica, observed):
+        """
+        Add a batch of observations to the model and refit.
+
+        :param load: Offered load (request count per sample).
+        :param cpu: CPU allocation in millicores.
+        :param memory: Memory allocation in Mi.
+        :param replica: Number of replicas.
+        :param observed: Dictionary of observed values keyed by target name (see TARGETS).
+        """
+        x = self.features(load, cpu, memory, replica)
+        y = np.column_stack([np.broadcast_to(np.asarray(observed[target], dtype=np.float64), (len(x),))
+                             for target in TARGETS])
+        self.xtx += x.T @ x
+        self.xty += x.T @ y
+        self.n_samples += len(x)
+        self._solve()
+        return self
+
+    def fit_datasets(self, dataset_dirs, config=None, services=None):
+        """
+        Fit the model on one or more recorded dataset directories.
+
+        :param dataset_dirs: List of dataset directories.
+        :param config: Configuration ({"cpu", "memory", "replica"}) of the datasets without a configuration file,
+                       those are skipped when None.
+        :param services: Optional list of services to use.
+        """
+        for dataset_dir in dataset_dirs:
+            data = load_dataset(dataset_dir, services, config)
+            if data["config_cpu"] is None:
+                print(f"No recorded configuration ({CONFIG_FILE}) in {dataset_dir}, skipping")
+                continue
+            if len(data["tps"]) == 0:
+                print(f"No complete samples in {dataset_dir}, skipping")
+                continue
+            self.partial_fit(data["tps"], data["config_cpu"], data["config_memory"], data["config_replica"], data)
+            print(f"Fitted performance model on {len(data['tps'])} samples from {dataset_dir}")
+        return self
+
+    def condition(self):
+        """
+        :return: Condition number of the correlation matrix of the IDENTIFIED features (inf if one is constant).
+        """
+        if self.n_samples < 2:
+            return np.inf
+        cols = [FEATURES.index(f) for f in IDENTIFIED]
+        mean = self.xtx[0, cols] / self.n_samples  # The bias column is all ones
+        cov = self.xtx[np.ix_(cols, cols)] / self.n_samples - np.outer(mean, mean)
+        scale = np.sqrt(np.diag(cov))
+        if np.any(scale <= 1e-12 * np.maximum(np.abs(mean), 1)):
+            return np.inf
+        return float(np.linalg.cond(cov / np.outer(scale, scale)))
+
+    def usable(self):
+        """
+        :return: True if the data determines the effect of the configuration, i.e. the recorded configurations
+                 varied enough for the CPU, memory and load terms not to be collinear.
+        """
+        return self.condition() < MAX_CONDITION
+
+    def _solve(self):
+        self.coefficients = np.zeros_like(self.xty)
+        for t, target in enumerate(TARGETS):
+            cols = list(self._columns[target])
+            # Non-negative least squares on the MONOTONE features: drop the most negative one and solve again
+            while True:
+                a = self.xtx[np.ix_(cols, cols)] + self.ridge * np.eye(len(cols))
+                solution = np.linalg.solve(a, self.xty[cols, t])
+                negative = [(value, col) for value, col in zip(solution, cols) if FEATURES[col] in MONOTONE and value < 0]
+                if not negative:
+                    break
+                cols.remove(min(negative)[1])
+            self.coefficients[:, t] = 0
+            self.coefficients[cols, t] = solution
+
+    def predict(self, load, cpu, memory, replica):
+        """
+        Predict the service metrics for a load and a configuration.
+
+        :return: Dictionary keyed by target name. Values are floats for scalar inputs, arrays otherwise.
+        """
+        if self.coefficients is None:
+            raise ValueError("Performance model is not fitted.")
+        scalar = all(np.ndim(v) == 0 for v in (load, cpu, memory, replica))
+        y = self.features(load, cpu, memory, replica) @ self.coefficients
+        # Utilization, latency and throughput can not be negative
+        y = np.maximum(y, 0)
+        return {target: (float(y[0, t]) if scalar else y[:, t]) for t, target in enumerate(TARGETS)}
+
+    def what_if(self, current_status, current_config, new_config):
+        """
+        Predict the metrics after moving from current_config to new_config.
+
+        The predicted change is applied to the observed status, so the observed level is kept and
+        only the effect of the configuration change comes from the model.
+
+        :param current_status: Observed [cpu, memory, latency, tps, gc_time].
+        :param current_config: Current configuration ({"cpu", "memory", "replica"}).
+        :param new_config: Candidate configuration.
+        :return: Predicted [cpu, memory, latency, tps, gc_time].
+        """
+        load = current_status[3]
+        before = self.predict(load, current_config["cpu"], current_config["memory"], current_config["replica"])
+        after = self.predict(load, new_config["cpu"], new_config["memory"], new_config["replica"])
+        predicted = [max(value + after[target] - before[target], 0)
+                     for value, target in zip(current_status, ["cpu", "memory", "latency", "tps", "gc_time"])]
+        # CPU and memory are percentages of the allocation
+        predicted[0] = min(predicted[0], 100)
+        predicted[1] = min(predicted[1], 100)
+        return predicted
+
+    def save(self, path):
+        np.savez(path, xtx=self.xtx, xty=self.xty, n_samples=self.n_samples, ridge=self.ridge,
+                 features=np.array(FEATURES), targets=np.array(list(TARGETS)))
+        print(f"Performance model saved to {path}")
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        if list(data["features"]) != FEATURES or list(data["targets"]) != list(TARGETS):
+            raise ValueError(f"Performance model in {path} was fitted with a different feature set.")
+        model = cls(ridge=float(data["ridge"]))
+        model.xtx = data["xtx"]
+        model.xty = data["xty"]
+        model.n_samples = int(data["n_samples"])
+        model._solve()
+        return model
+
+
+def load_or_fit(path, dataset_dirs, config=None, services=None):
+    """
+    Load the persisted performance model, or fit it on dataset_dirs and persist it.
+
+    :return: The model, or None if there is no data with varied configurations to fit it on (the drivers then
+             keep their heuristic planning).
+    """
+    if os.path.exists(path):
+        model = PerformanceModel.load(path)
+    else:
+        model = PerformanceModel().fit_datasets(dataset_dirs, config, services)
+        if model.n_samples == 0:
+            print(f"No samples with a recorded configuration in {dataset_dirs}, no performance model")
+            return None
+        model.save(path)
+    if not model.usable():
+        print(f"The configurations of the {model.n_samples} samples did not vary enough "
+              f"(condition {model.condition():.3g}), no performance model")
+        return None
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the performance model on recorded datasets.")
+    parser.add_argument("datasets", nargs="+", help="Dataset directories (e.g. datasets_high_load)")
+    parser.add_argument("--output", default="performance_model.npz", help="Where to save the fitted model")
+    parser.add_argument("--update", action="store_true", help="Add the datasets to an existing model")
+    parser.add_argument("--cpu", type=int, help="CPU (millicores) of the runs without a configuration file")
+    parser.add_argument("--memory", type=int, help="Memory (Mi) of the runs without a configuration file")
+    parser.add_argument("--replica", type=int, help="Replicas of the runs without a configuration file")
+    args = parser.parse_args()
+
+    if args.update and os.path.exists(args.output):
+        model = PerformanceModel.load(args.output)
+    else:
+        model = PerformanceModel()
+    config = None
+    if None not in (args.cpu, args.memory, args.replica):
+        config = {"cpu": args.cpu, "memory": args.memory, "replica": args.replica}
+    model.fit_datasets(args.datasets, config)
+    if model.n_samples == 0:
+        print("No samples to fit")
+        sys.exit(1)
+    model.save(args.output)
+    if not model.usable():
+        print(f"Warning: the configurations did not vary enough (condition {model.condition():.3g}), "
+              f"the drivers will not use this model until more varied runs are added with --update")
+
+if __name__ == "__main__":
+    main()
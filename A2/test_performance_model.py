@@ -0,0 +1,98 @@
+import json
+import os
+
+import numpy as np
+
+from performance_model import CONFIG_FILE, METRIC_FILES, PerformanceModel, load_or_fit
+
+SERVICE = "acmeair-flightservice"
+STATUS = [50, 40, 200, 100, 5]
+CONFIG = {"cpu": 500, "memory": 256, "replica": 1}
+
+
+def write_run(dataset_dir, configs, seed=0, step=10, samples=60):
+    """
+    Record a synthetic run that switches between configs, with metrics that improve with more resources.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(dataset_dir, exist_ok=True)
+    series = {name: [] for name in METRIC_FILES}
+    config_history = []
+    for i, config in enumerate(configs):
+        start = i * samples * step
+        config_history.append({"t": start, "d": [SERVICE, config["cpu"], config["memory"], config["replica"]]})
+        for t in range(start, start + samples * step, step):
+            load = rng.uniform(20, 200)
+            per_replica = load / config["replica"]
+            values = {
+                "cpu": 100 * per_replica / config["cpu"] * 5,
+                "memory": 100 * per_replica / config["memory"] * 2,
+                "latency": 50 + 4 * per_replica / config["cpu"] * 100 + 30 * per_replica / config["memory"],
+                "tps": load,
+                "gc_time": 2 + 3 * per_replica / config["memory"],
+            }
+            for name, value in values.items():
+                series[name].append({"t": t, "d": [SERVICE, value * rng.uniform(0.95, 1.05)]})
+    for name, file_name in METRIC_FILES.items():
+        with open(os.path.join(dataset_dir, file_name), "w") as file:
+            json.dump({"data": series[name]}, file)
+    with open(os.path.join(dataset_dir, CONFIG_FILE), "w") as file:
+        json.dump({"data": config_history}, file)
+
+
+def varied_configs():
+    return [{"cpu": cpu, "memory": memory, "replica": replica}
+            for cpu, memory, replica in [(500, 256, 1), (600, 256, 1), (500, 512, 1), (400, 768, 2), (800, 256, 3)]]
+
+
+def test_what_if_is_bounded_and_monotone(tmp_path):
+    write_run(tmp_path / "run", varied_configs())
+    model = load_or_fit(str(tmp_path / "model.npz"), [str(tmp_path / "run")])
+    assert model is not None
+
+    more_cpu = model.what_if(STATUS, CONFIG, dict(CONFIG, cpu=600))
+    more_memory = model.what_if(STATUS, CONFIG, dict(CONFIG, memory=512))
+    more_pods = model.what_if(STATUS, CONFIG, dict(CONFIG, replica=2))
+    less_cpu = model.what_if(STATUS, CONFIG, dict(CONFIG, cpu=400))
+    for predicted in (more_cpu, more_memory, more_pods, less_cpu):
+        assert all(np.isfinite(predicted))
+        assert 0 <= predicted[0] <= 100 and 0 <= predicted[1] <= 100
+        assert 0 <= predicted[2] <= 10 * STATUS[2] and 0 <= predicted[4] <= 10 * STATUS[4]
+        # The configuration does not change the offered load
+        assert predicted[3] == STATUS[3]
+
+    # More resources never predict more usage, latency or GC time, less CPU never predicts less
+    for predicted in (more_cpu, more_memory, more_pods):
+        assert all(p <= s for p, s in zip(predicted, STATUS))
+    assert all(p >= s for p, s in zip(less_cpu, STATUS))
+    assert more_cpu[2] < STATUS[2] and more_memory[4] < STATUS[4]
+
+    # Monotone along a range of CPU allocations
+    latencies = [model.what_if(STATUS, CONFIG, dict(CONFIG, cpu=cpu))[2] for cpu in range(200, 1600, 100)]
+    assert all(b <= a for a, b in zip(latencies, latencies[1:]))
+
+
+def test_single_configuration_is_not_used(tmp_path):
+    write_run(tmp_path / "run", [CONFIG])
+    model = PerformanceModel().fit_datasets([str(tmp_path / "run")])
+    assert model.n_samples > 0 and not model.usable()
+    assert load_or_fit(str(tmp_path / "model.npz"), [str(tmp_path / "run")]) is None
+
+
+def test_datasets_without_configuration_are_skipped(tmp_path):
+    write_run(tmp_path / "run", varied_configs())
+    os.remove(tmp_path / "run" / CONFIG_FILE)
+    assert PerformanceModel().fit_datasets([str(tmp_path / "run")]).n_samples == 0
+    assert load_or_fit(str(tmp_path / "model.npz"), [str(tmp_path / "run")]) is None
+
+
+def test_planner_keeps_the_best_configuration(tmp_path):
+    from driver import Analyzer, Planner
+
+    write_run(tmp_path / "run", varied_configs())
+    planner = Planner(Analyzer([]), load_or_fit(str(tmp_path / "model.npz"), [str(tmp_path / "run")]))
+    # Lightly loaded: no step is predicted to beat the current configuration by the margin
+    assert planner.predict_adaption_option([5, 5, 60, 20, 2], dict(CONFIG)) is None
+    # Saturated: a step with more resources is taken
+    adapted = planner.predict_adaption_option([100, 90, 900, 200, 20], dict(CONFIG))
+    assert adapted is not None and adapted != CONFIG
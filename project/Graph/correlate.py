@@ -0,0 +1,248 @@
+import argparse
+import glob
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_METRICS = ["cpu_used_percent_avg", "net_http_request_time_max", "net_request_count_in_sum"]
+LOG_ACTION = re.compile(r"Step (\d+): Action taken: (-?\d+)")
+
+
+def asof(times, grid, tolerance=None):
+    """
+    As-of join: index of the last sample at or before each time of the grid.
+
+    :param times: Sorted sample times.
+    :param grid: Sorted times to align on.
+    :param tolerance: Samples older than this many seconds are stale, None to always carry the last one.
+    :return: Index of the matching sample for each grid time, -1 where there is none.
+    """
+    index = np.searchsorted(times, grid, side="right") - 1
+    if tolerance is not None:
+        stale = np.zeros(len(grid), dtype=bool)
+        found = index >= 0
+        stale[found] = grid[found] - times[index[found]] > tolerance
+        index[stale] = -1
+    return index
+
+
+def parse_times(values):
+    """
+    :param values: Timestamp column, seconds since the epoch or "YYYY-MM-DD HH:MM:SS" times (datasets_train).
+    :return: Seconds since the epoch, the dates read as UTC like load_profiles._parse_time.
+    """
+    numbers = pd.to_numeric(values, errors="coerce")
+    if not numbers.isna().any():
+        return numbers.to_numpy(dtype=np.float64)
+    dates = pd.to_datetime(values, utc=True)
+    return ((dates - pd.Timestamp(0, tz="UTC")) / pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64)
+
+
+def take(values, index):
+    """
+    :return: values[index] as floats, NaN where the index is -1.
+    """
+    result = np.full(len(index), np.nan)
+    found = index >= 0
+    result[found] = values[index[found]]
+    return result
+
+
+def read_locust(path, percentiles):
+    """
+    :return: Timestamps and columns (Requests/s, Failures/s, User Count and the percentiles) of the aggregated
+             rows of a Locust stats history.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [c for c in ["Timestamp", "Name", "Requests/s", "Failures/s", "User Count"] + list(percentiles)
+               if c in header]
+    data = pd.read_csv(path, usecols=usecols)
+    if "Name" in data:
+        data = data[data["Name"] == "Aggregated"]
+    data = data.drop(columns="Name", errors="ignore").sort_values("Timestamp")
+    times = data.pop("Timestamp").to_numpy(dtype=np.float64)
+    return times, {column: pd.to_numeric(data[column], errors="coerce").to_numpy(dtype=np.float64)
+                   for column in data.columns}
+
+
+def read_datasets(data_dir, metrics):
+    """
+    :return: {"service.metric": (timestamps, values)} of the per-service CSVs of a Sysdig dataset directory.
+    """
+    streams = {}
+    for service_dir in sorted(glob.glob(os.path.join(data_dir, "*", ""))):
+        service = os.path.basename(os.path.dirname(service_dir))
+        for metric in metrics:
+            path = os.path.join(service_dir, f"{metric}.csv")
+            if not os.path.exists(path):
+                continue
+            data = pd.read_csv(path, usecols=["timestamp", "value"])
+            times = parse_times(data["timestamp"])
+            order = np.argsort(times, kind="stable")
+            streams[f"{service}.{metric}"] = (times[order], data["value"].to_numpy(dtype=np.float64)[order])
+    if not streams:
+        raise ValueError(f"No metric CSV found in the service folders of {data_dir}.")
+    return streams
+
+
+def read_actions(path, start=None, interval=10.0):
+    """
+    Read the controller actions: the action trace CSV of replay.py (timestamp, action, weights), the applied weights
+    log of the controller (timestamp, weights, see Executor.weights_log) or the performance_log.txt of
+    Performance_test.py. The performance log has no timestamps, its steps are placed every interval seconds from start.
+
+    :return: Timestamps and columns (action and/or weight_*).
+    """
+    if path.endswith(".csv"):
+        data = pd.read_csv(path)
+        times = parse_times(data.pop("timestamp"))
+        order = np.argsort(times, kind="stable")
+        return times[order], {column: data[column].to_numpy(dtype=np.float64)[order] for column in data.columns}
+    if start is None:
+        raise ValueError("--action-start is required to place the steps of a performance log on the clock.")
+    with open(path, "r") as file:
+        steps = np.array([match.groups() for match in LOG_ACTION.finditer(file.read())], dtype=np.int64).reshape(-1, 2)
+    return start + steps[:, 0] * interval, {"action": steps[:, 1].astype(np.float64)}
+
+
+def change_times(times, columns):
+    """
+    :return: Times at which the applied action or weights differ from the previous ones (the first one included).
+    """
+    values = np.column_stack([columns[c] for c in sorted(columns) if c.startswith("weight_")] or [columns["action"]])
+    changed = np.ones(len(times), dtype=bool)
+    changed[1:] = np.any(values[1:] != values[:-1], axis=1)
+    return times[changed]
+
+
+def load_changes(times, rps, window, threshold):
+    """
+    Detect the load changes: times where the mean rate of the next window differs from the mean rate of the
+    previous window by more than threshold (relative). Detections closer than a window are one change.
+
+    :return: Times of the load changes.
+    """
+    rps = np.nan_to_num(rps)
+    if len(rps) < 2 * window + 1:
+        return np.array([])
+    cumulative = np.concatenate(([0.0], np.cumsum(rps)))
+    centers = np.arange(window, len(rps) - window + 1)
+    before = (cumulative[centers] - cumulative[centers - window]) / window
+    after = (cumulative[centers + window] - cumulative[centers]) / window
+    score = np.abs(after - before) / np.maximum(before, 1e-9)
+    detected = np.flatnonzero(score > threshold)
+    if len(detected) == 0:
+        return np.array([])
+    # The windows overlap the change for a while around it, keep the strongest detection of each cluster
+    cluster = np.cumsum(np.concatenate(([True], np.diff(detected) > window)))
+    order = np.lexsort((score[detected], cluster))
+    last = np.concatenate((cluster[order][1:] != cluster[order][:-1], [True]))
+    return times[centers[detected[order][last]]]
+
+
+def correlate(locust_path, data_dir=None, actions_path=None, step=1.0, tolerance=30.0, percentiles=("50%", "95%"),
+              metrics=DEFAULT_METRICS, locust_offset=0.0, action_start=None, action_interval=10.0):
+    """
+    Align the client-side Locust stats, the mesh-side metrics and the controller actions on a common clock.
+
+    :return: (frame, changes) where frame has one row per step seconds over the Locust run (the last sample of each
+             stream at or before that time) and changes is the times at which the actions changed.
+    """
+    client_times, client = read_locust(locust_path, percentiles)
+    client_times = client_times + locust_offset
+    grid = np.arange(client_times[0], client_times[-1] + step / 2, step)
+
+    index = asof(client_times, grid, tolerance)
+    frame = {"timestamp": grid.astype(np.int64)}
+    frame.update({f"client.{column}": take(values, index) for column, values in client.items()})
+    if data_dir:
+        for name, (times, values) in read_datasets(data_dir, metrics).items():
+            frame[name] = take(values, asof(times, grid, tolerance))
+    changes = np.array([])
+    if actions_path:
+        times, columns = read_actions(actions_path, action_start, action_interval)
+        # An action stays applied until the next one
+        index = asof(times, grid)
+        frame.update({f"controller.{column}": take(values, index) for column, values in columns.items()})
+        changes = change_times(times, columns)
+    return pd.DataFrame(frame), changes
+
+
+def summarize(frame, changes, slo_ms, slo_percentile="95%", step=1.0, window=30, threshold=0.2, horizon=120):
+    """
+    :param slo_ms: Latency objective of the client percentile, in milliseconds.
+    :param window: Seconds averaged on each side to detect a load change.
+    :param threshold: Relative change of the request rate that counts as a load change.
+    :param horizon: Load changes without an action within this many seconds count as not reacted to.
+    :return: Summary dictionary.
+    """
+    latency = frame[f"client.{slo_percentile}"].to_numpy()
+    failures = frame["client.Failures/s"].to_numpy()
+    violated = (latency > slo_ms) | (np.nan_to_num(failures) > 0)
+    summary = {
+        "duration_s": len(frame) * step,
+        "slo": f"{slo_percentile} <= {slo_ms:g} ms and no failures",
+        "slo_violation_s": float(violated.sum() * step),
+        "slo_violation_ratio": float(violated.mean()) if len(frame) else 0.0,
+        "actions": len(changes),
+    }
+
+    times = frame["timestamp"].to_numpy(dtype=np.float64)
+    rps = frame["client.Requests/s"].to_numpy()
+    load = load_changes(times, rps, max(int(window / step), 1), threshold)
+    summary["load_changes"] = len(load)
+    if len(load) and len(changes):
+        # First action at or after each load change
+        following = np.searchsorted(changes, load, side="left")
+        reacted = following < len(changes)
+        delays = changes[following[reacted]] - load[reacted]
+        delays = delays[delays <= horizon]
+        summary["reacted"] = len(delays)
+        if len(delays):
+            summary.update({"reaction_mean_s": float(delays.mean()), "reaction_p50_s": float(np.median(delays)),
+                            "reaction_max_s": float(delays.max())})
+    else:
+        summary["reacted"] = 0
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Join the Locust stats, the mesh metrics and the controller actions")
+    parser.add_argument("locust", help="The *_stats_history.csv file of the Locust run")
+    parser.add_argument("--datasets", help="Sysdig dataset directory with one folder per service")
+    parser.add_argument("--actions",
+                        help="Action trace CSV of replay.py, applied weights log of main.py, or performance_log.txt")
+    parser.add_argument("--action-start", type=float, help="Epoch of step 0 of a performance log")
+    parser.add_argument("--action-interval", type=float, default=10.0, help="Seconds between the steps of a log")
+    parser.add_argument("--locust-offset", type=float, default=0.0,
+                        help="Seconds added to the Locust timestamps, to line them up with a replayed dataset")
+    parser.add_argument("--metrics", nargs="+", default=DEFAULT_METRICS, help="Metric CSVs of each service")
+    parser.add_argument("--percentiles", nargs="+", default=["50%", "95%"], help="Client percentile columns")
+    parser.add_argument("--step", type=float, default=1.0, help="Seconds between the rows of the joined table")
+    parser.add_argument("--tolerance", type=float, default=30.0, help="Seconds after which a sample is stale")
+    parser.add_argument("--slo-ms", type=float, default=200.0, help="Latency objective in milliseconds")
+    parser.add_argument("--slo-percentile", default="95%", help="Client percentile the objective applies to")
+    parser.add_argument("--change-window", type=float, default=30.0, help="Seconds averaged to detect load changes")
+    parser.add_argument("--change-threshold", type=float, default=0.2, help="Relative rate change of a load change")
+    parser.add_argument("--horizon", type=float, default=120.0, help="Longest reaction counted, in seconds")
+    parser.add_argument("--out", help="Write the joined table to this CSV file")
+    args = parser.parse_args()
+
+    percentiles = list(dict.fromkeys(args.percentiles + [args.slo_percentile]))
+    frame, changes = correlate(args.locust, args.datasets, args.actions, args.step, args.tolerance, percentiles,
+                               args.metrics, args.locust_offset, args.action_start, args.action_interval)
+    summary = summarize(frame, changes, args.slo_ms, args.slo_percentile, args.step, args.change_window,
+                        args.change_threshold, args.horizon)
+    if args.out:
+        frame.to_csv(args.out, index=False)
+        print(f"Joined {len(frame)} rows x {len(frame.columns)} columns into {args.out}")
+    for key, value in summary.items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
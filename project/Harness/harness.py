@@ -0,0 +1,499 @@
+import argparse
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import random
+import signal
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+HARNESS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Route of virtual-service-food.yaml, written when the virtual service file does not exist yet
+DEFAULT_VIRTUAL_SERVICE = {
+    "apiVersion": "networking.istio.io/v1alpha3",
+    "kind": "VirtualService",
+    "metadata": {"name": "virtual-service-food", "namespace": "group-4"},
+    "spec": {
+        "hosts": ["recommendations", "payments"],
+        "http": [{"route": [
+            {"destination": {"host": "recommendations", "subset": "recommendation-food", "port": {"number": 8080}},
+             "weight": 20},
+            {"destination": {"host": "payments", "port": {"number": 8080}}, "weight": 80},
+        ]}],
+    },
+}
+
+# Sysdig metric keys ("<metric id>|<aggregation>") computed from the counters of the stand-ins
+METRICS = (
+    "cpu.quota.used.percent|avg",
+    "cpu.used.percent|avg",
+    "cpu.cores.used|avg",
+    "memory.limit.used.percent|avg",
+    "net.http.request.time|max",
+    "net.connection.count.in|sum",
+    "net.request.count.in|sum",
+)
+
+RECOMMENDATIONS = {
+    "food": ["Cheese", "Fruit", "Nuts", "Pastry"],
+    "clothes": ["Shoes", "Shirts", "Socks", "Cool Hats"],
+    "music": ["Rolling Stones", "Beatles", "Foo Fighters", "Temptations"],
+}
+
+
+def load_config(path):
+    """
+    :return: The harness configuration, with the virtual service path resolved from the harness directory.
+    """
+    with open(path, "r") as file:
+        config = json.load(file)
+    config["virtual_service"] = os.path.join(HARNESS_DIR, config["virtual_service"])
+    return config
+
+
+def latency_sampler(spec):
+    """
+    :param spec: {"distribution": "constant" | "uniform" | "exponential" | "lognormal", ...} in milliseconds.
+    :return: Function returning a latency in seconds.
+    """
+    distribution = spec.get("distribution", "constant")
+    if distribution == "constant":
+        return lambda: spec.get("ms", 0) / 1000
+    if distribution == "uniform":
+        return lambda: random.uniform(spec["low_ms"], spec["high_ms"]) / 1000
+    if distribution == "exponential":
+        return lambda: random.expovariate(1000 / spec["mean_ms"])
+    if distribution == "lognormal":
+        return lambda: random.lognormvariate(math.log(spec["median_ms"] / 1000), spec["sigma"])
+    raise ValueError(f"Unknown latency distribution {distribution}, expected constant, uniform, exponential or lognormal.")
+
+
+def burn_cpu(seconds):
+    # Busy loop on the CPU time of this thread, so the cost also grows when the process is saturated
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+class Counters:
+    """
+    Cumulative counters of a stand-in, read by the sampler of the router.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.max_ns = 0
+
+    def request(self, duration_ns):
+        with self.lock:
+            self.requests += 1
+            self.max_ns = max(self.max_ns, duration_ns)
+
+    def connection(self):
+        with self.lock:
+            self.connections += 1
+
+    def read(self):
+        # The maximum request time is reset on read, it covers one sampling interval
+        with self.lock:
+            stats = {"requests": self.requests, "connections": self.connections, "max_ns": self.max_ns,
+                     "cpu_seconds": time.process_time(), "rss_bytes": rss_bytes()}
+            self.max_ns = 0
+        return stats
+
+
+class KeepAliveServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, handler, counters=None):
+        super().__init__(address, handler)
+        self.counters = counters
+
+    def process_request(self, request, client_address):
+        if self.counters is not None:
+            self.counters.connection()
+        super().process_request(request, client_address)
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the Node services behind the sidecars
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def send_json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Upstreams(threading.local):
+    """
+    Keep-alive connections of a thread, one per (host, port).
+    """
+
+    def request(self, port, method, path, body=b"", headers=None):
+        connections = self.__dict__.setdefault("connections", {})
+        for attempt in range(2):
+            connection = connections.get(port)
+            if connection is None:
+                connection = connections[port] = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            try:
+                connection.request(method, path, body=body or None, headers=headers or {})
+                response = connection.getresponse()
+                return response.status, response.read(), response.getheader("Content-Type")
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                del connections[port]
+                if attempt:
+                    raise
+
+
+class StandInHandler(JsonHandler):
+    """
+    Endpoints of the Node services in src/: orders, payments and recommendations, with a sampled latency
+    and CPU cost per request. The orders stand-in calls payments and recommendations through the router,
+    with the Host header the services use in the mesh.
+    """
+    service = None
+    config = None
+    latency = None
+    counters = None
+    store = None
+    router_port = None
+    upstreams = Upstreams()
+
+    def handle_request(self, method):
+        start = time.perf_counter_ns()
+        body = self.read_body()
+        if self.path.startswith("/__harness/stats"):
+            self.send_json(200, self.counters.read())
+            return
+        time.sleep(self.latency())
+        burn_cpu(self.config.get("cpu_ms", 0) / 1000)
+        status, payload = getattr(self, f"{self.config['kind']}_{method}")(body)
+        self.send_json(status, payload)
+        self.counters.request(time.perf_counter_ns() - start)
+
+    def do_GET(self):
+        self.handle_request("get")
+
+    def do_POST(self):
+        self.handle_request("post")
+
+    @staticmethod
+    def validate(body):
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            data = {}
+        errors = [f"Missing {name} data" for key, name in
+                  (("creditCard", "credit card"), ("product", "product"), ("customer", "customer"))
+                  if not data.get(key)]
+        return data, errors
+
+    def find(self):
+        # GET /{id} returns the stored entity, GET / all of them
+        entity_id = self.path.strip("/").split("?")[0]
+        if not entity_id:
+            return 200, list(self.store)
+        return 200, next((entity for entity in self.store if entity.get("id") == entity_id), None)
+
+    def orders_get(self, body):
+        return self.find()
+
+    def orders_post(self, body):
+        data, errors = self.validate(body)
+        if errors:
+            return 422, {"status": 422, "message": f"There are problems with the order's data: {json.dumps(errors)}"}
+        try:
+            status, payment, _ = self.upstreams.request(self.router_port, "POST", "/", body,
+                                                        {"Host": "payments", "Content-Type": "application/json"})
+            payment = json.loads(payment)["payment"] if status == 200 else None
+            status, recommendation, _ = self.upstreams.request(self.router_port, "GET", "/",
+                                                               headers={"Host": "recommendations"})
+            recommendation = json.loads(recommendation) if status == 200 else None
+        except (OSError, ValueError, KeyError, http.client.HTTPException) as e:
+            return 500, {"status": 500, "message": str(e)}
+        if payment is None or recommendation is None:
+            return 500, {"status": 500, "message": "An upstream service failed"}
+        result = {"payment": payment, "recommendation": recommendation, "id": str(uuid.uuid4())}
+        self.store.append(result)
+        return 200, {"status": 200, "order": result}
+
+    def payments_get(self, body):
+        return self.find()
+
+    def payments_post(self, body):
+        data, errors = self.validate(body)
+        if errors:
+            return 422, {"status": 422, "message": f"There are problems with the order's data: {json.dumps(errors)}",
+                         "data": json.dumps(data)}
+        data["id"] = str(uuid.uuid4())
+        self.store.append(data)
+        return 200, {"status": 200, "payment": data}
+
+    def recommendations_get(self, body):
+        category = self.config.get("category", "general").lower()
+        if category not in RECOMMENDATIONS:
+            return 200, {"category": "general", "recommendation": "Buy more of something, anything!"}
+        return 200, {"category": category, "recommendation": f"Buy some more {random.choice(RECOMMENDATIONS[category])}"}
+
+    def recommendations_post(self, body):
+        return 404, None  # Express has no POST route on recommendations
+
+
+def run_service(name, config, router_port):
+    """
+    Serve one stand-in until the process is terminated (one process per service, like one pod).
+    """
+    handler = type(f"{name}Handler", (StandInHandler,), {
+        "service": name, "config": config, "latency": staticmethod(latency_sampler(config.get("latency", {}))),
+        "counters": Counters(), "store": deque(maxlen=10000), "router_port": router_port})
+    server = KeepAliveServer(("127.0.0.1", config["port"]), handler, handler.counters)
+    server.serve_forever()
+
+
+class Router:
+    """
+    Weighted router honouring the VirtualService JSON written by the Executor: a request whose Host is one of
+    the hosts of the virtual service goes to one of its route destinations, drawn with the route weights.
+    Other requests go to the services with that host, or to the ingress service. The file is reloaded when it
+    changes, so the weights applied by the controller take effect within a second.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.path = config["virtual_service"]
+        self.services = config["services"]
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.checked_at = 0.0
+        self.hosts = set()
+        self.destinations = []
+        self.weights = []
+        if not os.path.exists(self.path):
+            with open(self.path, "w") as file:
+                json.dump(DEFAULT_VIRTUAL_SERVICE, file, indent=4)
+            print(f"Wrote the default virtual service to {self.path}")
+        self.reload()
+
+    def resolve(self, host, subset=None):
+        """
+        :return: Services matching a destination, e.g. ("recommendations", "recommendation-food").
+        """
+        return [name for name, service in self.services.items()
+                if service["host"] == host and (subset is None or service.get("subset") == subset)]
+
+    def reload(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return
+        try:
+            with open(self.path, "r") as file:
+                virtual_service = json.load(file)
+        except ValueError:
+            return  # Being written, the next check reloads it
+        routes = virtual_service["spec"]["http"][0]["route"]
+        destinations = [self.resolve(route["destination"]["host"], route["destination"].get("subset"))
+                        for route in routes]
+        weights = [route.get("weight", 100 // len(routes)) for route in routes]
+        with self.lock:
+            self.hosts = set(virtual_service["spec"]["hosts"])
+            self.destinations, self.weights, self.mtime = destinations, weights, mtime
+        print(f"Routing {sorted(self.hosts)} to {destinations} with weights {weights}")
+
+    def route(self, host):
+        """
+        :param host: Host header of the request, without the port.
+        :return: Name of the service that serves the request.
+        """
+        now = time.monotonic()
+        if now - self.checked_at > 1.0:
+            self.checked_at = now
+            self.reload()
+        with self.lock:
+            if host in self.hosts:
+                candidates = random.choices(self.destinations, weights=self.weights)[0]
+                return random.choice(candidates)
+        candidates = self.resolve(host)
+        return random.choice(candidates) if candidates else self.config["ingress"]
+
+
+class RouterHandler(JsonHandler):
+    router = None
+    upstreams = Upstreams()
+
+    def forward(self, method):
+        body = self.read_body()
+        service = self.router.route((self.headers.get("Host") or "").split(":")[0])
+        headers = {"Content-Type": self.headers.get("Content-Type", "application/json")}
+        try:
+            status, payload, content_type = self.upstreams.request(self.router.services[service]["port"], method,
+                                                                   self.path, body, headers)
+        except (OSError, http.client.HTTPException):
+            status, payload, content_type = 503, b"", None  # Like the sidecar when the upstream is down
+        self.send_response(status)
+        self.send_header("Content-Type", content_type or "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("X-Harness-Service", service)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self.forward("GET")
+
+    def do_POST(self):
+        self.forward("POST")
+
+
+class MetricStore:
+    """
+    Samples of every service on the sampling grid, computed from the counters of the stand-ins and served in
+    the Sysdig data format ({"start", "end", "data": [{"t", "d": [service, value]}]}).
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.sampling = config["sampling"]
+        self.lock = threading.Lock()
+        self.samples = {metric: deque(maxlen=config["retention"] // self.sampling * len(config["services"]))
+                        for metric in METRICS}
+        self.previous = {}
+
+    def sample(self, timestamp, upstreams):
+        for name, service in self.config["services"].items():
+            try:
+                status, payload, _ = upstreams.request(service["port"], "GET", "/__harness/stats")
+                stats = json.loads(payload)
+            except (OSError, ValueError, http.client.HTTPException):
+                continue
+            previous = self.previous.get(name)
+            self.previous[name] = stats
+            if previous is None:
+                continue
+            cores = (stats["cpu_seconds"] - previous["cpu_seconds"]) / self.sampling
+            values = {
+                "cpu.quota.used.percent|avg": 100 * cores / service.get("cpu_limit", 1.0),
+                "cpu.used.percent|avg": 100 * cores,
+                "cpu.cores.used|avg": cores,
+                "memory.limit.used.percent|avg": 100 * stats["rss_bytes"] / (service.get("memory_limit_mb", 512) << 20),
+                "net.http.request.time|max": stats["max_ns"],
+                "net.connection.count.in|sum": stats["connections"] - previous["connections"],
+                "net.request.count.in|sum": stats["requests"] - previous["requests"],
+            }
+            with self.lock:
+                for metric, value in values.items():
+                    self.samples[metric].append({"t": timestamp, "d": [name, value]})
+
+    def run(self):
+        upstreams = Upstreams()
+        while True:
+            # Samples on the sampling boundaries, like the monitoring backend
+            next_boundary = (int(time.time()) // self.sampling + 1) * self.sampling
+            time.sleep(max(next_boundary - time.time(), 0))
+            self.sample(next_boundary, upstreams)
+
+    def query(self, metric, start, end):
+        with self.lock:
+            data = [entry for entry in self.samples.get(metric, ()) if start <= entry["t"] <= end]
+        return {"start": start, "end": end, "data": data}
+
+
+class AdminHandler(JsonHandler):
+    store = None
+    router = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/api/data":
+            metric = f"{params.get('metric')}|{params.get('aggregation')}"
+            if metric not in METRICS:
+                self.send_json(404, {"error": f"No harness metric {metric}"})
+                return
+            now = int(time.time())
+            start, end = int(params.get("start", now - 600)), int(params.get("end", now))
+            self.send_json(200, self.store.query(metric, start, end))
+        elif url.path == "/api/routes":
+            self.router.reload()
+            self.send_json(200, {"hosts": sorted(self.router.hosts), "destinations": self.router.destinations,
+                                 "weights": self.router.weights})
+        else:
+            self.send_json(404, {"error": "Unknown endpoint, use /api/data or /api/routes"})
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local stand-ins of the mesh services behind a weighted router")
+    parser.add_argument("--config", default=os.path.join(HARNESS_DIR, "harness.json"), help="Harness configuration")
+    parser.add_argument("--virtual-service", help="VirtualService JSON written by the Executor (overrides the config)")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.virtual_service:
+        config["virtual_service"] = os.path.abspath(args.virtual_service)
+
+    processes = [multiprocessing.Process(target=run_service, args=(name, service, config["router_port"]),
+                                         name=name, daemon=True)
+                 for name, service in config["services"].items()]
+    for process in processes:
+        process.start()
+
+    router = Router(config)
+    store = MetricStore(config)
+    router_server = KeepAliveServer(("127.0.0.1", config["router_port"]), type("Handler", (RouterHandler,),
+                                                                             {"router": router}))
+    admin_server = KeepAliveServer(("127.0.0.1", config["admin_port"]), type("Handler", (AdminHandler,),
+                                                                           {"store": store, "router": router}))
+    serve(admin_server)
+    threading.Thread(target=store.run, daemon=True).start()
+    for name, service in config["services"].items():
+        print(f"{name} stand-in on port {service['port']}")
+    print(f"Router on http://127.0.0.1:{config['router_port']}, metrics on http://127.0.0.1:{config['admin_port']}")
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        router_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
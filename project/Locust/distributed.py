@@ -0,0 +1,172 @@
+import os
+import subprocess
+import sys
+import time
+
+from locust import events
+from locust.runners import STATE_MISSING, MasterRunner, WorkerRunner
+from pacing import PACER
+
+PARTITION_MESSAGE = "pacing_partition"
+REPORT_MESSAGE = "pacing_report"
+
+
+class RatePartition:
+    """
+    Split the target rate of a profile load shape between the Locust workers.
+
+    Only the master ticks the shape, so it sends every worker its index, the number of workers, the profile
+    with its resolved seed and its run time. Each worker then paces share = 1 / workers of the same schedule on
+    the same clock, with Poisson arrivals seeded by seed + index, which makes the split deterministic. The
+    message is sent again when workers join or leave, and every resync seconds to keep the clocks aligned.
+    """
+
+    def __init__(self, pacer, resync=30):
+        self.pacer = pacer
+        self.resync = resync
+        self.runner = None
+        self.workers = []
+        self.index = None
+        self.sent_at = None
+        self.reports = {}
+
+    def install(self, environment):
+        self.runner = environment.runner
+        if isinstance(self.runner, MasterRunner):
+            self.runner.register_message(REPORT_MESSAGE, self.receive_report)
+        elif isinstance(self.runner, WorkerRunner):
+            self.runner.register_message(PARTITION_MESSAGE, self.receive)
+
+    def publish(self, shape):
+        """
+        Send the partition to the workers if it changed (master, on each tick of the shape).
+        """
+        if not isinstance(self.runner, MasterRunner):
+            return
+        workers = sorted(client_id for client_id, node in self.runner.clients.items() if node.state != STATE_MISSING)
+        now = time.monotonic()
+        if workers == self.workers and self.sent_at is not None and now - self.sent_at < self.resync:
+            return
+        profile = shape.profile
+        for index, client_id in enumerate(workers):
+            self.runner.send_message(PARTITION_MESSAGE, {
+                "index": index,
+                "workers": len(workers),
+                "run_time": shape.get_run_time(),
+                "source": profile.source,
+                "seed": profile.seed,
+                "speedup": profile.speedup,
+                "scale": profile.scale,
+            }, client_id=client_id)
+        if workers != self.workers:
+            print(f"Rate split between {len(workers)} workers")
+        self.workers = workers
+        self.sent_at = now
+
+    def receive(self, environment, msg, **kwargs):
+        """
+        Follow the share of the rate assigned by the master (worker).
+        """
+        from load_profiles import LoadProfile
+
+        data = msg.data
+        shape = environment.shape_class
+        profile = shape.profile
+        if profile is None or (profile.source, profile.seed, profile.speedup, profile.scale) != \
+                (data["source"], data["seed"], data["speedup"], data["scale"]):
+            profile = LoadProfile.from_dict(dict(data["source"], seed=data["seed"]), data["source"]["name"])
+            profile.speedup, profile.scale = data["speedup"], data["scale"]
+            type(shape).use(profile)
+            self.index = None
+        if data["index"] != self.index:
+            self.pacer.random.seed(data["seed"] + data["index"])
+            self.index = data["index"]
+        # Same run time as the master, up to the delivery of the message
+        shape.reset_time()
+        shape.start_time -= data["run_time"]
+        self.pacer.share = 1.0 / data["workers"]
+        self.pacer.attach(shape)
+
+    def report(self):
+        """
+        Send the pacing counts of this worker to the master.
+        """
+        if isinstance(self.runner, WorkerRunner) and self.pacer.shape is not None:
+            self.runner.send_message(REPORT_MESSAGE, dict(self.pacer.counts(), client_id=self.runner.client_id))
+
+    def receive_report(self, environment, msg, **kwargs):
+        self.reports[msg.data["client_id"]] = msg.data
+        reports = self.reports.values()
+        total = {"arrivals": sum(report["arrivals"] for report in reports),
+                 "late": sum(report["late"] for report in reports),
+                 "dropped": sum(report["dropped"] for report in reports),
+                 "worst_lag": max(report["worst_lag"] for report in reports)}
+        print(f"Open-loop pacing ({len(self.reports)} workers): {self.pacer.summary(total)}")
+
+
+# Partition of this Locust process
+PARTITION = RatePartition(PACER)
+
+
+@events.init.add_listener
+def install_partition(environment, **kwargs):
+    PARTITION.install(environment)
+
+
+@events.test_stop.add_listener
+def report_partition(environment, **kwargs):
+    PARTITION.report()
+
+
+def worker_count(workers):
+    """
+    :param workers: Number of worker processes, or "auto" for one per core besides the one of the master.
+    """
+    if workers == "auto":
+        return max((os.cpu_count() or 1) - 1, 1)
+    return int(workers)
+
+
+def run_locust(locustfile, csv_prefix, workers=0, locust_args=()):
+    """
+    Run a locustfile headless and export the CSV results, in this process or with a local master and workers.
+
+    :param locustfile: Path of the locustfile.
+    :param csv_prefix: Prefix of the CSV files (written by the master, with the stats of all the workers).
+    :param workers: Number of local worker processes, 0 to generate the load in a single process.
+    :param locust_args: Other Locust command line arguments (e.g. --host), given to the master and the workers.
+    :return: Exit code of Locust (of the master).
+    """
+    command = [sys.executable, "-m", "locust", "-f", os.path.abspath(locustfile)]
+    headless = ["--headless", "--csv", csv_prefix] + list(locust_args)
+    if not workers:
+        return subprocess.call(command + headless)
+
+    master = subprocess.Popen(command + headless + ["--master", "--expect-workers", str(workers)])
+    # The workers only need the locustfile and the arguments that select the load
+    processes = [subprocess.Popen(command + ["--worker"] + list(locust_args)) for _ in range(workers)]
+    try:
+        code = master.wait()
+    finally:
+        for process in processes:
+            try:
+                process.wait(timeout=10)  # The workers quit with the master
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if master.poll() is None:
+            master.kill()
+    return code
+
+
+def main_headless(locustfile, csv_prefix):
+    """
+    Entry point of the scripts that run their load headless: --workers selects the number of worker processes,
+    the other arguments are passed to Locust.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the load headless and export the CSV results")
+    parser.add_argument("--workers", default="auto",
+                        help="Number of local worker processes, 0 for a single process (default: one per core)")
+    args, locust_args = parser.parse_known_args()
+    sys.exit(run_locust(locustfile, csv_prefix, worker_count(args.workers), locust_args))
@@ -0,0 +1,135 @@
+import time
+
+import gevent
+from locust import events
+from locust.runners import MasterRunner, WorkerRunner
+from latency_histogram import IntervalHistograms, IntervalLogWriter
+
+HISTOGRAM_MESSAGE = "latency_histograms"
+# Seconds an interval stays open at the master for the reports of the workers (sent every 3 s by Locust)
+MERGE_LAG = 10
+
+
+class LatencyCapture:
+    """
+    Record the latency of every request into interval histograms and write them to an interval log.
+
+    The workers record their own requests and send the completed intervals with their periodic stats report
+    (and the rest when they stop), the master merges the histograms of all the workers and writes them once
+    no report can still be late. Without workers the process records and writes its own requests.
+    """
+
+    def __init__(self):
+        self.recorded = IntervalHistograms()
+        self.writer = None
+        self.runner = None
+        self.greenlet = None
+
+    def install(self, environment):
+        self.runner = environment.runner
+        options = environment.parsed_options
+        if options is None:
+            return
+        self.recorded.interval = options.latency_interval
+        if isinstance(self.runner, WorkerRunner):
+            return
+        path = options.latency_log or (f"{options.csv_prefix}_latency.hlog" if options.csv_prefix else "")
+        if path:
+            self.writer = IntervalLogWriter(path, options.latency_interval)
+            print(f"Latency histograms written to {path}")
+        if isinstance(self.runner, MasterRunner):
+            self.runner.register_message(HISTOGRAM_MESSAGE, self.receive)
+
+    def record(self, response_time, start_time=None):
+        """
+        :param response_time: Latency of the request in milliseconds, as given by Locust.
+        :param start_time: Time the request was sent, in seconds since the epoch.
+        """
+        self.recorded.record(start_time or time.time(), int(response_time * 1000))
+
+    def merge(self, taken):
+        if self.writer is not None:
+            self.writer.merge(taken)
+
+    def receive(self, environment, msg, **kwargs):
+        self.merge(msg.data)
+
+    def flush(self):
+        """
+        Write the intervals that can no longer change (master or single process, every interval).
+        """
+        while True:
+            gevent.sleep(self.recorded.interval)
+            now = time.time()
+            if isinstance(self.runner, MasterRunner):
+                self.writer.flush(now - MERGE_LAG)
+            else:
+                self.writer.merge(self.recorded.take(now - 1))
+                self.writer.flush(now - 1)
+
+    def start(self):
+        if self.writer is not None and self.greenlet is None:
+            self.greenlet = gevent.spawn(self.flush)
+
+    def stop(self):
+        if isinstance(self.runner, WorkerRunner):
+            # Send the intervals not reported yet, the current one included
+            self.runner.send_message(HISTOGRAM_MESSAGE, self.recorded.take())
+            return
+        if self.greenlet is not None:
+            self.greenlet.kill()
+            self.greenlet = None
+        if self.writer is not None:
+            if not isinstance(self.runner, MasterRunner):
+                self.writer.merge(self.recorded.take())
+            self.writer.flush()
+
+
+# Latency capture of this Locust process
+CAPTURE = LatencyCapture()
+
+
+@events.init_command_line_parser.add_listener
+def add_latency_arguments(parser):
+    parser.add_argument("--latency-log", type=str, env_var="LOCUST_LATENCY_LOG", default="",
+                        help="Interval log of the request latencies (default: <csv prefix>_latency.hlog with --csv)")
+    parser.add_argument("--latency-interval", type=float, env_var="LOCUST_LATENCY_INTERVAL", default=1.0,
+                        help="Seconds covered by each histogram of the latency log")
+
+
+@events.init.add_listener
+def install_capture(environment, **kwargs):
+    CAPTURE.install(environment)
+
+
+@events.request.add_listener
+def record_latency(response_time, start_time=None, **kwargs):
+    CAPTURE.record(response_time, start_time)
+
+
+@events.report_to_master.add_listener
+def send_latency(client_id, data):
+    # The intervals that ended before this report, the next reports carry the later ones
+    data[HISTOGRAM_MESSAGE] = CAPTURE.recorded.take(time.time() - 1)
+
+
+@events.worker_report.add_listener
+def merge_latency(client_id, data):
+    CAPTURE.merge(data.pop(HISTOGRAM_MESSAGE, []))
+
+
+@events.test_start.add_listener
+def start_capture(environment, **kwargs):
+    CAPTURE.start()
+
+
+@events.test_stop.add_listener
+def stop_capture(environment, **kwargs):
+    CAPTURE.stop()
+
+
+@events.quitting.add_listener
+def close_capture(environment, **kwargs):
+    if CAPTURE.writer is not None:
+        CAPTURE.writer.close()
+        CAPTURE.writer = None
@@ -0,0 +1,224 @@
+import argparse
+import base64
+import sys
+import zlib
+from collections import deque
+
+import numpy as np
+
+# Log-linear buckets as in HdrHistogram: values below SUB_BUCKETS microseconds are exact, above that every
+# power of two is split in HALF buckets, so a bucket is never wider than 1 / HALF (0.8 %) of its values.
+SUB_BUCKET_BITS = 8
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF = SUB_BUCKETS >> 1
+PERCENTILES = (50, 95, 99, 99.9)
+LOG_HEADER = f"#[latency interval log, microseconds, sub_bucket_bits={SUB_BUCKET_BITS}]\n#start,interval,count,max_us,buckets\n"
+
+
+def bucket_index(value):
+    """
+    :param value: Latency in microseconds (non-negative int).
+    :return: Index of its bucket.
+    """
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKETS + (shift - 1) * HALF + (value >> shift) - HALF
+
+
+def bucket_upper(indices):
+    """
+    :param indices: Array of bucket indices.
+    :return: Highest value of each bucket, in microseconds.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    k = np.maximum(indices - SUB_BUCKETS, 0)
+    shift = k // HALF + 1
+    upper = (((k % HALF + HALF + 1) << shift) - 1)
+    return np.where(indices < SUB_BUCKETS, indices, upper)
+
+
+def encode(indices, counts):
+    """
+    :return: The sparse buckets as base64 of the zlib-compressed (index delta, count) int32 pairs.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    order = np.argsort(indices)
+    pairs = np.empty(2 * len(indices), dtype="<i4")
+    pairs[0::2] = np.diff(indices[order], prepend=0)
+    pairs[1::2] = np.asarray(counts)[order]
+    return base64.b64encode(zlib.compress(pairs.tobytes())).decode()
+
+
+def decode(text):
+    """
+    :return: (indices, counts) of encoded buckets.
+    """
+    pairs = np.frombuffer(zlib.decompress(base64.b64decode(text)), dtype="<i4").astype(np.int64)
+    return np.cumsum(pairs[0::2]), pairs[1::2]
+
+
+def merge(parts):
+    """
+    :param parts: (indices, counts) of several histograms.
+    :return: (indices, counts) of their sum, sorted by index.
+    """
+    indices = np.concatenate([part[0] for part in parts])
+    counts = np.concatenate([part[1] for part in parts])
+    indices, inverse = np.unique(indices, return_inverse=True)
+    return indices, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+def percentiles(indices, counts, ranks=PERCENTILES):
+    """
+    :return: Value at each percentile in microseconds (highest value of the bucket holding the rank), the same
+             definition as HdrHistogram, accurate to the bucket width.
+    """
+    cumulative = np.cumsum(counts)
+    targets = np.ceil(np.asarray(ranks) / 100 * cumulative[-1])
+    return bucket_upper(indices[np.searchsorted(cumulative, np.maximum(targets, 1))])
+
+
+class IntervalHistograms:
+    """
+    Sparse latency histograms of consecutive intervals, keyed by the start of the interval in which the
+    requests were sent. Recording is a few integer operations and a dict update, cheap enough to run on
+    every request of a Locust worker.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.intervals = {}
+        self.max = {}
+
+    def record(self, timestamp, value):
+        """
+        :param timestamp: Time the request was sent, in seconds since the epoch.
+        :param value: Latency in microseconds.
+        """
+        start = int(timestamp // self.interval * self.interval)
+        buckets = self.intervals.get(start)
+        if buckets is None:
+            buckets = self.intervals[start] = {}
+            self.max[start] = 0
+        index = bucket_index(value)
+        buckets[index] = buckets.get(index, 0) + 1
+        if value > self.max[start]:
+            self.max[start] = value
+
+    def take(self, before=None):
+        """
+        Remove the intervals that ended before a time (all of them when before is None).
+        :return: List of [start, max, indices, counts], ready to be sent to the master.
+        """
+        taken = []
+        for start in sorted(self.intervals):
+            if before is not None and start + self.interval > before:
+                continue
+            buckets = self.intervals.pop(start)
+            taken.append([start, self.max.pop(start), list(buckets), list(buckets.values())])
+        return taken
+
+
+class IntervalLogWriter:
+    """
+    Merge the interval histograms of all the workers and append them to an interval log, one line per interval:
+    start,interval,count,max_us,buckets (see encode). An interval reported late is written again with the
+    same start, the readers merge the lines of an interval.
+    """
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.pending = {}
+        self.file = open(path, "w")
+        self.file.write(LOG_HEADER)
+
+    def merge(self, taken):
+        for start, maximum, indices, counts in taken:
+            parts, previous_max = self.pending.get(start, ([], 0))
+            parts.append((np.asarray(indices, dtype=np.int64), np.asarray(counts, dtype=np.int64)))
+            self.pending[start] = (parts, max(previous_max, maximum))
+
+    def flush(self, before=None):
+        """
+        Write the intervals that ended before a time (all of them when before is None).
+        """
+        for start in sorted(self.pending):
+            if before is not None and start + self.interval > before:
+                continue
+            parts, maximum = self.pending.pop(start)
+            indices, counts = merge(parts)
+            self.file.write(f"{start},{self.interval:g},{counts.sum()},{maximum},{encode(indices, counts)}\n")
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_log(path):
+    """
+    :return: Sorted list of (start, interval, max_us, indices, counts), the lines of an interval merged.
+    """
+    intervals = {}
+    with open(path, "r") as file:
+        for line in file:
+            if line.startswith("#") or not line.strip():
+                continue
+            start, interval, _, maximum, buckets = line.rstrip("\n").split(",")
+            entry = intervals.setdefault(int(start), [float(interval), 0, []])
+            entry[1] = max(entry[1], int(maximum))
+            entry[2].append(decode(buckets))
+    return [(start, interval, maximum, *merge(parts)) for start, (interval, maximum, parts) in sorted(intervals.items())]
+
+
+def report(path, window=1):
+    """
+    :param path: Interval log.
+    :param window: Number of intervals merged for each row (a sliding window).
+    :return: (rows, overall) where each row is [start, count, p50, p95, p99, p99.9, max] in milliseconds
+             and overall is the same over the whole log.
+    """
+    rows = []
+    recent = deque(maxlen=window)
+    everything = []
+    for start, interval, maximum, indices, counts in read_log(path):
+        recent.append((indices, counts, maximum))
+        everything.append((indices, counts))
+        window_indices, window_counts = merge([(i, c) for i, c, _ in recent])
+        window_max = max(m for _, _, m in recent)
+        # The highest value of a bucket can exceed the largest latency recorded in it
+        values = np.minimum(percentiles(window_indices, window_counts), window_max) / 1000
+        rows.append([start, int(window_counts.sum()), *values, window_max / 1000])
+    overall = None
+    if everything:
+        indices, counts = merge(everything)
+        overall_max = max(row[-1] for row in rows)
+        overall = [int(counts.sum()), *np.minimum(percentiles(indices, counts) / 1000, overall_max), overall_max]
+    return rows, overall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency percentiles of a Locust interval log")
+    parser.add_argument("log", help="Interval log written during the run (--latency-log)")
+    parser.add_argument("--window", type=int, default=1, help="Intervals merged for each row (sliding window)")
+    parser.add_argument("--out", help="Write the time series to this CSV file")
+    args = parser.parse_args()
+
+    rows, overall = report(args.log, args.window)
+    if overall is None:
+        print(f"No interval in {args.log}")
+        return 1
+    header = "timestamp,count,p50_ms,p95_ms,p99_ms,p99.9_ms,max_ms"
+    if args.out:
+        np.savetxt(args.out, np.array(rows, dtype=np.float64), delimiter=",", header=header, comments="",
+                   fmt=["%d", "%d", "%.3f", "%.3f", "%.3f", "%.3f", "%.3f"])
+        print(f"{len(rows)} intervals written to {args.out}")
+    print(f"{overall[0]} requests: p50 {overall[1]:.2f} ms, p95 {overall[2]:.2f} ms, p99 {overall[3]:.2f} ms, "
+          f"p99.9 {overall[4]:.2f} ms, max {overall[5]:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
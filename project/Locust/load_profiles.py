@@ -0,0 +1,326 @@
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+from array import array
+from datetime import datetime, timezone
+
+import numpy as np
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+
+
+def _stages(segment, resolution, rng):
+    # [[duration, rps], ...], each stage at a constant rate
+    return np.concatenate([np.full(_steps(duration, resolution), float(rps)) for duration, rps in segment["stages"]])
+
+
+def _constant(segment, resolution, rng):
+    return np.full(_steps(segment["duration"], resolution), float(segment["rps"]))
+
+
+def _sine(segment, resolution, rng):
+    # rps(t) = mean + amplitude * sin(2π * t / period + phase), never negative
+    phase = segment.get("phase", 0.0)
+    if phase == "random":
+        phase = rng.uniform(0, 2 * math.pi)
+    t = np.arange(_steps(segment["duration"], resolution)) * resolution
+    rps = segment["mean"] + segment["amplitude"] * np.sin(2 * math.pi * t / segment["period"] + phase)
+    return np.maximum(rps, 0.0)
+
+
+def _random(segment, resolution, rng):
+    # One value drawn from choices every step seconds
+    n_steps = math.ceil(segment["duration"] / segment["step"])
+    values = [rng.choice(segment["choices"]) for _ in range(n_steps)]
+    return _hold(values, segment["step"], segment["duration"], resolution)
+
+
+def _sequence(segment, resolution, rng):
+    # values in order every step seconds, repeated until duration
+    n_steps = math.ceil(segment["duration"] / segment["step"])
+    values = [segment["values"][i % len(segment["values"])] for i in range(n_steps)]
+    return _hold(values, segment["step"], segment["duration"], resolution)
+
+
+def _parse_time(text):
+    # Seconds since the epoch, or a "YYYY-MM-DD HH:MM:SS" timestamp (datasets_train)
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).replace(tzinfo=timezone.utc).timestamp()
+
+
+def trace_grid(path, time_column="timestamp", column="value", per_seconds=1.0, resolution=1.0):
+    """
+    Memory-map the rate of a recorded trace on a resolution-second grid, each sample held until the next one.
+
+    The grid is computed once, in one pass over the CSV, and cached as a float32 .npy file next to it, so
+    every Locust process maps the same pages instead of parsing and keeping its own copy of a long trace.
+
+    :param path: CSV file with a time column and a value column.
+    :param time_column: Column of the sample times (seconds since the epoch or "YYYY-MM-DD HH:MM:SS").
+    :param column: Column of the values.
+    :param per_seconds: Seconds a value counts requests over (e.g. 10 for the Sysdig *_sum samples),
+                        or "sample" for the interval between two samples.
+    :param resolution: Step of the grid in seconds.
+    :return: Read-only float32 array of arrivals per second.
+    """
+    cache = f"{path}.{column}.{per_seconds}.{resolution:g}s.trace.npy"
+    if not os.path.exists(cache) or os.path.getmtime(cache) < os.path.getmtime(path):
+        times, values = array("d"), array("d")
+        with open(path, newline="") as file:
+            reader = csv.reader(file)
+            header = next(reader)
+            t_index, v_index = header.index(time_column), header.index(column)
+            for row in reader:
+                times.append(_parse_time(row[t_index]))
+                values.append(float(row[v_index]))
+        if not times:
+            raise ValueError(f"The trace {path} is empty.")
+        times, values = np.frombuffer(times), np.frombuffer(values)
+        order = np.argsort(times, kind="stable")
+        times, values = times[order] - times[order][0], values[order]
+        gap = float(np.median(np.diff(times))) if len(times) > 1 else resolution
+        values = values / (gap if per_seconds == "sample" else float(per_seconds))
+        t = np.arange(_steps(times[-1] + gap, resolution)) * resolution
+        grid = values[np.searchsorted(times, t, side="right") - 1].astype(np.float32)
+        # Written next to the cache and renamed, processes starting together never read a partial file
+        fd, tmp_path = tempfile.mkstemp(prefix=".trace_", suffix=".npy", dir=os.path.dirname(os.path.abspath(cache)))
+        with os.fdopen(fd, "wb") as file:
+            np.save(file, grid)
+        os.replace(tmp_path, cache)
+    return np.load(cache, mmap_mode="r")
+
+
+def _trace(segment, resolution, rng):
+    # Recorded rate; start and duration (seconds of the trace) select a part without reading the rest
+    path = segment["file"]
+    if not os.path.isabs(path):
+        path = os.path.join(PROFILE_DIR, path)
+    grid = trace_grid(path, segment.get("time_column", "timestamp"), segment.get("column", "value"),
+                      segment.get("per_seconds", 1.0), resolution)
+    start = _steps(segment.get("start", 0), resolution)
+    end = start + _steps(segment["duration"], resolution) if "duration" in segment else len(grid)
+    grid = grid[start:end]
+    speedup = segment.get("speedup", 1.0)
+    if speedup != 1.0:
+        grid = grid[(np.arange(int(len(grid) / speedup)) * speedup).astype(np.int64)]
+    return grid
+
+
+SEGMENT_TYPES = {
+    "constant": _constant,
+    "stages": _stages,
+    "sine": _sine,
+    "random": _random,
+    "sequence": _sequence,
+    "trace": _trace,
+}
+
+
+def _steps(duration, resolution):
+    return int(round(duration / resolution))
+
+
+def _hold(values, step, duration, resolution):
+    return np.repeat(np.asarray(values, dtype=np.float64), _steps(step, resolution))[:_steps(duration, resolution)]
+
+
+class LoadProfile:
+    def __init__(self, name, schedule, resolution, user=None, max_latency=2.0, poisson=False, speedup=1.0,
+                 scale=1.0):
+        """
+        Target arrival rate of a load test, precomputed for the whole test.
+        speedup and scale are applied on lookup, so a memory-mapped trace is never copied.
+
+        :param name: Name of the profile.
+        :param schedule: Arrivals per second of each resolution-long slot.
+        :param resolution: Length of a slot in seconds.
+        :param user: Name of the user class sending the load (see users.USER_CLASSES).
+        :param max_latency: Slowest response time at which the rate can still be kept (sizes the pool of users).
+        :param poisson: Poisson arrivals instead of a constant spacing.
+        :param speedup: Time compression, the schedule is played speedup times faster.
+        :param scale: Factor applied to every rate.
+        """
+        self.name = name
+        self.schedule = schedule if isinstance(schedule, np.ndarray) else np.asarray(schedule, dtype=np.float64)
+        self.resolution = resolution
+        self.user = user
+        self.max_latency = max_latency
+        self.poisson = poisson
+        self.speedup = speedup
+        self.scale = scale
+        # Declarative form and seed it was built from (set by from_dict), to rebuild it in the Locust workers
+        self.source = None
+        self.seed = None
+
+    @property
+    def duration(self):
+        return len(self.schedule) * self.resolution / self.speedup
+
+    def rate(self, run_time):
+        """
+        :return: Target arrivals per second at run_time, or None after the end of the profile.
+        """
+        slot = int(run_time * self.speedup / self.resolution)
+        if slot >= len(self.schedule):
+            return None
+        return float(self.schedule[slot]) * self.scale
+
+    @classmethod
+    def from_dict(cls, profile, name="profile"):
+        """
+        Build a profile from its declarative form:
+        {"resolution": 0.1, "seed": 42, "repeat": 1, "speedup": 1, "scale": 1, "user": "orders",
+         "segments": [{"type": "sine", ...}, ...]}
+        A single trace segment stays memory-mapped.
+        """
+        resolution = profile.get("resolution", 0.1)
+        # Without a seed one is drawn, so that the Locust workers can still build the same schedule
+        seed = profile.get("seed")
+        if seed is None:
+            seed = random.randrange(2 ** 31)
+        rng = random.Random(seed)
+        parts = []
+        for segment in profile["segments"]:
+            if segment["type"] not in SEGMENT_TYPES:
+                raise ValueError(f"Unknown segment type {segment['type']}, expected one of {list(SEGMENT_TYPES)}.")
+            part = SEGMENT_TYPES[segment["type"]](segment, resolution, rng)
+            parts.append(part * segment["scale"] if "scale" in segment else part)
+        schedule = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        if profile.get("repeat", 1) != 1:
+            schedule = np.tile(schedule, profile["repeat"])
+        if "max_duration" in profile:
+            schedule = schedule[:_steps(profile["max_duration"], resolution)]
+        loaded = cls(profile.get("name", name), schedule, resolution, profile.get("user", "orders"),
+                     profile.get("max_latency", 2.0), profile.get("poisson", False), profile.get("speedup", 1.0),
+                     profile.get("scale", 1.0))
+        loaded.source = dict(profile, name=loaded.name)
+        loaded.seed = seed
+        return loaded
+
+    @classmethod
+    def load(cls, profile):
+        """
+        :param profile: Path of a JSON profile, the name of a profile in the profiles directory, or the path of
+                        a recorded trace CSV (timestamp and value columns, e.g. net_request_count_in_sum.csv).
+        """
+        if profile.endswith(".csv"):
+            return cls.from_dict({"resolution": 1, "segments": [{"type": "trace", "file": os.path.abspath(profile),
+                                                                  "per_seconds": "sample"}]},
+                                 os.path.splitext(os.path.basename(profile))[0])
+        path = profile if os.path.exists(profile) else os.path.join(PROFILE_DIR, profile + ".json")
+        with open(path, "r") as file:
+            return cls.from_dict(json.load(file), os.path.splitext(os.path.basename(path))[0])
+
+    def summary(self):
+        low, high, mean = (float(f(self.schedule)) * self.scale for f in (np.min, np.max, np.mean))
+        return (f"{self.name}: {self.duration:.0f} s, {low:.1f}-{high:.1f} rps (mean {mean:.1f}), "
+                f"{mean * self.duration:.0f} requests, user {self.user}")
+
+
+def profile_shape(profile=None, class_name="ProfileLoadShape", user_classes=None):
+    """
+    Create a load shape class that follows a profile, to expose it in a locustfile.
+    tick is an O(1) lookup in the precomputed schedule of the profile.
+
+    :param profile: Path or name of the profile (see LoadProfile.load), None to set it later with use().
+    :param class_name: Name of the created class.
+    :param user_classes: Mapping of the "user" names of the profiles to user classes. When given, only the
+                         user class named by the profile is spawned; else every user class of the locustfile is.
+    """
+    from pacing import PacedLoadShape
+    from distributed import PARTITION
+
+    class ProfileLoadShape(PacedLoadShape):
+        def rate(self, run_time):
+            return self.profile.rate(run_time)
+
+        @classmethod
+        def use(cls, profile):
+            """
+            Follow a profile, given as a LoadProfile or by path or name.
+            """
+            if not isinstance(profile, LoadProfile):
+                profile = LoadProfile.load(profile)
+            cls.profile = profile
+            cls.max_latency = profile.max_latency
+            cls.pacer.poisson = profile.poisson
+            cls.pacer.random.seed(profile.seed)
+            if user_classes is not None and profile.user not in user_classes:
+                raise ValueError(f"Unknown user {profile.user} in the profile {profile.name}, "
+                                 f"expected one of {list(user_classes)}.")
+            print(f"Load profile {profile.summary()}")
+
+        def tick(self):
+            if self.profile is None:
+                raise ValueError("No load profile selected.")
+            result = super().tick()
+            PARTITION.publish(self)
+            if result is None or user_classes is None:
+                return result
+            return result + ([user_classes[self.profile.user]],)
+
+    ProfileLoadShape.__name__ = ProfileLoadShape.__qualname__ = class_name
+    ProfileLoadShape.profile = None
+    if profile is not None:
+        ProfileLoadShape.use(profile)
+    return ProfileLoadShape
+
+
+def show(args):
+    names = args.profiles or sorted(name[:-len(".json")] for name in os.listdir(PROFILE_DIR) if name.endswith(".json"))
+    for name in names:
+        profile = LoadProfile.load(name)
+        print(profile.summary())
+        if args.dump:
+            t = np.arange(len(profile.schedule)) * profile.resolution
+            np.savetxt(args.dump, np.column_stack([t, profile.schedule]), delimiter=",", header="time,rps",
+                       comments="", fmt="%.3f")
+            print(f"Schedule written to {args.dump}")
+
+
+def run(args, locust_args):
+    from distributed import run_locust, worker_count
+
+    csv_prefix = args.csv or f"{os.path.splitext(os.path.basename(args.profile))[0]}_test_results"
+    locustfile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "loadtest.py")
+    if args.client:
+        os.environ["LOCUST_CLIENT"] = args.client  # Inherited by the master and the workers
+    return run_locust(locustfile, csv_prefix, worker_count(args.workers), ["--load-profile", args.profile] + locust_args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and run the load profiles")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    show_parser = commands.add_parser("show", help="Print the summary of profiles")
+    show_parser.add_argument("profiles", nargs="*", help="Profile names or paths (all the profiles by default)")
+    show_parser.add_argument("--dump", help="Write the schedule of the (single) profile to this CSV file")
+
+    run_parser = commands.add_parser("run", help="Run a profile headless with loadtest.py and export the CSV results; "
+                                                 "other arguments are passed to Locust (e.g. --host)")
+    run_parser.add_argument("profile", help="Profile name or path")
+    run_parser.add_argument("--csv", help="Prefix of the CSV files (default: <profile>_test_results)")
+    run_parser.add_argument("--workers", default="0",
+                            help="Number of local Locust worker processes sharing the rate, \"auto\" for one per "
+                                 "core (default: 0, a single process)")
+    run_parser.add_argument("--client", choices=["fast", "requests"],
+                            help="HTTP client of the users (default: LOCUST_CLIENT, else fast)")
+
+    args, locust_args = parser.parse_known_args()
+    if args.command == "show":
+        if locust_args:
+            parser.error(f"unrecognized arguments: {' '.join(locust_args)}")
+        show(args)
+    else:
+        return run(args, locust_args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
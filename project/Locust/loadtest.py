@@ -0,0 +1,35 @@
+"""
+Generic locustfile: the load follows a profile of the profiles directory, selected with --load-profile
+(or LOCUST_PROFILE), e.g. `locust -f loadtest.py --load-profile ppo` or `python load_profiles.py run ppo`.
+A recorded trace is replayed with e.g. `--load-profile .../net_request_count_in_sum.csv --speedup 60 --scale 20`.
+"""
+from locust import events
+from load_profiles import LoadProfile, profile_shape
+# Every user class has to be visible to Locust, the shape then picks the one of the profile
+from users import USER_CLASSES, OrderUser, StatusUser, ResourceUser, ProcessUser  # noqa: F401
+
+DEFAULT_PROFILE = "sinusoidal"
+
+# The user class spawned is the one named by the profile
+ProfileLoadShape = profile_shape(user_classes=USER_CLASSES)
+
+
+@events.init_command_line_parser.add_listener
+def add_profile_argument(parser):
+    # Not --profile, Locust has its own option of that name
+    parser.add_argument("--load-profile", type=str, env_var="LOCUST_PROFILE", default=DEFAULT_PROFILE,
+                        help="Name or path of the load profile, or a recorded trace CSV (see load_profiles.py)")
+    parser.add_argument("--speedup", type=float, env_var="LOCUST_SPEEDUP", default=1.0,
+                        help="Play the profile this many times faster (time compression)")
+    parser.add_argument("--scale", type=float, env_var="LOCUST_SCALE", default=1.0,
+                        help="Multiply the rate of the profile by this factor")
+
+
+@events.init.add_listener
+def select_profile(environment, **kwargs):
+    options = environment.parsed_options
+    profile = LoadProfile.load(options.load_profile)
+    profile.speedup *= options.speedup
+    profile.scale *= options.scale
+    ProfileLoadShape.use(profile)
+
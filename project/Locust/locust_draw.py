@@ -1,4 +1,11 @@
+import argparse
+import os
+
+import numpy as np
 import pandas as pd
+import matplotlib
+
+matplotlib.use("Agg")  # Figures are written to files, no display needed
 import matplotlib.pyplot as plt
 
 # Set global font size for all plots
@@ -9,55 +16,153 @@ plt.rc('xtick', labelsize=14)  # Set x-tick label font size
 plt.rc('ytick', labelsize=14)  # Set y-tick label font size
 plt.rc('legend', fontsize=14)  # Set legend font size
 
-# Load the data from the CSV file
-file_path = "sinusoidal_test_results_stats_history.csv"  # Replace with your actual file path
-data = pd.read_csv(file_path)
-
-# Convert the Timestamp to readable format if needed
-data['Timestamp'] = pd.to_datetime(data['Timestamp'], unit='s')
-
-# Filter data to include only the first 5 minutes
-start_time = data['Timestamp'].min()
-end_time = start_time + pd.Timedelta(minutes=5)
-data = data[(data['Timestamp'] >= start_time) & (data['Timestamp'] <= end_time)]
-
-# Plot Requests/s and Failures/s in one graph
-plt.figure(figsize=(14, 6))
-plt.plot(data['Timestamp'], data['Requests/s'], label='Requests/s', color='green')
-plt.plot(data['Timestamp'], data['Failures/s'], label='Failures/s', color='red')
-plt.title("Requests and Failures per Second Over Time (First 5 Minutes)")
-plt.xlabel("Timestamp")
-plt.ylabel("Requests/Failures per Second")
-plt.grid(True)
-plt.legend()
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.show()
-
-# Plot User Count over Time
-plt.figure(figsize=(14, 6))
-plt.plot(data['Timestamp'], data['User Count'], label='User Count', color='blue')
-plt.title("User Count Over Time (First 5 Minutes)")
-plt.xlabel("Timestamp")
-plt.ylabel("User Count")
-plt.grid(True)
-plt.legend()
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.show()
-
-# Plot Response Time Percentiles over Time
-percentiles = ['50%', '95%']
-plt.figure(figsize=(14, 8))
-
-for percentile in percentiles:
-    plt.plot(data['Timestamp'], data[percentile], label=f'{percentile} Response Time')
-
-plt.title("Response Time Percentiles Over Time (First 5 Minutes)")
-plt.xlabel("Timestamp")
-plt.ylabel("Response Time (ms)")
-plt.grid(True)
-plt.legend()
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.show()
+COUNT_COLUMNS = ['Requests/s', 'Failures/s', 'User Count']
+
+
+def read_history(file_path, percentiles, start=0.0, end=None, chunksize=100000):
+    """
+    Read the aggregated rows of a Locust stats history within a time window, keeping only the plotted columns.
+    The file is memory-mapped and parsed in chunks, and parsing stops after the end of the window (the history
+    is written in time order), so a long run costs only its window.
+
+    :param file_path: The *_stats_history.csv file written with --csv.
+    :param percentiles: Response time columns to read, e.g. ['50%', '95%'].
+    :param start: Start of the window in seconds from the first row.
+    :param end: End of the window in seconds from the first row, None for the end of the run.
+    :return: Dict of column name to numpy array, with 'Timestamp' in seconds since the epoch.
+    """
+    columns = ['Timestamp', 'Name'] + COUNT_COLUMNS + list(percentiles)
+    header = pd.read_csv(file_path, nrows=0).columns
+    missing = [column for column in columns if column not in header and column != 'Name']
+    if missing:
+        raise ValueError(f"Columns {missing} not found in {file_path}.")
+    usecols = [column for column in columns if column in header]
+
+    parts = []
+    first = None
+    for chunk in pd.read_csv(file_path, usecols=usecols, chunksize=chunksize, memory_map=True):
+        if 'Name' in chunk:
+            # The full history also has one row per request name
+            chunk = chunk[chunk['Name'] == 'Aggregated']
+        if chunk.empty:
+            continue
+        if first is None:
+            first = chunk['Timestamp'].iloc[0]
+        elapsed = chunk['Timestamp'] - first
+        in_window = elapsed >= start
+        if end is not None:
+            in_window &= elapsed <= end
+        parts.append(chunk[in_window])
+        if end is not None and elapsed.iloc[-1] > end:
+            break
+    if not parts:
+        raise ValueError(f"No aggregated rows in {file_path}.")
+    data = pd.concat(parts)
+    return {column: pd.to_numeric(data[column], errors='coerce').to_numpy(dtype=np.float64)
+            for column in usecols if column != 'Name'}
+
+
+def lttb(x, y, points):
+    """
+    Downsample a series with Largest-Triangle-Three-Buckets: keep the first and last points and, in each of the
+    points - 2 buckets in between, the point forming the largest triangle with the previously kept point and the
+    average of the next bucket. Peaks survive, unlike with a stride or a mean.
+
+    :param x: Sorted x values.
+    :param y: y values, without NaN.
+    :param points: Number of points to keep.
+    :return: (x, y) of the kept points.
+    """
+    n = len(x)
+    if points >= n or points < 3:
+        return x, y
+    edges = (np.arange(points - 1) * ((n - 2) / (points - 2))).astype(np.int64) + 1
+    keep = np.empty(points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+def plot_series(ax, data, column, points, **kwargs):
+    """
+    Plot one column of the history, downsampled to at most points points.
+    """
+    x, y = data['Timestamp'], data[column]
+    valid = ~np.isnan(y)  # The percentiles are N/A until the first response
+    x, y = lttb(x[valid], y[valid], points)
+    ax.plot(pd.to_datetime(x, unit='s'), y, **kwargs)
+
+
+def save_figure(fig, ax, title, ylabel, path):
+    ax.set_title(title)
+    ax.set_xlabel("Timestamp")
+    ax.set_ylabel(ylabel)
+    ax.grid(True)
+    ax.legend()
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    print(f"Saved {path}")
+
+
+def draw(file_path, out_dir, start=0.0, end=300.0, percentiles=('50%', '95%'), points=2000, fmt="png",
+         chunksize=100000):
+    """
+    Draw the requests, user count and response time figures of a Locust run in one pass over its history.
+
+    :return: Paths of the figures.
+    """
+    data = read_history(file_path, percentiles, start, end, chunksize)
+    os.makedirs(out_dir, exist_ok=True)
+    prefix = os.path.join(out_dir, os.path.basename(file_path).replace("_stats_history.csv", ""))
+    window = f"{start:g}-{end:g} s" if end is not None else f"from {start:g} s"
+    paths = [f"{prefix}_requests.{fmt}", f"{prefix}_users.{fmt}", f"{prefix}_response_times.{fmt}"]
+
+    # Plot Requests/s and Failures/s in one graph
+    fig, ax = plt.subplots(figsize=(14, 6))
+    plot_series(ax, data, 'Requests/s', points, label='Requests/s', color='green')
+    plot_series(ax, data, 'Failures/s', points, label='Failures/s', color='red')
+    save_figure(fig, ax, f"Requests and Failures per Second Over Time ({window})", "Requests/Failures per Second",
+                paths[0])
+
+    # Plot User Count over Time
+    fig, ax = plt.subplots(figsize=(14, 6))
+    plot_series(ax, data, 'User Count', points, label='User Count', color='blue')
+    save_figure(fig, ax, f"User Count Over Time ({window})", "User Count", paths[1])
+
+    # Plot Response Time Percentiles over Time
+    fig, ax = plt.subplots(figsize=(14, 8))
+    for percentile in percentiles:
+        plot_series(ax, data, percentile, points, label=f'{percentile} Response Time')
+    save_figure(fig, ax, f"Response Time Percentiles Over Time ({window})", "Response Time (ms)", paths[2])
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw the figures of a Locust stats history")
+    parser.add_argument("file", nargs="?", default="sinusoidal_test_results_stats_history.csv",
+                        help="The *_stats_history.csv file of the run")
+    parser.add_argument("--start", type=float, default=0, help="Start of the window, seconds from the first row")
+    parser.add_argument("--end", default="300",
+                        help="End of the window, seconds from the first row, or 'end' for the whole run")
+    parser.add_argument("--percentiles", nargs="+", default=['50%', '95%'], help="Response time columns to plot")
+    parser.add_argument("--points", type=int, default=2000, help="Points kept per series (LTTB downsampling)")
+    parser.add_argument("--out-dir", default="figures", help="Directory of the figures")
+    parser.add_argument("--format", default="png", help="Image format of the figures (png, svg, pdf)")
+    parser.add_argument("--chunksize", type=int, default=100000, help="Rows parsed at a time")
+    args = parser.parse_args()
+
+    end = None if args.end == "end" else float(args.end)
+    draw(args.file, args.out_dir, args.start, end, args.percentiles, args.points, args.format, args.chunksize)
+
+
+if __name__ == "__main__":
+    main()
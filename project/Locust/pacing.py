@@ -0,0 +1,164 @@
+import math
+import random
+
+import gevent
+from locust import FastHttpUser, HttpUser, LoadTestShape, events
+from locust.runners import MasterRunner
+
+
+class ArrivalPacer:
+    """
+    Open-loop arrival process shared by all the users of a Locust process.
+
+    Every task execution claims the next arrival time of a schedule that follows the target rate of the
+    load shape, deterministic (token bucket) or Poisson, and only depends on the rate: a slow response
+    delays the user that sent it, not the next arrivals, which are taken by the other (idle) users.
+    Arrivals that are already due (all users were busy) are sent right away to catch up; arrivals more than
+    max_lag late are dropped and counted, since the generator itself is then the bottleneck.
+    With several Locust workers, each one follows share of the rate of the shape.
+    """
+    # Step used to look for the end of a period without load
+    IDLE_STEP = 0.1
+
+    def __init__(self, poisson=False, seed=None, max_lag=1.0):
+        """
+        :param poisson: Exponential inter-arrival times instead of a constant spacing.
+        :param seed: Seed of the Poisson arrivals.
+        :param max_lag: Seconds after which a missed arrival is dropped instead of sent late.
+        """
+        self.poisson = poisson
+        self.random = random.Random(seed)
+        self.max_lag = max_lag
+        self.shape = None
+        self.share = 1.0
+        self.next_arrival = None
+        self.arrivals = 0
+        self.late = 0
+        self.dropped = 0
+        self.worst_lag = 0.0
+
+    def attach(self, shape):
+        """
+        Follow the rate of a PacedLoadShape (called by the shape on its first tick).
+        """
+        if self.shape is not shape:
+            self.shape = shape
+            self.next_arrival = None
+
+    def _rate(self, run_time):
+        rate = self.shape.rate(run_time)
+        return None if rate is None else rate * self.share
+
+    def _gap(self, rate):
+        return self.random.expovariate(rate) if self.poisson else 1.0 / rate
+
+    def claim(self):
+        """
+        Take the next arrival of the schedule.
+        :return: Run time of the arrival in seconds, or None when the shape has ended.
+        """
+        now = self.shape.get_run_time()
+        arrival = now if self.next_arrival is None else self.next_arrival
+        if now - arrival > self.max_lag:
+            missed = math.floor((now - arrival - self.max_lag) * max(self._rate(arrival) or 0, 0))
+            self.dropped += missed
+            arrival = now - self.max_lag
+        rate = self._rate(arrival)
+        while rate is not None and rate <= 0:
+            arrival += self.IDLE_STEP
+            rate = self._rate(arrival)
+        if rate is None:
+            return None
+        self.next_arrival = arrival + self._gap(rate)
+        self.arrivals += 1
+        lag = now - arrival
+        if lag > 0.01:
+            self.late += 1
+            self.worst_lag = max(self.worst_lag, lag)
+        return arrival
+
+    def delay(self):
+        """
+        :return: Seconds to wait before the next arrival claimed by the caller.
+        """
+        if self.shape is None:
+            return 1.0  # The shape has not ticked yet
+        arrival = self.claim()
+        if arrival is None:
+            return 1.0  # The test is ending, the runner stops the users
+        return max(arrival - self.shape.get_run_time(), 0.0)
+
+    def counts(self):
+        return {"arrivals": self.arrivals, "late": self.late, "dropped": self.dropped, "worst_lag": self.worst_lag}
+
+    def summary(self, counts=None):
+        counts = counts or self.counts()
+        return (f"{counts['arrivals']} arrivals, {counts['late']} sent late (worst {counts['worst_lag']:.2f} s), "
+                f"{counts['dropped']} dropped")
+
+
+# Pacer of this Locust process
+PACER = ArrivalPacer()
+
+
+class OpenLoopMixin:
+    """
+    Tasks start at the arrival times of PACER instead of after a think time.
+    The shape sizes the pool of users, the pacer decides when each of them sends.
+    """
+    pacer = PACER
+
+    def wait_time(self):
+        return self.pacer.delay()
+
+    def on_start(self):
+        # The first task also waits for an arrival, spawning does not create a burst
+        gevent.sleep(self.pacer.delay())
+
+
+class OpenLoopUser(OpenLoopMixin, HttpUser):
+    # Open-loop user on the requests-based client
+    abstract = True
+
+
+class FastOpenLoopUser(OpenLoopMixin, FastHttpUser):
+    # Open-loop user on the geventhttpclient-based client: pooled keep-alive connections, less CPU per request
+    abstract = True
+    # The tasks of a user are sequential, one keep-alive connection per user is enough
+    concurrency = 1
+
+
+class PacedLoadShape(LoadTestShape):
+    """
+    Load shape defined by a target arrival rate. Subclasses implement rate(run_time).
+
+    The number of users only bounds the concurrency: it is sized so that max_latency seconds of
+    arrivals can be in flight, so the rate is kept even when the responses slow down.
+    """
+    abstract = True
+    pacer = PACER
+    max_latency = 2.0  # Slowest response time at which the rate can still be kept
+    lookahead = 5  # Seconds of future rate used to size the pool of users
+
+    def rate(self, run_time):
+        """
+        :return: Target arrivals per second at run_time, or None when the test is over.
+        """
+        raise NotImplementedError
+
+    def tick(self):
+        self.pacer.attach(self)
+        run_time = self.get_run_time()
+        rates = [self.rate(run_time + offset) for offset in range(self.lookahead + 1)]
+        if rates[0] is None:
+            return None
+        peak = max(rate for rate in rates if rate is not None)
+        users = max(1, math.ceil(peak * self.max_latency))
+        return users, users
+
+
+@events.test_stop.add_listener
+def report_pacing(environment, **kwargs):
+    # The master only ticks the shape, the workers report their pacing to it (see distributed.py)
+    if PACER.shape is not None and not isinstance(environment.runner, MasterRunner):
+        print(f"Open-loop pacing: {PACER.summary()}")
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("locust")
+
+from locust.runners import STATE_MISSING, MasterRunner  # noqa: E402
+from distributed import PARTITION_MESSAGE, RatePartition  # noqa: E402
+from load_profiles import LoadProfile, profile_shape  # noqa: E402
+from pacing import ArrivalPacer  # noqa: E402
+
+SOURCE = {"resolution": 1, "seed": 7, "poisson": True, "segments": [{"type": "stages", "stages": [[10, 4], [10, 8]]}]}
+
+
+class FakeMaster(MasterRunner):
+    """
+    Master runner that records the messages instead of sending them.
+    """
+    def __init__(self, client_ids):
+        self.clients = {client_id: SimpleNamespace(state="ready") for client_id in client_ids}
+        self.sent = []
+        self.greenlet = None  # Nothing to stop when the runner is collected
+
+    def send_message(self, msg_type, data=None, client_id=None):
+        self.sent.append((msg_type, data, client_id))
+
+
+def master_partition(client_ids):
+    partition = RatePartition(ArrivalPacer())
+    partition.runner = FakeMaster(client_ids)
+    shape = profile_shape(LoadProfile.from_dict(SOURCE, "test"), "MasterShape")()
+    return partition, shape
+
+
+def test_partition_is_sent_when_the_workers_change():
+    partition, shape = master_partition(["w2", "w1"])
+    partition.publish(shape)
+    assert [(data["index"], data["workers"], client_id) for _, data, client_id in partition.runner.sent] == \
+        [(0, 2, "w1"), (1, 2, "w2")]
+    assert all(msg_type == PARTITION_MESSAGE and data["seed"] == 7 for msg_type, data, _ in partition.runner.sent)
+
+    # Same workers, before the resync: nothing is sent
+    partition.publish(shape)
+    assert len(partition.runner.sent) == 2
+
+    # A missing worker leaves the split
+    partition.runner.clients["w2"].state = STATE_MISSING
+    partition.publish(shape)
+    assert [(data["index"], data["workers"], client_id) for _, data, client_id in partition.runner.sent[2:]] == \
+        [(0, 1, "w1")]
+
+
+def test_workers_follow_their_share_of_the_same_schedule():
+    partition, shape = master_partition(["w1", "w2"])
+    partition.publish(shape)
+
+    workers = []
+    for _, data, _ in partition.runner.sent:
+        worker = RatePartition(ArrivalPacer())
+        # The worker does not know the profile yet: it is rebuilt from the message
+        worker_shape = profile_shape(None, "WorkerShape")()
+        worker.receive(SimpleNamespace(shape_class=worker_shape), SimpleNamespace(data=data))
+        workers.append((worker, worker_shape))
+
+    for worker, worker_shape in workers:
+        assert worker.pacer.share == 0.5 and worker.pacer.shape is worker_shape
+        assert [worker_shape.rate(t) for t in range(0, 25, 5)] == [shape.rate(t) for t in range(0, 25, 5)]
+    # Each worker draws its own, reproducible, Poisson arrivals
+    draws = [worker.pacer.random.random() for worker, _ in workers]
+    assert draws[0] != draws[1]
+    again = RatePartition(ArrivalPacer())
+    again.receive(SimpleNamespace(shape_class=profile_shape(None, "WorkerShape")()),
+                  SimpleNamespace(data=partition.runner.sent[0][1]))
+    assert again.pacer.random.random() == draws[0]
@@ -0,0 +1,73 @@
+import numpy as np
+
+from latency_histogram import (HALF, SUB_BUCKETS, IntervalHistograms, IntervalLogWriter, bucket_index, bucket_upper,
+                               decode, encode, merge, percentiles, read_log, report)
+
+START = 1700000000
+
+
+def latencies(n, seed=0):
+    # Log-normal latencies in microseconds, from well below SUB_BUCKETS to seconds
+    return np.random.default_rng(seed).lognormal(np.log(20000), 1.5, n).astype(np.int64)
+
+
+def histogram(values):
+    indices, counts = np.unique([bucket_index(int(value)) for value in values], return_counts=True)
+    return indices, counts
+
+
+def test_buckets_bound_their_values():
+    values = np.concatenate([np.arange(4 * SUB_BUCKETS), latencies(5000), [2 ** 40 + 12345]])
+    indices = np.array([bucket_index(int(value)) for value in values])
+    upper = bucket_upper(indices)
+    lower = np.where(indices > 0, bucket_upper(indices - 1) + 1, 0)
+    assert np.all((lower <= values) & (values <= upper))
+    # Exact below SUB_BUCKETS, never wider than 1 / HALF of the values above
+    assert np.array_equal(upper[values < SUB_BUCKETS], values[values < SUB_BUCKETS])
+    assert np.all(upper - lower + 1 <= np.maximum(lower / HALF, 1))
+
+
+def test_encode_decode_and_merge():
+    indices, counts = histogram(latencies(1000))
+    shuffled = np.random.default_rng(1).permutation(len(indices))
+    decoded = decode(encode(indices[shuffled], counts[shuffled]))
+    assert np.array_equal(decoded[0], indices) and np.array_equal(decoded[1], counts)
+
+    values = latencies(1000, seed=2)
+    merged = merge([histogram(values[:400]), histogram(values[400:])])
+    whole = histogram(values)
+    assert np.array_equal(merged[0], whole[0]) and np.array_equal(merged[1], whole[1])
+
+
+def test_percentiles_are_accurate_to_the_bucket_width():
+    values = latencies(20000)
+    result = percentiles(*histogram(values), ranks=(50, 99, 100))
+    # The value of the rank, rounded up to the top of its bucket
+    exact = np.sort(values)[np.ceil(np.array([50, 99, 100]) / 100 * len(values)).astype(np.int64) - 1]
+    assert np.all(exact <= result) and np.all(result <= exact * (1 + 1 / HALF))
+    assert percentiles(*histogram([300]), ranks=(0, 50))[0] == bucket_upper([bucket_index(300)])[0]
+
+
+def test_workers_are_merged_in_the_log(tmp_path):
+    values = latencies(600)
+    workers = [IntervalHistograms(), IntervalHistograms()]
+    for i, value in enumerate(values):
+        # Three seconds of requests, alternating between the workers
+        workers[i % 2].record(START + 3 * i / len(values), int(value))
+
+    writer = IntervalLogWriter(str(tmp_path / "latency.log"))
+    # An interval that has not ended yet is kept, then reported late and written again
+    writer.merge(workers[0].take(before=START + 2))
+    writer.flush(before=START + 2)
+    for worker in workers:
+        writer.merge(worker.take())
+    writer.close()
+
+    logged = read_log(str(tmp_path / "latency.log"))
+    assert [entry[0] for entry in logged] == [START, START + 1, START + 2]
+    assert sum(int(entry[4].sum()) for entry in logged) == len(values)
+    rows, overall = report(str(tmp_path / "latency.log"), window=3)
+    assert overall[0] == len(values) and rows[-1][1] == len(values)
+    assert overall[-1] == values.max() / 1000
+    # Percentiles are clamped to the largest latency recorded
+    assert overall[4] <= overall[-1]
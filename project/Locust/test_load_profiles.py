@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from load_profiles import LoadProfile
+
+RESOLUTION = 0.5
+
+
+def schedule(*segments, **profile):
+    return LoadProfile.from_dict(dict(profile, resolution=RESOLUTION, segments=list(segments))).schedule
+
+
+def test_segments():
+    assert list(schedule({"type": "constant", "duration": 1, "rps": 3})) == [3, 3]
+    assert list(schedule({"type": "stages", "stages": [[1, 2], [0.5, 5]]})) == [2, 2, 5]
+    assert list(schedule({"type": "sequence", "duration": 3, "step": 1, "values": [1, 4]})) == [1, 1, 4, 4, 1, 1]
+    # Each value of a random segment is held for step seconds
+    held = schedule({"type": "random", "duration": 4, "step": 2, "choices": [1, 2, 3]}, seed=3)
+    assert len(held) == 8 and held[0] == held[3] and set(held) <= {1, 2, 3}
+    # A sine never goes negative
+    sine = schedule({"type": "sine", "duration": 10, "mean": 1, "amplitude": 2, "period": 4})
+    assert len(sine) == 20 and sine.min() == 0 and sine.max() == pytest.approx(3)
+
+
+def test_profile_options():
+    segments = [{"type": "constant", "duration": 1, "rps": 2, "scale": 2}, {"type": "constant", "duration": 1, "rps": 1}]
+    assert list(schedule(*segments, repeat=2, max_duration=3)) == [4, 4, 1, 1, 4, 4]
+
+    profile = LoadProfile.from_dict({"resolution": 1, "speedup": 2, "scale": 10, "segments": segments})
+    assert profile.duration == 1
+    assert [profile.rate(t) for t in (0, 0.4, 0.5, 0.9)] == [40, 40, 10, 10]
+    assert profile.rate(1) is None
+
+    with pytest.raises(ValueError):
+        schedule({"type": "square", "duration": 1})
+
+
+def test_seed_makes_the_schedule_reproducible():
+    segments = [{"type": "random", "duration": 20, "step": 1, "choices": list(range(100))},
+                {"type": "sine", "duration": 5, "mean": 5, "amplitude": 5, "period": 5, "phase": "random"}]
+    first = LoadProfile.from_dict({"segments": segments})
+    # The drawn seed is kept, so the Locust workers rebuild the same schedule from the source
+    rebuilt = LoadProfile.from_dict(dict(first.source, seed=first.seed))
+    assert first.seed is not None and np.array_equal(first.schedule, rebuilt.schedule)
+    assert not np.array_equal(first.schedule, LoadProfile.from_dict({"seed": first.seed + 1, "segments": segments}).schedule)
+
+
+def test_trace_segment(tmp_path):
+    trace = tmp_path / "trace.csv"
+    trace.write_text("timestamp,value\n2024-01-01 00:00:20,40\n2024-01-01 00:00:00,10\n2024-01-01 00:00:10,20\n")
+    # Sorted by time, each sample counts requests over the 10 s since the previous one
+    profile = LoadProfile.load(str(trace))
+    assert list(profile.schedule[::10]) == [1, 2, 4] and len(profile.schedule) == 30
+    part = schedule({"type": "trace", "file": str(trace), "per_seconds": 10, "start": 5, "duration": 10, "speedup": 2})
+    assert list(part) == [1] * 5 + [2] * 5
+
+
+def test_bundled_profiles():
+    for name in ("a3c", "ddpg", "deterministic", "ppo", "random", "sac", "sinusoidal"):
+        profile = LoadProfile.load(name)
+        assert profile.duration > 0 and profile.schedule.min() >= 0, name
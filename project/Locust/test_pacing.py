@@ -0,0 +1,75 @@
+import pytest
+
+pytest.importorskip("locust")
+
+from pacing import ArrivalPacer  # noqa: E402
+
+
+class FakeShape:
+    """
+    Load shape with a settable run time and a rate (a number or a function of the run time) until duration.
+    """
+    def __init__(self, rate, duration=60):
+        self.run_time = 0.0
+        self.target = rate
+        self.duration = duration
+
+    def get_run_time(self):
+        return self.run_time
+
+    def rate(self, run_time):
+        return None if run_time >= self.duration else self.target(run_time) if callable(self.target) else self.target
+
+
+def attached(shape, **kwargs):
+    pacer = ArrivalPacer(**kwargs)
+    pacer.attach(shape)
+    return pacer
+
+
+def test_arrivals_follow_the_rate():
+    shape = FakeShape(4)
+    pacer = attached(shape)
+    # The schedule does not depend on when the users claim their arrivals
+    assert [pacer.claim() for _ in range(5)] == [0, 0.25, 0.5, 0.75, 1.0]
+    assert pacer.delay() == pytest.approx(1.25)
+
+    # With several workers each one follows its share of the rate
+    half = attached(shape)
+    half.share = 0.5
+    assert [half.claim() for _ in range(3)] == [0, 0.5, 1.0]
+
+
+def test_poisson_arrivals_are_seeded():
+    shape = FakeShape(10, duration=1000)
+    first, second = attached(shape, poisson=True, seed=1), attached(shape, poisson=True, seed=1)
+    arrivals = [first.claim() for _ in range(2000)]
+    assert arrivals == [second.claim() for _ in range(2000)]
+    assert arrivals[-1] == pytest.approx(200, rel=0.1)
+
+
+def test_late_arrivals_are_sent_or_dropped():
+    shape = FakeShape(10)
+    pacer = attached(shape, max_lag=1.0)
+    pacer.claim()
+    # All users were busy for half a second: the arrivals are sent late to catch up
+    shape.run_time = 0.5
+    assert pacer.claim() == pytest.approx(0.1) and pacer.late == 1
+    # Three seconds behind: what is more than max_lag late is dropped
+    shape.run_time = 3.5
+    assert pacer.claim() == pytest.approx(2.5)
+    assert pacer.dropped == 23  # The arrivals from 0.2 to 2.5 s
+    assert pacer.worst_lag == pytest.approx(1.0)
+
+
+def test_idle_periods_and_end():
+    # No load during the first two seconds
+    shape = FakeShape(lambda run_time: 0 if run_time < 2 else 5, duration=3)
+    pacer = attached(shape)
+    assert pacer.claim() == pytest.approx(2.0)
+    # Still before the end, late
+    shape.run_time = 3.0
+    assert pacer.claim() == pytest.approx(2.2)
+    shape.run_time = 4.5
+    assert pacer.claim() is None
+    assert pacer.delay() == 1.0
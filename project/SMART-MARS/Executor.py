@@ -1,16 +1,25 @@
+import csv
 import json
 import os
 import subprocess
+import time
 
 
 class Executor:
-    def __init__(self, file_path):
+    def __init__(self, file_path, apply_command=("oc", "apply", "-f"), weights_log=None, clock=time.time):
         """
         Initialize the Executor class with the path to the virtual service JSON file.
 
         :param file_path: Path to the virtual service JSON file.
+        :param apply_command: Command applying the file (followed by its path), empty to only save it.
+        :param weights_log: CSV file the applied weights are appended to (timestamp, weight_0, weight_1), None to
+                            not log them. Graph/correlate.py reads it with --actions.
+        :param clock: Clock timestamping the log, e.g. the clock of a replayed metrics source.
         """
         self.file_path = file_path
+        self.apply_command = list(apply_command)
+        self.weights_log = weights_log
+        self.clock = clock
         self.virtual_service = None
 
         # Load the JSON file during initialization
@@ -47,20 +56,43 @@ class Executor:
 
         print(f"Updated weights to {actions} in the virtual service configuration.")
 
+    def current_weights(self):
+        """
+        :return: The weights of the virtual service configuration, in the order used by update_weights.
+        """
+        routes = self.virtual_service["spec"]["http"][0]["route"]
+        return [routes[1].get("weight"), routes[0].get("weight")]
+
     def save_and_apply(self):
         """
-        Save the updated virtual service configuration and apply it using `oc apply`.
+        Save the updated virtual service configuration and apply it using `oc apply` (or apply_command).
         """
         # Save the updated configuration back to the file
         with open(self.file_path, 'w') as f:
             json.dump(self.virtual_service, f, indent=4)
         print(f"Saved updated virtual service configuration to {self.file_path}.")
 
-        # Apply the updated configuration using `oc apply`
-        command = ["oc", "apply", "-f", self.file_path]
-        try:
-            subprocess.run(command, check=True)
-            print(f"Successfully applied the updated configuration using: {' '.join(command)}")
-        except subprocess.CalledProcessError as e:
-            print(f"Failed to apply the configuration: {e}")
-            raise
\ No newline at end of file
+        # Without apply_command, the file is watched by the local harness router
+        if self.apply_command:
+            # Apply the updated configuration using `oc apply`
+            command = self.apply_command + [self.file_path]
+            try:
+                subprocess.run(command, check=True)
+                print(f"Successfully applied the updated configuration using: {' '.join(command)}")
+            except subprocess.CalledProcessError as e:
+                print(f"Failed to apply the configuration: {e}")
+                raise
+        self._log_weights()
+
+    def _log_weights(self):
+        """
+        Append the applied weights, in the order used by update_weights, to the weights log.
+        """
+        if not self.weights_log:
+            return
+        new = not os.path.exists(self.weights_log) or os.path.getsize(self.weights_log) == 0
+        with open(self.weights_log, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if new:
+                writer.writerow(["timestamp", "weight_0", "weight_1"])
+            writer.writerow([int(self.clock())] + self.current_weights())
\ No newline at end of file
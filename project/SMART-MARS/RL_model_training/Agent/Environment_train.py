@@ -2,12 +2,15 @@ import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
 import os
-import pandas as pd
 import random  # Simulate metric responses if no live data
+try:
+    from .Normalization import NormalizationStats, load_metric_files
+except ImportError:
+    from Normalization import NormalizationStats, load_metric_files
 
 class ServiceMeshEnv(gym.Env):
     data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets_train")
-    def __init__(self, action_type="continuous", lc1 = 0.5, lc2 = 0.5, **kwargs):
+    def __init__(self, action_type="continuous", lc1 = 0.5, lc2 = 0.5, normalization=None, **kwargs):
         super(ServiceMeshEnv, self).__init__()
         
         # Configure action space based on type
@@ -25,7 +28,7 @@ class ServiceMeshEnv(gym.Env):
         self.observation_space = spaces.Box(low=0, high=1, shape=(6,), dtype=np.float32)
         
         # Initialize environment state
-        self.service_data = self._load_data()
+        self.service_data = self._load_data(normalization)
         self.current_indices = {service: 0 for service in self.service_data.keys()}
         self.state = self._get_metrics()  # Will return metrics for both services
         self.done = False
@@ -76,44 +79,23 @@ class ServiceMeshEnv(gym.Env):
     #                 state.append(0.0)  # Use 0.0 if no more data is available
     #     return np.array(state, dtype=np.float32)
 
-    def _load_data(self):
+    def _load_data(self, normalization=None):
         """
         Load CSV files from each service subdirectory into a dictionary with normalized values.
+
+        :param normalization: NormalizationStats saved with the models. Without it, the statistics
+                              are fitted on the loaded data.
         """
-        service_data = {}
-        
-        for service_name in os.listdir(self.data_dir):
-            service_path = os.path.join(self.data_dir, service_name)
-            if os.path.isdir(service_path):
-                service_data[service_name] = {}
-                
-                for file in os.listdir(service_path):
-                    metric_path = os.path.join(service_path, file)
-                    if file.endswith(".csv"):
-                        # Load the metric data and sort by timestamp
-                        metric_name = file.replace(".csv", "")
-                        df = pd.read_csv(metric_path)
-                        df = df.sort_values(by="timestamp")
-                        
-                        # Apply normalization based on the metric type
-                        if metric_name == "cpu_quota_used_percent_avg":
-                            # Min-Max normalization for CPU
-                            min_value = df["value"].min()
-                            max_value = df["value"].max()
-                            df["value"] = (df["value"] - min_value) / (max_value - min_value)
-                        elif metric_name in ["net_http_request_time_max", "net_request_count_in_sum"]:
-                            # Log transformation followed by Min-Max normalization for latency and RPS
-                            df["log_value"] = np.log10(df["value"])
-                            min_log_value = df["log_value"].min()
-                            max_log_value = df["log_value"].max()
-                            df["normalized_value"] = (df["log_value"] - min_log_value) / (max_log_value - min_log_value)
-                            # Replace original "value" with normalized version
-                            df["value"] = df["normalized_value"]
-                            df.drop(columns=["log_value", "normalized_value"], inplace=True)
-                            
-                        # Store the normalized data
-                        service_data[service_name][metric_name] = df.reset_index(drop=True)
-        return service_data
+        service_data = load_metric_files(self.data_dir)
+        if normalization is None:
+            normalization = NormalizationStats.fit(service_data)
+        self.normalization_stats = normalization
+        # Keep the observation order the statistics (and the models) were built with
+        service_data = normalization.arrange(service_data)
+        # Only the normalized values are kept, as float32 arrays
+        return {service_name: {metric_name: normalization.transform_metric(service_name, metric_name, df["value"].to_numpy())
+                               for metric_name, df in metrics.items()}
+                for service_name, metrics in service_data.items()}
 
     def _get_metrics(self):
         """
@@ -121,10 +103,10 @@ class ServiceMeshEnv(gym.Env):
         """
         state = []
         for service, metrics in self.service_data.items():
-            for metric_name, df in metrics.items():
+            for metric_name, values in metrics.items():
                 idx = self.current_indices[service]
-                if idx < len(df):
-                    state.append(df.loc[idx, "value"])
+                if idx < len(values):
+                    state.append(values[idx])
                     # Increment index for the next call
                     self.current_indices[service] += 1
                 else:
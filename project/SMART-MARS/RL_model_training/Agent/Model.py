@@ -35,29 +35,33 @@
 
 from stable_baselines3 import PPO, SAC, DDPG, A2C
 import Environment_train as Environment
+from Normalization import NormalizationStats, stats_path
+
+# Normalization statistics of the training data, shared by all environments and saved with each model
+normalization = NormalizationStats.from_dir(Environment.ServiceMeshEnv.data_dir)
 
 # Define models and environments
 models = {
     "PPO": (
-        PPO("MlpPolicy", Environment.ServiceMeshEnv(action_type="discrete"), 
+        PPO("MlpPolicy", Environment.ServiceMeshEnv(action_type="discrete", normalization=normalization), 
             batch_size=64, n_steps=1024, learning_rate=0.001, gamma=0.99, verbose=1), 
         "ppo_service_mesh_model"
     ),
     
     "A2C": (
-        A2C("MlpPolicy", Environment.ServiceMeshEnv(action_type="discrete"), 
+        A2C("MlpPolicy", Environment.ServiceMeshEnv(action_type="discrete", normalization=normalization), 
             n_steps=1024, learning_rate=0.001, gamma=0.99, verbose=1), 
         "a2c_service_mesh_model"
     ),
     
     "DDPG": (
-        DDPG("MlpPolicy", Environment.ServiceMeshEnv(action_type="continuous"), 
+        DDPG("MlpPolicy", Environment.ServiceMeshEnv(action_type="continuous", normalization=normalization), 
              learning_rate=0.001, gamma=0.99, verbose=1), 
         "ddpg_service_mesh_model"
     ),
     
     "SAC": (
-        SAC("MlpPolicy", Environment.ServiceMeshEnv(action_type="continuous"), 
+        SAC("MlpPolicy", Environment.ServiceMeshEnv(action_type="continuous", normalization=normalization), 
             learning_rate=0.001, gamma=0.99, verbose=1), 
         "sac_service_mesh_model"
     )
@@ -68,10 +72,12 @@ for model_name, (model, model_path) in models.items():
     print(f"Training {model_name} model...")
     model.learn(total_timesteps=10000)
     model.save(model_path)
+    normalization.save(stats_path(model_path))
     print(f"Model {model_name} saved as {model_path}")
 
     # Test the model with matching environment
-    test_env = Environment.ServiceMeshEnv(action_type="discrete" if model_name in ["PPO", "A2C"] else "continuous")
+    test_env = Environment.ServiceMeshEnv(action_type="discrete" if model_name in ["PPO", "A2C"] else "continuous",
+                                          normalization=normalization)
     obs, info = test_env.reset()  # Initialize the test environment
     for _ in range(1000):
         action, _states = model.predict(obs, deterministic=True)
@@ -0,0 +1,273 @@
+import json
+import os
+import numpy as np
+
+# Transform applied to each metric before the min-max scaling
+TRANSFORMS = {
+    "cpu_quota_used_percent_avg": "minmax",
+    "net_http_request_time_max": "log_minmax",  # Latency spans orders of magnitude
+    "net_request_count_in_sum": "log_minmax",  # So does the request rate
+}
+
+
+def stats_path(model_path):
+    """
+    Path of the normalization statistics saved next to a model,
+    e.g. "ppo_service_mesh_model.zip" -> "ppo_service_mesh_model_norm.json".
+    """
+    if model_path.endswith(".zip"):
+        model_path = model_path[:-len(".zip")]
+    return model_path + "_norm.json"
+
+
+def load_for_model(model_path):
+    """
+    Load the normalization statistics saved next to a model.
+    :return: NormalizationStats, or None if the model was saved without them.
+    """
+    path = stats_path(model_path)
+    if not os.path.exists(path):
+        print(f"No normalization statistics found at {path}, the environment normalizes with its own data")
+        return None
+    return NormalizationStats.load(path)
+
+
+def load_metric_files(data_dir):
+    """
+    Load the raw metric CSVs of a dataset directory (one sub-directory per service).
+    The services and metrics come in os.listdir order, the order the environments have always been trained
+    with: statistics fitted on them record it as their layout, and the other readers follow that layout.
+    :return: Dictionary service -> metric name -> DataFrame sorted by timestamp.
+    """
+    import pandas as pd
+    service_data = {}
+    for service_name in os.listdir(data_dir):
+        service_path = os.path.join(data_dir, service_name)
+        if not os.path.isdir(service_path):
+            continue
+        service_data[service_name] = {}
+        for file in os.listdir(service_path):
+            if file.endswith(".csv"):
+                df = pd.read_csv(os.path.join(service_path, file))
+                service_data[service_name][file.replace(".csv", "")] = df.sort_values(by="timestamp").reset_index(drop=True)
+    return service_data
+
+
+def observation_vector(layout, latest_metrics):
+    """
+    Raw observation vector of live metrics.
+    :param layout: List of (service, metric name), the order of the vector.
+    :param latest_metrics: Latest raw values keyed by service, then by metric name. Missing values are NaN.
+    """
+    return np.array([latest_metrics.get(service, {}).get(metric_name, np.nan) for service, metric_name in layout],
+                    dtype=np.float64)
+
+
+def missing_entries(layout, latest_metrics):
+    """
+    :return: The (service, metric name) entries of layout without a finite value in latest_metrics, in layout order.
+    """
+    return [(service, metric_name) for service, metric_name in layout
+            if not np.isfinite(latest_metrics.get(service, {}).get(metric_name, np.nan))]
+
+
+class NormalizationStats:
+    def __init__(self, layout, transforms, minimum, maximum):
+        """
+        Normalization of the observation vector, fitted once on the training data and shared by the
+        training environment, the test environment and the live controller.
+
+        :param layout: List of (service, metric name), the order of the observation vector.
+        :param transforms: Transform of each entry ("minmax" or "log_minmax").
+        :param minimum: Minimum of each entry, in the transformed space.
+        :param maximum: Maximum of each entry, in the transformed space.
+        """
+        self.layout = [tuple(entry) for entry in layout]
+        self.transforms = list(transforms)
+        self.minimum = np.asarray(minimum, dtype=np.float64)
+        self.maximum = np.asarray(maximum, dtype=np.float64)
+        self.log_mask = np.array([transform == "log_minmax" for transform in self.transforms])
+        span = self.maximum - self.minimum
+        # A constant metric normalizes to 0
+        self.inv_span = np.divide(1.0, span, out=np.zeros_like(span), where=span > 0)
+        self.index = {entry: i for i, entry in enumerate(self.layout)}
+
+    @staticmethod
+    def _transform_values(values, transform):
+        values = np.asarray(values, dtype=np.float64)
+        if transform == "log_minmax":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = np.where(values > 0, np.log10(np.where(values > 0, values, 1.0)), np.nan)
+        return values
+
+    @classmethod
+    def fit(cls, service_data):
+        """
+        Compute the statistics of raw data.
+        :param service_data: Dictionary service -> metric name -> DataFrame with a "value" column (see load_metric_files).
+        """
+        layout, transforms, minimum, maximum = [], [], [], []
+        for service, metrics in service_data.items():
+            for metric_name, df in metrics.items():
+                transform = TRANSFORMS.get(metric_name, "minmax")
+                values = cls._transform_values(df["value"].to_numpy(), transform)
+                values = values[np.isfinite(values)]
+                layout.append((service, metric_name))
+                transforms.append(transform)
+                minimum.append(values.min() if values.size else 0.0)
+                maximum.append(values.max() if values.size else 0.0)
+        return cls(layout, transforms, minimum, maximum)
+
+    @classmethod
+    def from_dir(cls, data_dir):
+        return cls.fit(load_metric_files(data_dir))
+
+    def transform(self, values):
+        """
+        Normalize raw observation vectors into [0, 1].
+        :param values: Array of shape (..., len(layout)) in layout order. Missing values (NaN) normalize to 0.
+        :return: float32 array of the same shape.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = np.where(self.log_mask, np.log10(np.where(values > 0, values, np.nan)), values)
+        normalized = np.clip((values - self.minimum) * self.inv_span, 0.0, 1.0)
+        return np.nan_to_num(normalized, nan=0.0).astype(np.float32)
+
+    def transform_metric(self, service, metric_name, values):
+        """
+        Normalize the raw values of one (service, metric) entry.
+        :return: float32 array. Values that can not be transformed normalize to 0.
+        """
+        i = self.index[(service, metric_name)]
+        values = self._transform_values(values, self.transforms[i])
+        normalized = np.clip((values - self.minimum[i]) * self.inv_span[i], 0.0, 1.0)
+        return np.nan_to_num(normalized, nan=0.0).astype(np.float32)
+
+    def arrange(self, service_data):
+        """
+        Order loaded data like the observation vector the statistics were fitted on.
+        :param service_data: Dictionary service -> metric name -> DataFrame.
+        :return: Dictionary holding exactly the (service, metric) entries of layout, in layout order.
+        """
+        arranged = {}
+        for service, metric_name in self.layout:
+            if metric_name not in service_data.get(service, {}):
+                raise ValueError(f"No data for metric {metric_name} of service {service}.")
+            arranged.setdefault(service, {})[metric_name] = service_data[service][metric_name]
+        return arranged
+
+    def save(self, path):
+        with open(path, "w") as file:
+            json.dump({"layout": self.layout, "transforms": self.transforms,
+                       "min": self.minimum.tolist(), "max": self.maximum.tolist()}, file, indent=4)
+        print(f"Normalization statistics saved to {path}")
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as file:
+            data = json.load(file)
+        return cls(data["layout"], data["transforms"], data["min"], data["max"])
+
+
+class StreamingNormalizer:
+    def __init__(self, stats, half_life=2880, width=3.0, min_std=0.01):
+        """
+        Online min-max normalization of an unbounded stream of observation vectors, in O(1) per sample.
+
+        Starts from the training statistics and keeps, for every (service, metric) in the transformed space,
+        an exponentially weighted mean and variance and a min/max whose bounds relax towards the mean,
+        so old extremes are forgotten and the scaling follows the live traffic without keeping any history.
+        The scaling bounds always cover width standard deviations on each side of the mean, so steady traffic
+        does not collapse them onto the mean and stretch its noise over the whole [0, 1] range.
+
+        :param stats: NormalizationStats the stream starts from (layout, transforms and initial bounds).
+        :param half_life: Number of samples after which the weight of an old sample (or extreme) has halved.
+        :param width: Standard deviations the bounds keep on each side of the mean.
+        :param min_std: Lowest standard deviation, as a fraction of the training range, for a stream that does not vary.
+        """
+        self.layout = stats.layout
+        self.transforms = stats.transforms
+        self.log_mask = stats.log_mask
+        self.alpha = 1 - 0.5 ** (1.0 / half_life)
+        self.minimum = stats.minimum.copy()
+        self.maximum = stats.maximum.copy()
+        self.mean = (stats.minimum + stats.maximum) / 2
+        # Deviation at which the bounds of the first cycles are exactly the training range
+        self.var = ((stats.maximum - stats.minimum) / (2 * width)) ** 2
+        self.width = width
+        self.min_std = min_std * (stats.maximum - stats.minimum)
+        self.count = 0
+
+    def _transformed(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.log_mask, np.log10(np.where(values > 0, values, np.nan)), values)
+
+    def update(self, values):
+        """
+        Add one raw observation vector (layout order). Missing values (NaN) leave their entry unchanged.
+        """
+        x = self._transformed(values)
+        seen = np.isfinite(x)
+        x = np.where(seen, x, self.mean)
+        delta = x - self.mean
+        mean = self.mean + self.alpha * delta
+        var = (1 - self.alpha) * (self.var + self.alpha * delta ** 2)
+        # The bounds relax towards the mean, unless the new sample pushes them out
+        minimum = np.minimum(x, self.minimum + self.alpha * (mean - self.minimum))
+        maximum = np.maximum(x, self.maximum - self.alpha * (self.maximum - mean))
+        self.mean = np.where(seen, mean, self.mean)
+        self.var = np.where(seen, var, self.var)
+        self.minimum = np.where(seen, minimum, self.minimum)
+        self.maximum = np.where(seen, maximum, self.maximum)
+        self.count += 1
+
+    def transform(self, values):
+        """
+        Normalize raw observation vectors into [0, 1] with the current bounds.
+        :param values: Array of shape (..., len(layout)) in layout order. Missing values (NaN) normalize to 0.
+        """
+        lower, upper = self.bounds()
+        span = upper - lower
+        inv_span = np.divide(1.0, span, out=np.zeros_like(span), where=span > 0)
+        normalized = np.clip((self._transformed(values) - lower) * inv_span, 0.0, 1.0)
+        return np.nan_to_num(normalized, nan=0.0).astype(np.float32)
+
+    def std(self):
+        return np.maximum(np.sqrt(self.var), self.min_std)
+
+    def bounds(self):
+        """
+        :return: (lower, upper) bounds of the scaling: the relaxed min/max, widened to at least width standard
+                 deviations around the mean.
+        """
+        spread = self.width * self.std()
+        return np.minimum(self.minimum, self.mean - spread), np.maximum(self.maximum, self.mean + spread)
+
+    def to_stats(self):
+        """
+        :return: NormalizationStats with the current bounds, e.g. to save them with fine-tuned models.
+        """
+        return NormalizationStats(self.layout, self.transforms, *self.bounds())
+
+    def snapshot(self):
+        """
+        :return: JSON-serializable state of the normalizer.
+        """
+        return {"layout": self.layout, "transforms": self.transforms, "alpha": self.alpha, "count": self.count,
+                "min": self.minimum.tolist(), "max": self.maximum.tolist(),
+                "mean": self.mean.tolist(), "var": self.var.tolist()}
+
+    def restore(self, state):
+        """
+        Restore a state returned by snapshot(). The layout must match.
+        """
+        if [tuple(entry) for entry in state["layout"]] != self.layout:
+            raise ValueError("The snapshot was taken with a different observation layout.")
+        self.alpha = state["alpha"]
+        self.count = state["count"]
+        self.minimum = np.asarray(state["min"], dtype=np.float64)
+        self.maximum = np.asarray(state["max"], dtype=np.float64)
+        self.mean = np.asarray(state["mean"], dtype=np.float64)
+        self.var = np.asarray(state["var"], dtype=np.float64)
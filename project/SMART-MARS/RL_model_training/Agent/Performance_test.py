@@ -4,6 +4,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 from stable_baselines3 import PPO, DDPG, A2C  # Change this to the model you used
 import Environment_test as Environment  # Import your environment
+from Normalization import load_for_model
 
 # Step 1: Load the trained model
 MODEL_PATH = "ppo_service_mesh_model"  # Update with your saved model path
@@ -13,7 +14,8 @@ model = PPO.load(MODEL_PATH)
 # model = DDPG.load(MODEL_PATH)
 
 # Step 2: Initialize the environment
-env = Environment.ServiceMeshEnv(action_type="discrete")  # Match the environment used during training
+# Normalize with the statistics the model was trained with
+env = Environment.ServiceMeshEnv(action_type="discrete", normalization=load_for_model(MODEL_PATH))  # Match the environment used during training
 obs, info = env.reset()  # Get initial state
 
 # Step 3: Initialize logging for performance metrics
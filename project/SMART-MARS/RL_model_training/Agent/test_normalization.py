@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+import pytest
+
+from .Normalization import NormalizationStats, StreamingNormalizer
+
+LAYOUT = [("orders", "cpu_quota_used_percent_avg"), ("orders", "net_request_count_in_sum")]
+# Training range: 0-100 % CPU and 1-1000 requests (log10: 0-3)
+STATS = NormalizationStats(LAYOUT, ["minmax", "log_minmax"], [0.0, 0.0], [100.0, 3.0])
+HALF_LIFE = 50
+
+
+def streamed(samples, half_life=HALF_LIFE):
+    normalizer = StreamingNormalizer(STATS, half_life=half_life)
+    for sample in samples:
+        normalizer.update(sample)
+    return normalizer
+
+
+def test_starts_from_the_training_statistics():
+    normalizer = StreamingNormalizer(STATS)
+    values = [[0, 1], [50, 10 ** 1.5], [100, 1000]]
+    np.testing.assert_allclose(normalizer.transform(values), STATS.transform(values), atol=1e-6)
+
+
+def test_bounds_follow_the_live_traffic():
+    rng = np.random.default_rng(0)
+    # Live traffic around 20 % CPU and 100 requests, much narrower than the training range
+    samples = np.column_stack([rng.normal(20, 2, 2000), 10 ** rng.normal(2, 0.05, 2000)])
+    normalizer = streamed(samples)
+    lower, upper = normalizer.bounds()
+    assert abs(normalizer.mean[0] - 20) < 1 and abs(normalizer.mean[1] - 2) < 0.05
+    np.testing.assert_allclose(normalizer.std(), [2, 0.05], rtol=0.3)
+    # The old extremes are forgotten, the bounds keep width deviations around the mean
+    assert upper[0] < 40 and lower[0] > 0
+    assert upper[0] - lower[0] >= 2 * normalizer.width * normalizer.std()[0] - 1e-9
+    normalized = normalizer.transform(samples[-100:])
+    assert normalized.min() >= 0 and normalized.max() <= 1
+    assert 0.3 < normalized[:, 0].mean() < 0.7
+
+
+def test_steady_traffic_keeps_a_minimum_spread():
+    normalizer = streamed([[30, 100]] * 1000)
+    lower, upper = normalizer.bounds()
+    # Bounds never collapse onto a constant stream
+    np.testing.assert_allclose(upper - lower, 2 * normalizer.width * normalizer.min_std)
+    assert normalizer.transform([[30, 100]])[0] == pytest.approx([0.5, 0.5], abs=1e-4)
+
+
+def test_missing_values_leave_their_entry_unchanged():
+    normalizer = streamed([[60, 100]] * 10)
+    mean, minimum, maximum = normalizer.mean.copy(), normalizer.minimum.copy(), normalizer.maximum.copy()
+    normalizer.update([np.nan, 1000])
+    assert normalizer.mean[0] == mean[0] and normalizer.minimum[0] == minimum[0] and normalizer.maximum[0] == maximum[0]
+    assert normalizer.mean[1] > mean[1]
+    assert normalizer.transform([[np.nan, 100]])[0][0] == 0
+
+
+def test_snapshot_restore(tmp_path):
+    normalizer = streamed(np.random.default_rng(1).uniform([0, 1], [100, 1000], (300, 2)))
+    path = tmp_path / "normalizer.json"
+    path.write_text(json.dumps(normalizer.snapshot()))
+
+    restored = StreamingNormalizer(STATS)
+    restored.restore(json.loads(path.read_text()))
+    assert restored.count == normalizer.count
+    values = [[10, 5], [90, 500]]
+    np.testing.assert_array_equal(restored.transform(values), normalizer.transform(values))
+    # Both keep streaming the same way
+    normalizer.update([70, 50])
+    restored.update([70, 50])
+    np.testing.assert_array_equal(restored.bounds(), normalizer.bounds())
+    np.testing.assert_array_equal(restored.to_stats().maximum, normalizer.bounds()[1])
+
+    other = StreamingNormalizer(NormalizationStats(LAYOUT[::-1], ["log_minmax", "minmax"], [0, 0], [3, 100]))
+    with pytest.raises(ValueError):
+        other.restore(normalizer.snapshot())
@@ -0,0 +1,262 @@
+import asyncio
+import signal
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import checkpoint
+import global_var as gv
+import instrumentation as metrics
+import main as controller
+
+# ModelManager of a model worker process, created by _init_model_worker
+_manager = None
+
+
+def _init_model_worker(model_path):
+    global _manager
+    from model_manager import ModelManager
+    _manager = ModelManager(model_path)
+
+
+def _update_normalization(live_metrics):
+    _manager.update_normalization(live_metrics)
+
+
+def _decide(live_metrics, forecasts, train_steps):
+    """
+    Run in the model process: pick the action with the models and fine-tune them.
+    :return: (action, weights to apply, time spent in each stage)
+    """
+    timings = {}
+    action = controller.get_action_from_models(_manager, live_metrics, forecasts, train_steps, timings)
+    return action, controller.weights_from_env(_manager.env), timings
+
+
+def _train_updates():
+    return _manager.train_updates
+
+
+def _snapshot():
+    return _manager.snapshot()
+
+
+def _restore(state):
+    _manager.restore(state)
+
+
+def _save_models(path):
+    _manager.save_models(path)
+
+
+class ModelProcess:
+    def __init__(self, pool, model_path):
+        """
+        Stand-in for the ModelManager of the model process, as seen by the Checkpointer. Each call is a job of
+        the process, so it runs after the decisions already submitted and sees the state they left.
+
+        :param pool: Single-process pool holding the ModelManager.
+        :param model_path: Directory the models were loaded from.
+        """
+        self.pool = pool
+        self.base_model_path = model_path
+
+    def _call(self, function, *args):
+        return self.pool.submit(function, *args).result()
+
+    @property
+    def train_updates(self):
+        return self._call(_train_updates)
+
+    def snapshot(self):
+        return self._call(_snapshot)
+
+    def restore(self, state):
+        self._call(_restore, state)
+
+    def save_models(self, path):
+        self._call(_save_models, path)
+
+
+class AsyncController:
+    def __init__(self, scenario_monitor, data_processor, scenario_manager, executor, load_forecaster,
+                 model_path=gv.MODEL_PATH, train_steps=10, io_workers=8, checkpoint_path=gv.CHECKPOINT_PATH,
+                 checkpoint_state=None):
+        """
+        MAPE-K loop where monitoring, analysis, inference and actuation are asyncio tasks connected by queues.
+
+        Blocking calls (metric queries, file writes, oc) run in a thread pool and the RL models live in a
+        separate process, so the metrics of cycle N+1 are fetched while cycle N is still deciding or acting.
+        Each queue holds a single cycle: when a stage falls behind, the stale cycle is replaced by the newest.
+
+        :param scenario_monitor: ScenarioMonitor fetching the metrics.
+        :param data_processor: DataProcessor turning the fetched windows into per-service frames.
+        :param scenario_manager: ScenarioManager deciding whether an adaptation is needed.
+        :param executor: Executor applying the weights.
+        :param load_forecaster: LoadForecaster fed with the request counts.
+        :param model_path: Base directory of the RL models, loaded by the model process.
+        :param train_steps: Fine-tuning steps per decision.
+        :param io_workers: Threads available for blocking I/O.
+        :param checkpoint_path: File of the controller snapshots, "" to not checkpoint.
+        :param checkpoint_state: Snapshot to restore (see checkpoint.read_recent), None to start fresh.
+        """
+        self.scenario_monitor = scenario_monitor
+        self.data_processor = data_processor
+        self.scenario_manager = scenario_manager
+        self.executor = executor
+        self.load_forecaster = load_forecaster
+        self.train_steps = train_steps
+        self.recent_loads_dict = defaultdict(lambda: deque(maxlen=30))
+
+        # Cycles on the clock of the metrics source, a replay runs faster than real time
+        self.scheduler = scenario_monitor.source.scheduler(gv.SLEEP, gv.SAMPLING)
+        self.io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="smart-mars-io")
+        # A single model process keeps the environment state consistent between decisions
+        self.model_pool = ProcessPoolExecutor(max_workers=1, initializer=_init_model_worker, initargs=(model_path,))
+
+        self.analysis_queue = asyncio.Queue(maxsize=1)
+        self.decision_queue = asyncio.Queue(maxsize=1)
+        self.actuation_queue = asyncio.Queue(maxsize=1)
+        # Cycles started and not finished yet, the end of a replay waits for them
+        self.in_flight = 0
+        self.drained = asyncio.Event()
+        self.drained.set()
+
+        self.checkpointer = None
+        if checkpoint_path:
+            self.checkpointer = checkpoint.Checkpointer(checkpoint_path, gv.CHECKPOINT_EVERY, scenario_monitor,
+                                                        data_processor, scenario_manager,
+                                                        ModelProcess(self.model_pool, model_path),
+                                                        self.recent_loads_dict, load_forecaster,
+                                                        models_dir=gv.CHECKPOINT_MODELS_DIR,
+                                                        max_age=gv.CHECKPOINT_MAX_AGE)
+            if checkpoint_state is not None:
+                self.checkpointer.restore(checkpoint_state)
+
+    async def _io(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.io_pool, function, *args)
+
+    def _put_latest(self, queue, item):
+        if queue.full():
+            dropped_tick = queue.get_nowait()[0]
+            print("Dropping a stale cycle, the next stage is still busy")
+            # The dropped cycle ends here, as if it had been skipped
+            self._finish(dropped_tick)
+        queue.put_nowait(item)
+
+    def _finish(self, tick):
+        self.scheduler.finish(tick)
+        self.in_flight -= 1
+        if self.in_flight == 0:
+            self.drained.set()
+        metrics.record_cycle(time.time() - tick.started, gv.SLEEP)
+        if gv.METRICS_DUMP:
+            metrics.REGISTRY.dump_json(gv.METRICS_DUMP)
+        if self.checkpointer is not None:
+            # In a thread, a snapshot waits for the model process
+            asyncio.get_running_loop().run_in_executor(self.io_pool, self.checkpointer.after_cycle)
+
+    async def monitor(self):
+        while True:
+            tick = await self.scheduler.wait_async()
+            self.in_flight += 1
+            self.drained.clear()
+            try:
+                with metrics.stage("fetch"):
+                    await asyncio.gather(
+                        *(self._io(self.scenario_monitor.fetch_data_from_ibm, id, "avg") for id in controller.AVG_METRIC_IDS),
+                        *(self._io(self.scenario_monitor.fetch_data_from_ibm, id, "sum") for id in controller.SUM_METRIC_IDS),
+                        *(self._io(self.scenario_monitor.fetch_data_from_ibm, id, "max") for id in controller.MAX_METRIC_IDS))
+                print(f"Pulling metrics from {gv.METRICS_SOURCE}")
+                with metrics.stage("process"):
+                    service_data = await self._io(self.data_processor.process_data, gv.CREATE_NEW_FILE)
+                    # The next fetch writes into the store while this cycle is analyzed, so keep a copy
+                    service_data = service_data.copy()
+                    processed_service_data = controller.adapt_data_to_scenario_manager(service_data)
+                    live_metrics = controller.latest_metrics(service_data)
+                # The model process runs its jobs in order, so this update is seen by the next decision
+                self.model_pool.submit(_update_normalization, live_metrics)
+            except Exception as e:
+                print(f"Monitoring failed: {e}")
+                self._finish(tick)
+            else:
+                self._put_latest(self.analysis_queue, (tick, processed_service_data, live_metrics))
+            # A replay stops after the cycle that saw its last sample
+            if self.scenario_monitor.source.finished(tick.scheduled):
+                return
+
+    async def analyze(self):
+        while True:
+            tick, processed_service_data, live_metrics = await self.analysis_queue.get()
+            try:
+                with metrics.stage("analyze"):
+                    detect_scenario = await self._io(controller.analyze_scenario, self.scenario_manager,
+                                                     processed_service_data, self.recent_loads_dict, self.load_forecaster)
+            except Exception as e:
+                print(f"Analysis failed: {e}")
+                detect_scenario = False
+            if not detect_scenario:
+                self._finish(tick)
+                continue
+            forecasts = {service: self.load_forecaster.peak(service) for service in processed_service_data}
+            self._put_latest(self.decision_queue, (tick, live_metrics, forecasts))
+
+    async def decide(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            tick, live_metrics, forecasts = await self.decision_queue.get()
+            try:
+                train_steps = self.train_steps
+                if train_steps > 0 and not tick.allows("train", metrics.STAGE_LATENCY.mean(stage="train")):
+                    train_steps = 0
+                action, weights, timings = await loop.run_in_executor(self.model_pool, _decide, live_metrics, forecasts, train_steps)
+            except Exception as e:
+                metrics.FAILURES.inc(stage="predict")
+                print(f"Decision failed: {e}")
+                self._finish(tick)
+                continue
+            # The stages ran in the model process, record their latency here
+            for stage, seconds in timings.items():
+                metrics.STAGE_LATENCY.observe(seconds, stage=stage)
+            print("Action is", action)
+            self._put_latest(self.actuation_queue, (tick, action, weights))
+
+    async def actuate(self):
+        while True:
+            tick, action, weights = await self.actuation_queue.get()
+            metrics.DECISIONS.inc()
+            try:
+                if weights == self.executor.current_weights():
+                    metrics.NOOP_APPLIES.inc()
+                    print(f"Weights are already {weights}, nothing to apply")
+                else:
+                    with metrics.stage("apply"):
+                        self.executor.update_weights(weights)
+                        await self._io(self.executor.save_and_apply)
+            except Exception as e:
+                print(f"Actuation failed: {e}")
+            self._finish(tick)
+
+    async def run(self):
+        """
+        Run the four stages until cancelled, or until the end of a replay.
+        """
+        # A rescheduled pod gets SIGTERM: stop the stages and checkpoint the last state
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        tasks = [asyncio.create_task(stage()) for stage in (self.monitor, self.analyze, self.decide, self.actuate)]
+        try:
+            # Only the monitor returns, after the last cycle of a replay
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                if task.done() and task.exception() is not None:
+                    raise task.exception()
+            # Let the cycles still in the pipeline reach the executor before stopping the stages
+            await self.drained.wait()
+            print("Reached the end of the replayed data")
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self.checkpointer is not None:
+                self.checkpointer.save()
+            self.io_pool.shutdown(wait=False, cancel_futures=True)
+            self.model_pool.shutdown(wait=False, cancel_futures=True)
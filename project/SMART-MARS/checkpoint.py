@@ -0,0 +1,175 @@
+import os
+import pickle
+import tempfile
+import time
+
+import instrumentation as metrics
+
+# Bumped when the layout of the snapshot changes, older checkpoints are then ignored
+CHECKPOINT_VERSION = 1
+MODEL_NAMES = ("sac", "ppo", "ddpg", "a2c")
+
+
+def write_atomic(path, state):
+    """
+    Pickle state to path. The file is written next to path, flushed to disk and renamed over path,
+    so a crash during the write leaves the previous checkpoint intact.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".checkpoint_", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def read(path):
+    """
+    :return: The state pickled at path, or None if there is no usable checkpoint.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as file:
+            state = pickle.load(file)
+    except Exception as e:
+        print(f"Ignoring unreadable checkpoint {path}: {e}")
+        return None
+    if state.get("version") != CHECKPOINT_VERSION:
+        print(f"Ignoring checkpoint {path} written by another version ({state.get('version')}).")
+        return None
+    return state
+
+
+def read_recent(path, max_age):
+    """
+    :param max_age: A snapshot older than this many seconds is ignored, 0 for no limit.
+    :return: The state pickled at path, or None if there is no usable checkpoint or it is too old.
+    """
+    state = read(path)
+    if state is None:
+        return None
+    age = time.time() - state["saved_at"]
+    if max_age and age > max_age:
+        print(f"Not restoring {path}: it is {age:.0f} s old.")
+        return None
+    return state
+
+
+def model_path_for_restart(state, models_dir, default):
+    """
+    The fine-tuned models and the controller state are restored together or not at all: the models are only
+    loaded with the snapshot that was saved after them.
+
+    :param state: Snapshot about to be restored (see read_recent), None if there is none.
+    :return: models_dir if the snapshot refers to a checkpoint of every model there, else default.
+    """
+    if state is None or not models_dir or state.get("models_saved_at") is None:
+        return default
+    if not all(os.path.exists(f"{models_dir}/{name}_service_mesh_model.zip") for name in MODEL_NAMES):
+        print(f"Not loading the models checkpointed in {models_dir}: some of them are missing.")
+        return default
+    print(f"Loading the fine-tuned models checkpointed in {models_dir}.")
+    return models_dir
+
+
+class Checkpointer:
+    def __init__(self, path, every, scenario_monitor, data_processor, scenario_manager, model_manager,
+                 recent_loads_dict, load_forecaster, models_dir=None, max_age=3600):
+        """
+        Periodically snapshot the in-memory state of the controller, so a restarted controller resumes
+        adapting right away instead of warming up its EMA, variance, forecasts and metric windows again.
+
+        :param path: File of the snapshot.
+        :param every: Number of cycles between two snapshots.
+        :param scenario_monitor: ScenarioMonitor whose cached metric windows are kept.
+        :param data_processor: DataProcessor whose CSV positions are kept.
+        :param scenario_manager: ScenarioManager whose EMA is kept.
+        :param model_manager: ModelManager whose normalization and environment state are kept.
+        :param recent_loads_dict: Recent combined loads of each service.
+        :param load_forecaster: LoadForecaster whose forecasters are kept.
+        :param models_dir: Directory the fine-tuned models are saved to, None to never save them.
+        :param max_age: A snapshot older than this many seconds is not restored, the state it holds is outdated.
+        """
+        self.path = path
+        self.every = every
+        self.scenario_monitor = scenario_monitor
+        self.data_processor = data_processor
+        self.scenario_manager = scenario_manager
+        self.model_manager = model_manager
+        self.recent_loads_dict = recent_loads_dict
+        self.load_forecaster = load_forecaster
+        self.models_dir = models_dir
+        self.max_age = max_age
+        self.cycles = 0
+        self.saved_train_updates = model_manager.train_updates
+        self.models_saved_at = None  # Time the models in models_dir were saved, None if they are not the loaded ones
+
+    def snapshot(self):
+        return {
+            "version": CHECKPOINT_VERSION,
+            "saved_at": time.time(),
+            "store": self.scenario_monitor.cache.store.snapshot(),
+            "recorded": dict(self.data_processor.recorded),
+            "scenario_manager": self.scenario_manager.snapshot(),
+            "recent_loads": {service: list(loads) for service, loads in self.recent_loads_dict.items()},
+            "load_forecaster": self.load_forecaster.snapshot(),
+            "model_manager": self.model_manager.snapshot(),
+            "models_saved_at": self.models_saved_at,
+        }
+
+    def save(self):
+        """
+        Write a snapshot, and the models if they were fine-tuned since the last save.
+        """
+        with metrics.stage("checkpoint"):
+            # The models first, so a snapshot never refers to models that are not on disk yet
+            if self.models_dir and self.model_manager.train_updates != self.saved_train_updates:
+                self.model_manager.save_models(self.models_dir)
+                self.saved_train_updates = self.model_manager.train_updates
+                self.models_saved_at = time.time()
+            write_atomic(self.path, self.snapshot())
+        print(f"Controller state checkpointed to {self.path}")
+
+    def after_cycle(self):
+        """
+        Count a cycle and save a snapshot every `every` cycles.
+        """
+        self.cycles += 1
+        if self.every and self.cycles % self.every == 0:
+            try:
+                self.save()
+            except Exception as e:
+                print(f"Checkpoint failed: {e}")
+
+    def restore(self, state=None):
+        """
+        Restore the last snapshot, if there is a recent one.
+        :param state: Snapshot already read with read_recent (the one the models were picked with), read by default.
+        :return: True if the state was restored.
+        """
+        if state is None:
+            state = read_recent(self.path, self.max_age)
+        if state is None:
+            return False
+        age = time.time() - state["saved_at"]
+        self.scenario_monitor.cache.store.restore(state["store"])
+        self.data_processor.recorded.update(state["recorded"])
+        self.scenario_manager.restore(state["scenario_manager"])
+        for service, loads in state["recent_loads"].items():
+            self.recent_loads_dict[service].clear()
+            self.recent_loads_dict[service].extend(loads)
+        self.load_forecaster.restore(state["load_forecaster"])
+        self.model_manager.restore(state["model_manager"])
+        # Until the next fine-tuning, the next snapshots refer to the same models
+        if self.models_dir and os.path.abspath(self.model_manager.base_model_path) == os.path.abspath(self.models_dir):
+            self.models_saved_at = state.get("models_saved_at")
+        print(f"Controller state restored from {self.path} ({age:.0f} s old).")
+        return True
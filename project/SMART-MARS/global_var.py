@@ -2,8 +2,27 @@ URL = "https://ca-tor.monitoring.cloud.ibm.com"
 APIKEY = "E5wgqSh1yPF_s_0NSLPF94zSA3mK2fx1go3GUQqxbFde"
 GUID = "3fed93bc-00f4-4651-8ce2-e73ba4b9a918"
 MODEL_PATH = "RL_model_training/Agent"
+NAMESPACE = "group-4"
+# Where metrics come from: "sysdig" (IBM Cloud Monitoring), "prometheus", "harness" (local stand-ins) or "replay" (recorded datasets)
+METRICS_SOURCE = "sysdig"
+PROMETHEUS_URL = "http://istio-ingressgateway-istio-system.mycluster-ca-tor-2-bx2-4x-04e8c71ff333c8969bc4cbc5a77a70f6-0000.ca-tor.containers.appdomain.cloud/prometheus"
+HARNESS_URL = "http://127.0.0.1:8090"  # Metrics endpoint of Harness/harness.py
+REPLAY_DIR = "datasets"
+REPLAY_SPEEDUP = 100
+DATA_DIR = "datasets"
+REPLAY_OUTPUT_DIR = "datasets_replay"  # Keeps a replay from overwriting the recorded datasets
 SLEEP = 30
 DURATION = 60
+SAMPLING = 10
+FORECAST_CYCLES = 2  # How many control cycles ahead the load is forecasted
+NORMALIZATION_HALF_LIFE = 2880  # Cycles (one day at SLEEP = 30) after which old live samples weigh half, 0 keeps the training statistics
+CHECKPOINT_PATH = "checkpoint/controller_state.pkl"  # Snapshot of the controller state restored at startup, "" disables it
+CHECKPOINT_EVERY = 10  # Cycles between two snapshots
+CHECKPOINT_MODELS_DIR = "checkpoint/models"  # Fine-tuned models are saved here with the snapshots, "" disables it
+CHECKPOINT_MAX_AGE = 3600  # Seconds after which a snapshot is too old to be restored
+METRICS_PORT = 9109  # Port of the controller's own /metrics endpoint, 0 disables it
+METRICS_DUMP = "controller_metrics.json"  # JSON dump of the controller metrics after each cycle, "" disables it
+APPLIED_WEIGHTS_LOG = "applied_weights.csv"  # Timestamped weights appended on each apply, for Graph/correlate.py, "" disables it
 SERVICE_TO_USE = [
     'orders',
     'payments',
@@ -11,4 +30,10 @@ SERVICE_TO_USE = [
     'recommendations-food'
 ]
 CREATE_NEW_FILE = True
-JSON_FILE = "../service-mesh/virtual-service-food.json"
\ No newline at end of file
+JSON_FILE = "../service-mesh/virtual-service-food.json"
+APPLY_COMMAND = ["oc", "apply", "-f"]  # Applies JSON_FILE after an update, [] only writes it (the local harness reloads it)
+# Namespaces managed by the sharded controller (sharding.py), each with its services and virtual service
+TENANTS = [
+    {"namespace": NAMESPACE, "services": SERVICE_TO_USE, "virtual_service": JSON_FILE}
+]
+SHARDS = 0  # Number of shard processes, 0 uses one per core
\ No newline at end of file
@@ -0,0 +1,288 @@
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from a fast cache hit to a slow fine-tuning run
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    escaped = ((name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        """
+        Monotonic counter, optionally split by labels.
+
+        :param name: Metric name in the Prometheus exposition.
+        :param help_text: Description shown in the HELP line.
+        """
+        self.name = name
+        self.help = help_text
+        self.kind = "counter"
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def to_dict(self):
+        with self._lock:
+            return {_format_labels(key) or "total": value for key, value in self._values.items()}
+
+
+class Gauge(Counter):
+    def __init__(self, name, help_text):
+        """
+        Value that can go up and down, optionally split by labels.
+        """
+        super().__init__(name, help_text)
+        self.kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        """
+        Cumulative histogram with fixed bucket bounds, optionally split by labels.
+
+        :param name: Metric name in the Prometheus exposition.
+        :param help_text: Description shown in the HELP line.
+        :param buckets: Sorted upper bounds of the buckets (an implicit +Inf bucket is added).
+        """
+        self.name = name
+        self.help = help_text
+        self.kind = "histogram"
+        self.buckets = tuple(buckets)
+        self._series = {}  # label key -> [bucket counts, sum, count, max]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0.0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+            series[3] = max(series[3], value)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the time spent in the block, in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return series[2] if series else 0
+
+    def mean(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return series[1] / series[2] if series else 0.0
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count, _) in self._series.items():
+                cumulative = 0
+                for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    samples.append((f"{self.name}_bucket", key + (("le", le),), cumulative))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, count))
+        return samples
+
+    def to_dict(self):
+        with self._lock:
+            return {_format_labels(key) or "total": {"count": count, "sum": total, "max": peak,
+                                                     "mean": total / count if count else 0.0}
+                    for key, (_, total, count, peak) in self._series.items()}
+
+
+class Registry:
+    def __init__(self, prefix="smart_mars"):
+        """
+        Collection of the controller metrics, rendered in the Prometheus text format or as JSON.
+
+        :param prefix: Prefix added to every metric name.
+        """
+        self.prefix = prefix
+        self.metrics = {}
+        self.server = None
+
+    def _register(self, cls, name, help_text, *args):
+        full_name = f"{self.prefix}_{name}" if self.prefix else name
+        if full_name not in self.metrics:
+            self.metrics[full_name] = cls(full_name, help_text, *args)
+        return self.metrics[full_name]
+
+    def counter(self, name, help_text):
+        return self._register(Counter, name, help_text)
+
+    def gauge(self, name, help_text):
+        return self._register(Gauge, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, buckets)
+
+    def render_prometheus(self):
+        """
+        :return: All metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        return {name: metric.to_dict() for name, metric in self.metrics.items()}
+
+    def dump_json(self, path):
+        """
+        Write the current value of every metric to a JSON file.
+        """
+        with open(path, 'w') as file:
+            json.dump({"timestamp": time.time(), "metrics": self.to_dict()}, file, indent=4)
+
+    def start_http_server(self, port, host="127.0.0.1"):
+        """
+        Serve /metrics (Prometheus text format) and /metrics.json from a daemon thread.
+
+        :param port: Port to listen on.
+        :param host: Interface to bind, local only by default.
+        :return: The running HTTP server.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = registry.render_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(registry.to_dict()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Serving controller metrics on http://{host}:{port}/metrics")
+        return self.server
+
+
+# Metrics of the SMART-MARS controller
+REGISTRY = Registry()
+STAGE_LATENCY = REGISTRY.histogram("stage_duration_seconds", "Time spent in each MAPE-K stage per cycle.")
+CYCLE_LATENCY = REGISTRY.histogram("cycle_duration_seconds", "Time spent in a whole MAPE-K cycle.")
+CYCLE_BUDGET = REGISTRY.gauge("cycle_budget_ratio", "Share of the cycle interval spent by the last cycle.")
+INFERENCE_LATENCY = REGISTRY.histogram("model_inference_seconds", "Prediction latency of each RL model.")
+CYCLES = REGISTRY.counter("cycles_total", "Number of MAPE-K cycles run.")
+DECISIONS = REGISTRY.counter("decisions_total", "Number of adaptations decided by the models.")
+NOOP_APPLIES = REGISTRY.counter("noop_applies_total", "Number of decisions that left the weights unchanged.")
+FAILURES = REGISTRY.counter("failures_total", "Number of exceptions raised, by stage.")
+SCHEDULE_JITTER = REGISTRY.histogram("schedule_jitter_seconds", "Delay between the scheduled and the actual start of a cycle.",
+                                     (0.0001, 0.001, 0.01, 0.05, 0.1, 0.5, 1, 5))
+OVERRUNS = REGISTRY.counter("overruns_total", "Number of cycles that ran past the next tick.")
+SKIPPED_TICKS = REGISTRY.counter("skipped_ticks_total", "Number of ticks skipped after an overrun.")
+SHED_STAGES = REGISTRY.counter("shed_stages_total", "Number of optional stages skipped to stay within the cycle, by stage.")
+STARTUP = REGISTRY.gauge("startup_seconds", "Time spent in each startup phase of the controller.")
+
+
+@contextmanager
+def stage(name, timings=None):
+    """
+    Time a MAPE-K stage: the duration is observed in STAGE_LATENCY and, if timings is a dictionary,
+    added to timings[name] (in seconds). An exception raised in the block is counted in FAILURES.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        FAILURES.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(elapsed, stage=name)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+@contextmanager
+def startup_phase(name):
+    """
+    Time a startup phase of the controller into STARTUP.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP.set(time.perf_counter() - start, phase=name)
+
+
+def record_cycle(elapsed, interval):
+    """
+    Record the duration of a whole MAPE-K cycle and which share of the cycle interval it used.
+
+    :param elapsed: Duration of the cycle in seconds.
+    :param interval: Time between two cycles in seconds (gv.SLEEP).
+    """
+    CYCLES.inc()
+    CYCLE_LATENCY.observe(elapsed)
+    CYCLE_BUDGET.set(elapsed / interval if interval else 0.0)
+
+
+@contextmanager
+def cycle(interval):
+    """
+    Time a whole MAPE-K cycle, see record_cycle().
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_cycle(time.perf_counter() - start, interval)
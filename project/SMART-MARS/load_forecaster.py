@@ -0,0 +1,214 @@
+from collections import deque
+import numpy as np
+
+
+class HoltWintersForecaster:
+    def __init__(self, alpha=0.5, beta=0.1, gamma=0.3, history=360, min_period=3, max_period=60,
+                 detect_every=30, power_ratio=0.3):
+        """
+        Online additive Holt-Winters forecaster for the request count of one service.
+        The season length is detected from the recent history with an FFT and re-checked periodically.
+        Until a season is found the forecaster falls back to Holt's linear trend.
+
+        :param alpha: Smoothing factor of the level (0 < alpha <= 1)
+        :param beta: Smoothing factor of the trend (0 <= beta <= 1)
+        :param gamma: Smoothing factor of the seasonal components (0 <= gamma <= 1)
+        :param history: Number of recent samples kept for season detection
+        :param min_period: Shortest season (in samples) that can be detected
+        :param max_period: Longest season (in samples) that can be detected
+        :param detect_every: Number of updates between two season detections
+        :param power_ratio: Minimum share of the spectrum power the dominant frequency needs to count as a season
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.min_period = min_period
+        self.max_period = max_period
+        self.detect_every = detect_every
+        self.power_ratio = power_ratio
+        self.history = deque(maxlen=history)
+
+        self.level = None
+        self.trend = 0.0
+        self.season_length = None
+        self.seasonal = None
+        self.n_updates = 0
+
+    def detect_season(self):
+        """
+        Detect the dominant period of the history with an FFT.
+        :return: Season length in samples, or None if the series has no clear season
+        """
+        n = len(self.history)
+        if n < 2 * self.min_period:
+            return None
+        values = np.asarray(self.history, dtype=np.float64)
+        power = np.abs(np.fft.rfft(values - values.mean())) ** 2
+        power[0] = 0
+        total = power.sum()
+        if total <= 0:
+            return None
+
+        freqs = np.fft.rfftfreq(n)
+        # Only accept periods that fit at least twice in the history
+        valid = (freqs > 0) & (freqs <= 1.0 / self.min_period) & (freqs >= max(1.0 / self.max_period, 2.0 / n))
+        if not valid.any():
+            return None
+        idx = np.flatnonzero(valid)[np.argmax(power[valid])]
+        if power[idx] / total < self.power_ratio:
+            return None
+        # The frequencies of the FFT are 1 / n apart, so its period is only exact when the history holds a whole
+        # number of seasons: take the period between the neighbouring frequencies where the series best matches itself
+        centered = values - values.mean()
+        low = max(int(1.0 / freqs[idx + 1]) if idx + 1 < len(freqs) else self.min_period, self.min_period)
+        high = min(int(np.ceil(1.0 / freqs[idx - 1])) if idx > 1 else n // 2, self.max_period, n // 2)
+        periods = np.arange(low, max(high, low) + 1)
+        scores = [np.dot(centered[:-period], centered[period:]) / (n - period) for period in periods]
+        return int(periods[np.argmax(scores)])
+
+    def _init_season(self, season_length):
+        """
+        (Re)initialize level, trend and seasonal components from the last two seasons of history.
+        """
+        values = np.asarray(self.history, dtype=np.float64)[-2 * season_length:]
+        first, second = values[:season_length], values[season_length:]
+        self.season_length = season_length
+        self.level = second.mean()
+        self.trend = (second.mean() - first.mean()) / season_length
+        self.seasonal = deque(((first - first.mean()) + (second - second.mean())) / 2, maxlen=season_length)
+
+    def update(self, value):
+        """
+        Add a new sample and update the smoothed components in O(1).
+        :param value: Latest request count
+        """
+        value = float(value)
+        self.history.append(value)
+        self.n_updates += 1
+
+        if self.n_updates % self.detect_every == 0:
+            season_length = self.detect_season()
+            if season_length != self.season_length:
+                if season_length is None:
+                    self.season_length = None
+                    self.seasonal = None
+                else:
+                    self._init_season(season_length)
+                return
+
+        if self.level is None:
+            self.level = value
+            return
+
+        last_level = self.level
+        if self.seasonal is None:
+            self.level = self.alpha * value + (1 - self.alpha) * (self.level + self.trend)
+            self.trend = self.beta * (self.level - last_level) + (1 - self.beta) * self.trend
+        else:
+            season = self.seasonal[0]
+            self.level = self.alpha * (value - season) + (1 - self.alpha) * (self.level + self.trend)
+            self.trend = self.beta * (self.level - last_level) + (1 - self.beta) * self.trend
+            # Rotating the deque keeps the component of the next sample at index 0
+            self.seasonal.append(self.gamma * (value - self.level) + (1 - self.gamma) * season)
+
+    def snapshot(self):
+        """
+        :return: Picklable state of the forecaster.
+        """
+        return {"history": list(self.history), "level": self.level, "trend": self.trend,
+                "season_length": self.season_length,
+                "seasonal": None if self.seasonal is None else list(self.seasonal), "n_updates": self.n_updates}
+
+    def restore(self, state):
+        """
+        Restore a state returned by snapshot().
+        """
+        self.history = deque(state["history"], maxlen=self.history.maxlen)
+        self.level = state["level"]
+        self.trend = state["trend"]
+        self.season_length = state["season_length"]
+        self.seasonal = None if state["seasonal"] is None else deque(state["seasonal"], maxlen=self.season_length)
+        self.n_updates = state["n_updates"]
+
+    def forecast(self, steps=1):
+        """
+        Forecast the next samples.
+        :param steps: Number of samples ahead
+        :return: numpy array with the forecast for 1..steps samples ahead (empty if no data was seen)
+        """
+        if self.level is None:
+            return np.zeros(0)
+        horizon = np.arange(1, steps + 1)
+        forecast = self.level + horizon * self.trend
+        if self.seasonal is not None:
+            seasonal = np.asarray(self.seasonal)
+            forecast = forecast + seasonal[(horizon - 1) % self.season_length]
+        # A request count can not be negative
+        return np.maximum(forecast, 0)
+
+
+class LoadForecaster:
+    def __init__(self, horizon=6, **kwargs):
+        """
+        Keep one Holt-Winters forecaster per service and feed it with the request count series.
+
+        :param horizon: Number of samples to forecast ahead
+        :param kwargs: Parameters passed to each HoltWintersForecaster
+        """
+        self.horizon = horizon
+        self.kwargs = kwargs
+        self.forecasters = {}
+        self.last_timestamp = {}
+
+    def update(self, service, timestamps, values):
+        """
+        Feed the samples of a service. Samples that were already seen (by timestamp) are skipped,
+        so overlapping monitoring windows can be passed as they are.
+
+        :param service: Service name
+        :param timestamps: Timestamps of the samples, sorted ascending
+        :param values: Request counts of the samples
+        """
+        forecaster = self.forecasters.get(service)
+        if forecaster is None:
+            forecaster = self.forecasters[service] = HoltWintersForecaster(**self.kwargs)
+        last = self.last_timestamp.get(service)
+        for timestamp, value in zip(timestamps, values):
+            if (last is not None and timestamp <= last) or value != value:  # skip seen and NaN samples
+                continue
+            forecaster.update(value)
+            last = timestamp
+        if last is not None:
+            self.last_timestamp[service] = last
+
+    def snapshot(self):
+        """
+        :return: Picklable state of the forecasters of all services.
+        """
+        return {"forecasters": {service: forecaster.snapshot() for service, forecaster in self.forecasters.items()},
+                "last_timestamp": dict(self.last_timestamp)}
+
+    def restore(self, state):
+        """
+        Restore a state returned by snapshot().
+        """
+        self.forecasters = {}
+        for service, forecaster_state in state["forecasters"].items():
+            forecaster = self.forecasters[service] = HoltWintersForecaster(**self.kwargs)
+            forecaster.restore(forecaster_state)
+        self.last_timestamp = dict(state["last_timestamp"])
+
+    def forecast(self, service, steps=None):
+        """
+        :return: Forecast of the next samples for a service (empty if the service was never seen)
+        """
+        if service not in self.forecasters:
+            return np.zeros(0)
+        return self.forecasters[service].forecast(steps or self.horizon)
+
+    def peak(self, service, steps=None):
+        """
+        :return: Highest forecasted request count over the horizon, or None if nothing can be forecasted
+        """
+        forecast = self.forecast(service, steps)
+        return float(forecast.max()) if forecast.size else None
@@ -1,36 +1,42 @@
+import time
+IMPORT_START = time.perf_counter()  # Reported by --profile-startup
 from scenario_monitor import *
 from scenario_manager import *
+from load_forecaster import LoadForecaster
+from model_manager import ModelManager  # Imports stable_baselines3 and the environment when the models are needed
+from Executor import Executor
 import global_var as gv
-import time
-import logging
 import numpy as np
-from stable_baselines3 import PPO, DDPG, A2C  # Change this to the model you used
-from RL_model_training.Agent import Environment_test as Environment  # Import your environment
-import os
-import shutil
-
-def print_service_data(service_data_dict):
+import sys
+import signal
+import asyncio
+import argparse
+import checkpoint
+import instrumentation as metrics
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
+
+def print_service_data(service_data):
 	"""
-	Print the contents of the service_data_dict in a structured format.
-	:param service_data_dict: Dictionary where keys are service names and values are DataFrames
+	Print the contents of the processed window in a structured format.
+	:param service_data: TimeSeriesWindow returned by DataProcessor.process_data
 	"""
 	print("=== Service Data Summary ===")
-	for service, df in service_data_dict.items():
+	for service in service_data.services:
 		print(f"\nService: {service}")
-		print(f"Number of Records: {len(df)}")
-		if not df.empty:
+		print(f"Number of Records: {len(service_data)}")
+		if service_data.has_data(service):
 			print("Data Preview:")
-			print(df)  # Print the first few rows of the DataFrame for preview
+			for metric in service_data.metrics:
+				print(f"{metric}: {service_data.series(service, metric)}")
 		else:
 			print("No data available for this service.")
 		print("-" * 50)
 
-def adapt_data_to_scenario_manager(service_data_dict):
+def adapt_data_to_scenario_manager(service_data):
 	"""
-	Preprocess the service_data_dict by renaming specific columns and retaining only the desired columns.
-	Combine all services into a single DataFrame.
-	:param service_data_dict: Dictionary where keys are services and values are DataFrames
-	:return: A single combined DataFrame with renamed and filtered columns
+	Select and rename the metrics used by the scenario manager.
+	:param service_data: TimeSeriesWindow returned by DataProcessor.process_data
+	:return: A dictionary where keys are services and values are dictionaries of sample arrays (views of the window)
 	"""
 	# Column mapping for renaming
 	column_mapping = {
@@ -39,46 +45,53 @@ def adapt_data_to_scenario_manager(service_data_dict):
 		"net.connection.count.in_sum": "connections",
 		"net.request.count.in_sum": "requests"
 	}
-	desired_columns = ["timestamp"] + list(column_mapping.keys())
 
-	# List to store processed DataFrames
+	# Ensure that the required columns are present
+	missing_columns = set(column_mapping.keys()).difference(service_data.metrics)
+	if missing_columns:
+		raise KeyError(f"The following required columns are missing in the processed data: {missing_columns}")
+
 	processed_service_data = {}
 	# Process each service
-	for service, df in service_data_dict.items():
-		# Ensure that the required columns are present
-		missing_columns = set(column_mapping.keys()).difference(df.columns)
-		if missing_columns:
-			raise KeyError(f"The following required columns are missing in the DataFrame for service {service}: {missing_columns}")
-
-		# Rename columns
-		df = df.rename(columns=column_mapping)
-
-		# Retain only the desired columns
-		df = df[["timestamp"] + list(column_mapping.values())]
-
-		# Add the processed DataFrame to the dictionary
-		processed_service_data[service] = df
+	for service in service_data.services:
+		if not service_data.has_data(service):
+			continue
+		samples = {"timestamp": service_data.timestamps}
+		for column, name in column_mapping.items():
+			samples[name] = service_data.series(service, column)
+		processed_service_data[service] = samples
 
 	return processed_service_data
 
-def analyze_scenario(scenario_manager):
-	for service, df in processed_service_data.items():
+def analyze_scenario(scenario_manager, processed_service_data, recent_loads_dict, load_forecaster=None):
+	"""
+	Vote over the samples of each service whether an adaptation is needed.
+	With a load forecaster, the forecasted peak request count is also checked so that
+	upcoming fluctuations trigger the adaptation before they happen.
+	"""
+	for service, samples in processed_service_data.items():
 		print(f"\nProcessing data for {service}")
 		
-		# Ensure the DataFrame is sorted by timestamp
-		df = df.sort_values(by="timestamp").reset_index(drop=True)
+		# The samples are on the sampling grid, sorted by timestamp
 		vote = []
 
-		# Iterate through rows of the DataFrame
-		for _, row in df.iterrows():
-			metrics = {
-				"cpu_usage": row["cpu_usage_avg"],
-				"memory_usage": row["memory_usage_avg"],
-				"connections": row["connections"],
-				"requests": row["requests"]
+		if load_forecaster is not None:
+			load_forecaster.update(service, samples["timestamp"].tolist(), samples["requests"].tolist())
+
+		columns = ["cpu_usage_avg", "memory_usage_avg", "connections", "requests"]
+		rows = np.stack([samples[column] for column in columns], axis=1).tolist()
+		# Iterate through the sampled timestamps
+		for row in rows:
+			if all(value != value for value in row):
+				continue  # No sample at this timestamp
+			sample = {
+				"cpu_usage": row[0],
+				"memory_usage": row[1],
+				"connections": row[2],
+				"requests": row[3]
 			}
 			# Analyze the scenario
-			scenario, current_load = scenario_manager.analyze_scenario(metrics, list(recent_loads_dict[service]))
+			scenario, current_load = scenario_manager.analyze_scenario(sample, list(recent_loads_dict[service]))
 
 			# Add the current load to the service's recent loads deque
 			recent_loads_dict[service].append(current_load)
@@ -94,39 +107,17 @@ def analyze_scenario(scenario_manager):
 		if count_1 > count_0:
 			print(f"Detected scenarios for {service}")
 			return True
-		else:
-			print(f"No abnormal scenarios detected for {service}")
-	return False
-
-def copy_files_to_target():
-    # 定义源目录和目标目录
-    source_dir = 'datasets'
-    target_dir = 'RL_model_training/Agent/datasets_test'
-
-    # 确保目标目录存在
-    if not os.path.exists(target_dir):
-        os.makedirs(target_dir)
-        print(f"Created target directory: {target_dir}")
 
-    # 定义需要复制的文件列表
-    file_list = [
-        "cpu_quota_used_percent_avg_metric.json",
-        "net_http_request_time_max_metric.json",
-        "net_request_count_in_sum_metric.json"
-    ]
-
-    # 遍历文件列表并复制
-    for file_name in file_list:
-        source_file = os.path.join(source_dir, file_name)
-        target_file = os.path.join(target_dir, file_name)
-
-        # 检查源文件是否存在
-        if os.path.exists(source_file):
-            shutil.copy(source_file, target_file)
-            print(f"Copied {source_file} to {target_file}")
-        else:
-            print(f"File not found: {source_file}")
+		# Check the forecasted peak against the latest sample
+		peak = load_forecaster.peak(service) if load_forecaster is not None and vote else None
+		if peak is not None:
+			forecast_metrics = dict(sample, requests=peak)
+			if scenario_manager.detect_predicted_fluctuation(forecast_metrics):
+				print(f"Predicted load fluctuation for {service} (forecasted requests: {peak:.1f})")
+				return True
 
+		print(f"No abnormal scenarios detected for {service}")
+	return False
 
 def train_all_models_with_best_action(manager, obs, best_action, reward, next_obs, train_steps=1000):
     """
@@ -166,89 +157,227 @@ def train_all_models_with_best_action(manager, obs, best_action, reward, next_ob
             print(f"Error training model {model_name}: {e}")
 
 
-def get_action_from_models(manager):
-	obs, info = model_manager.reset_environment()
-
-	# Get the best action from all models
-    best_action, best_model_name = manager.get_best_action(obs)
-
-    # Simulate the environment step using the best action
-    next_obs, reward, done, info = manager.env.step(best_action)
-
-    # Train all models with the best action result
-    train_all_models_with_best_action(manager, obs, best_action, reward, next_obs, train_steps=10)
-    return best_action
-	
-
-def main():
-	# metrices: time aggregation is average
-	avg_metric_ids = [
-		"cpu.quota.used.percent",
-		"cpu.used.percent",
-		"cpu.cores.used",        
-		"memory.limit.used.percent",             
-	]
-
-	# metrices: time aggregation is maximum
-	max_metric_ids = [
-		"net.http.request.time"
-	]
-
-	# metrices: time aggregation is summation
-	sum_metric_ids = [
-		"net.connection.count.in",
-		"net.request.count.in"
-	]
-
-	# metrices: core metrics used to perform adaptation analysis
-	core_metrics = [
-		("cpu.quota.used.percent", "avg"),
-		("memory.limit.used.percent", "avg"),
-		("cpu.used.percent", "avg"),
-		("cpu.cores.used", "avg"),
-		("net.http.request.time", "max"),
-		("net.connection.count.in", "sum"),
-		("net.request.count.in", "sum"),
-	]
-
-	# Variable for monitor and data manipulation
-	scenario_monitor = ScenarioMonitor(gv.URL, gv.APIKEY, gv.GUID)
-	data_processor = DataProcessor(core_metrics)
-	model_manager = ModelManager(gv.MODEL_PATH)
-    executor = Executor(gv.JSON_FILE)
-	
-	# Variable for scenario manager
-	recent_loads_dict = defaultdict(lambda: deque(maxlen=30))  # Automatically removes the oldest element when new elements are added
-	scenario_manager = ScenarioManager(ema_alpha=0.2, ema_threshold=5, variance_threshold=10, concurrency_threshold=100)
-
-	while True:
-		# Fetch data from IBM
-		for id in avg_metric_ids:
+def latest_metrics(service_data):
+	"""
+	Latest value of every metric of each service, keyed like the environment metrics (e.g. "cpu_quota_used_percent_avg").
+	:param service_data: TimeSeriesWindow returned by DataProcessor.process_data
+	"""
+	return {service: {metric.replace(".", "_"): value for metric, value in values.items()}
+			for service, values in service_data.latest().items()}
+
+def get_action_from_models(manager, live_metrics, forecasts=None, train_steps=10, timings=None, tick=None):
+	with metrics.stage("predict", timings):
+		# Observe the live metrics of this cycle, the environment keeps its traffic weights
+		obs = manager.observe(live_metrics)
+		if forecasts:
+			# Let the models see the forecasted request rate instead of the current one
+			obs = manager.env.apply_load_forecast(obs, forecasts)
+
+		# Get the best action from all models
+		best_action, best_model_name = manager.get_best_action(obs)
+
+		# Simulate the environment step using the best action
+		next_obs, reward, done, truncated, info = manager.env.step(best_action)
+
+	# Train all models with the best action result
+	# Fine-tuning is optional and is shed when it would make the cycle overrun
+	if train_steps > 0 and (tick is None or tick.allows("train", metrics.STAGE_LATENCY.mean(stage="train"))):
+		with metrics.stage("train", timings):
+			train_all_models_with_best_action(manager, obs, best_action, reward, next_obs, train_steps=train_steps)
+		manager.train_updates += 1
+	return best_action
+
+def weights_from_env(env):
+	"""
+	Convert the traffic weights of the environment into the integer percentages used by the virtual service.
+	"""
+	first = int(round(env.traffic_weights[0] * 100))
+	return [first, 100 - first]
+
+# metrices: time aggregation is average
+AVG_METRIC_IDS = [
+	"cpu.quota.used.percent",
+	"cpu.used.percent",
+	"cpu.cores.used",        
+	"memory.limit.used.percent",             
+]
+
+# metrices: time aggregation is maximum
+MAX_METRIC_IDS = [
+	"net.http.request.time"
+]
+
+# metrices: time aggregation is summation
+SUM_METRIC_IDS = [
+	"net.connection.count.in",
+	"net.request.count.in"
+]
+
+# metrices: core metrics used to perform adaptation analysis
+CORE_METRICS = [
+	("cpu.quota.used.percent", "avg"),
+	("memory.limit.used.percent", "avg"),
+	("cpu.used.percent", "avg"),
+	("cpu.cores.used", "avg"),
+	("net.http.request.time", "max"),
+	("net.connection.count.in", "sum"),
+	("net.request.count.in", "sum"),
+]
+
+def run_cycle(scenario_monitor, data_processor, scenario_manager, model_manager, executor,
+			  recent_loads_dict, load_forecaster, train_steps=10, timings=None, tick=None):
+	"""
+	Run one MAPE-K cycle: fetch the metrics, process and analyze them and, if an adaptation is needed,
+	pick an action with the models and apply the resulting weights.
+	:param timings: Optional dictionary receiving the time spent in each stage (fetch, process, analyze, predict, train, apply)
+	:param tick: Optional scheduler Tick, used to shed fine-tuning when the cycle runs out of time
+	:return: The applied action, or None if no adaptation was needed
+	"""
+	# Fetch data from IBM
+	with metrics.stage("fetch", timings):
+		for id in AVG_METRIC_IDS:
 			scenario_monitor.fetch_data_from_ibm(id, "avg")
 
-		for id in sum_metric_ids:
+		for id in SUM_METRIC_IDS:
 			scenario_monitor.fetch_data_from_ibm(id, "sum")
 
-		for id in max_metric_ids:
+		for id in MAX_METRIC_IDS:
 			scenario_monitor.fetch_data_from_ibm(id, "max")
-		print(f"Pulling metrics from Prometheus")
-
-		service_data_dict = data_processor.process_data(gv.CREATE_NEW_FILE)
-		processed_service_data = adapt_data_to_scenario_manager(service_data_dict)
-		# For DEBUG
-		# print (processed_service_data)
-
-		detect_scenario = analyze_scenario(scenario_manager)
-		detect_scenario = True
-		if detect_scenario:
-			copy_files_to_target()
-			action = get_action_from_models(model_manager)
-			print ("Action is", action)
-			executor.update_weights(actions)
-			executor.save_and_apply()
-
-		# # Sleep for customizing second
-		time.sleep(gv.SLEEP)
+	print(f"Pulling metrics from {gv.METRICS_SOURCE}")
+
+	with metrics.stage("process", timings):
+		service_data = data_processor.process_data(gv.CREATE_NEW_FILE)
+		processed_service_data = adapt_data_to_scenario_manager(service_data)
+		live_metrics = latest_metrics(service_data)
+		# Every cycle, not only on decisions, so the normalization follows the live traffic
+		model_manager.update_normalization(live_metrics)
+	# For DEBUG
+	# print (processed_service_data)
+
+	with metrics.stage("analyze", timings):
+		detect_scenario = analyze_scenario(scenario_manager, processed_service_data, recent_loads_dict, load_forecaster)
+	if not detect_scenario:
+		return None
+
+	forecasts = {service: load_forecaster.peak(service) for service in processed_service_data}
+	action = get_action_from_models(model_manager, live_metrics, forecasts, train_steps, timings, tick)
+	print ("Action is", action)
+	metrics.DECISIONS.inc()
+	weights = weights_from_env(model_manager.env)
+	if weights == executor.current_weights():
+		metrics.NOOP_APPLIES.inc()
+		print(f"Weights are already {weights}, nothing to apply")
+		return action
+	with metrics.stage("apply", timings):
+		executor.update_weights(weights)
+		executor.save_and_apply()
+	return action
+
+def report_startup():
+	"""
+	Print the time spent in each startup phase (see metrics.STARTUP).
+	"""
+	print("=== Startup profile ===")
+	for _, key, seconds in metrics.STARTUP.samples():
+		print(f"{dict(key)['phase']:<14}{seconds:8.3f} s")
+	print("Run with python -X importtime for the import time of each module.")
+
+def profile_startup(scenario_monitor, data_processor, scenario_manager, model_manager, executor,
+					recent_loads_dict, load_forecaster):
+	"""
+	Run the first cycle right away, wait until the models and the environment are ready and report the startup time.
+	"""
+	with metrics.startup_phase("first_cycle"):
+		action = run_cycle(scenario_monitor, data_processor, scenario_manager, model_manager, executor,
+						   recent_loads_dict, load_forecaster)
+	# Only waits when the first cycle did not need the models
+	with metrics.startup_phase("models_ready"):
+		models = model_manager.models
+	with metrics.startup_phase("env_ready"):
+		model_manager.env
+	report_startup()
+	print(f"First cycle {'decided action ' + str(action) if action is not None else 'detected no scenario'}, "
+		  f"{len(models)} models loaded")
+
+def main():
+	parser = argparse.ArgumentParser(description="SMART-MARS MAPE-K controller")
+	parser.add_argument("--async", dest="use_async", action="store_true",
+						help="Run monitoring, analysis, inference and actuation as overlapping asyncio tasks")
+	parser.add_argument("--profile-startup", action="store_true",
+						help="Run a single cycle right away, report the time spent in each startup phase and exit")
+	args = parser.parse_args()
+	metrics.STARTUP.set(IMPORT_SECONDS, phase="imports")
+
+	with metrics.startup_phase("setup"):
+		# Variable for monitor and data manipulation
+		data_dir = gv.REPLAY_OUTPUT_DIR if gv.METRICS_SOURCE == "replay" else gv.DATA_DIR
+		scenario_monitor = ScenarioMonitor(gv.URL, gv.APIKEY, gv.GUID, data_dir=data_dir)
+		data_processor = DataProcessor(CORE_METRICS, data_dir, store=scenario_monitor.cache.store)
+		executor = Executor(gv.JSON_FILE, gv.APPLY_COMMAND, gv.APPLIED_WEIGHTS_LOG, clock=scenario_monitor.source.now)
+
+		# Variable for scenario manager
+		recent_loads_dict = defaultdict(lambda: deque(maxlen=30))  # Automatically removes the oldest element when new elements are added
+		scenario_manager = ScenarioManager(ema_alpha=0.2, ema_threshold=5, variance_threshold=10, concurrency_threshold=100)
+		load_forecaster = LoadForecaster(horizon=gv.FORECAST_CYCLES * gv.SLEEP // gv.SAMPLING)
+
+	if gv.METRICS_PORT:
+		metrics.REGISTRY.start_http_server(gv.METRICS_PORT)
+
+	# The snapshot is read once, so the fine-tuned models and the state are restored together or not at all
+	state = checkpoint.read_recent(gv.CHECKPOINT_PATH, gv.CHECKPOINT_MAX_AGE) if gv.CHECKPOINT_PATH else None
+	model_path = checkpoint.model_path_for_restart(state, gv.CHECKPOINT_MODELS_DIR, gv.MODEL_PATH)
+
+	if args.use_async:
+		# The models are loaded by the model process of the async runtime, which also checkpoints
+		from async_runtime import AsyncController
+		runtime = AsyncController(scenario_monitor, data_processor, scenario_manager, executor, load_forecaster,
+								  model_path=model_path, checkpoint_state=state)
+		asyncio.run(runtime.run())
+		return
+
+	# Returns right away, the models keep loading in the background during the first fetch
+	with metrics.startup_phase("model_manager"):
+		model_manager = ModelManager(model_path)
+
+	checkpointer = None
+	if gv.CHECKPOINT_PATH:
+		checkpointer = checkpoint.Checkpointer(gv.CHECKPOINT_PATH, gv.CHECKPOINT_EVERY, scenario_monitor, data_processor,
+											   scenario_manager, model_manager, recent_loads_dict, load_forecaster,
+											   models_dir=gv.CHECKPOINT_MODELS_DIR, max_age=gv.CHECKPOINT_MAX_AGE)
+		if state is not None:
+			with metrics.startup_phase("restore"):
+				checkpointer.restore(state)
+
+	if args.profile_startup:
+		profile_startup(scenario_monitor, data_processor, scenario_manager, model_manager, executor,
+						recent_loads_dict, load_forecaster)
+		return
+
+	def cycle(tick):
+		try:
+			with metrics.cycle(gv.SLEEP):
+				run_cycle(scenario_monitor, data_processor, scenario_manager, model_manager, executor,
+						  recent_loads_dict, load_forecaster, tick=tick)
+		except Exception as e:
+			# Already counted per stage, keep the controller running
+			print(f"Cycle failed: {e}")
+		if checkpointer is not None:
+			checkpointer.after_cycle()
+		if gv.METRICS_DUMP:
+			metrics.REGISTRY.dump_json(gv.METRICS_DUMP)
+
+	# A rescheduled pod gets SIGTERM: exit through the finally below to checkpoint the last state
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+	try:
+		# Cycles fire every SLEEP seconds on SAMPLING boundaries of the clock of the source, so a replay does not
+		# skip recorded data, and stop after the last sample of a replay
+		source = scenario_monitor.source
+		source.scheduler(gv.SLEEP, gv.SAMPLING).run(cycle, until=lambda tick: source.finished(tick.scheduled))
+		if source.finished():
+			print("Reached the end of the replayed data")
+	finally:
+		if checkpointer is not None:
+			checkpointer.save()
 
 if __name__ == '__main__':
 	main()
@@ -0,0 +1,77 @@
+import numpy as np
+from timeseries import TimeSeriesStore
+
+
+class MetricCache:
+    def __init__(self, window, sampling, services=(), metrics=()):
+        """
+        Remember the samples already fetched for each (metric, service), so that a monitor only has to
+        query the delta since the last seen timestamp while the analysis still gets the full window.
+
+        The samples live in a TimeSeriesStore on the sampling grid: a sample fetched twice simply
+        overwrites itself, and the data processor reads its windows from the same store without a copy.
+
+        :param window: Length of the analysis window in seconds.
+        :param sampling: Sampling interval of the series in seconds.
+        :param services: Services known in advance (see TimeSeriesStore).
+        :param metrics: Metric keys known in advance (see TimeSeriesStore).
+        """
+        self.window = window
+        self.sampling = sampling
+        self.capacity = window // sampling + 2
+        self.store = TimeSeriesStore(sampling, self.capacity, services, metrics)
+
+    def last_timestamp(self, metric):
+        """
+        :return: The newest timestamp cached for a metric, or None if nothing was ingested yet.
+        """
+        return self.store.last_timestamp(metric)
+
+    def ingest(self, metric, response):
+        """
+        Store the samples of a Sysdig data response ({"data": [{"t": ..., "d": [service, value]}]}).
+        :return: Number of samples that were not cached yet.
+        """
+        return self.store.ingest(metric, response)
+
+    def get_window(self, metric, end=None):
+        """
+        Return the cached window of a metric in the Sysdig data response format.
+
+        :param metric: Metric key used with ingest.
+        :param end: End of the window (inclusive), defaults to the newest cached timestamp.
+        :return: Dictionary {"start", "end", "data"} with the samples sorted by timestamp.
+        """
+        # The window is a view of the store, other metrics may be ingested meanwhile (async runtime)
+        with self.store.lock:
+            if end is None:
+                end = self.last_timestamp(metric)
+            if end is None:
+                return {"start": None, "end": None, "data": []}
+            start = end - self.window
+
+            window = self.store.window(self.window // self.sampling, end)
+            values = window.values[:, window.metrics[metric]]
+            services = list(window.services)
+            # Samples sorted by timestamp, then by service
+            data = [{"t": int(window.timestamps[i]), "d": [services[s], float(values[s, i])]}
+                    for i, s in zip(*np.nonzero(np.isfinite(values).T))]
+        return {"start": start, "end": end, "data": data}
+
+    def query_range(self, metric, now):
+        """
+        Compute the absolute range that still has to be fetched for a metric.
+
+        The last cached sample is fetched again, because the newest bucket returned by the
+        monitoring backend may still have been accumulating.
+
+        :param metric: Metric key used with ingest.
+        :param now: Current time in seconds since the epoch.
+        :return: (start, end) in seconds since the epoch, or None when there is nothing new to fetch.
+        """
+        end = int(now) // self.sampling * self.sampling
+        last = self.last_timestamp(metric)
+        start = end - self.window if last is None else max(last, end - self.window)
+        if end <= start:
+            return None
+        return start, end
@@ -0,0 +1,344 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from string import Template
+import numpy as np
+
+# PromQL queries used by PrometheusMetricsSource for each (metric id, time aggregation).
+# $namespace and $window are substituted when querying. Every query returns one series per
+# deployment in the "service" label, in the same unit as the Sysdig metric.
+_POD_TO_DEPLOYMENT = '"service", "$$1", "pod", "(.*)-[a-z0-9]+-[a-z0-9]+"'
+PROMQL_QUERIES = {
+    ("cpu.quota.used.percent", "avg"):
+        '100 * sum by (service) (label_replace(rate(container_cpu_usage_seconds_total{namespace="$namespace", container!=""}[$window]), ' + _POD_TO_DEPLOYMENT + '))'
+        ' / sum by (service) (label_replace(kube_pod_container_resource_limits{namespace="$namespace", resource="cpu"}, ' + _POD_TO_DEPLOYMENT + '))',
+    ("cpu.used.percent", "avg"):
+        '100 * sum by (service) (label_replace(rate(container_cpu_usage_seconds_total{namespace="$namespace", container!=""}[$window]), ' + _POD_TO_DEPLOYMENT + '))',
+    ("cpu.cores.used", "avg"):
+        'sum by (service) (label_replace(rate(container_cpu_usage_seconds_total{namespace="$namespace", container!=""}[$window]), ' + _POD_TO_DEPLOYMENT + '))',
+    ("memory.limit.used.percent", "avg"):
+        '100 * sum by (service) (label_replace(container_memory_working_set_bytes{namespace="$namespace", container!=""}, ' + _POD_TO_DEPLOYMENT + '))'
+        ' / sum by (service) (label_replace(kube_pod_container_resource_limits{namespace="$namespace", resource="memory"}, ' + _POD_TO_DEPLOYMENT + '))',
+    # Sysdig reports the maximum request time in nanoseconds, the mesh only has the duration histogram
+    ("net.http.request.time", "max"):
+        '1e6 * histogram_quantile(0.99, sum by (service, le) (label_replace(rate(istio_request_duration_milliseconds_bucket{destination_workload_namespace="$namespace", reporter="destination"}[$window]), "service", "$$1", "destination_workload", "(.*)")))',
+    ("net.connection.count.in", "sum"):
+        'sum by (service) (label_replace(increase(istio_tcp_connections_opened_total{destination_workload_namespace="$namespace", reporter="destination"}[$window]), "service", "$$1", "destination_workload", "(.*)"))',
+    ("net.request.count.in", "sum"):
+        'sum by (service) (label_replace(increase(istio_requests_total{destination_workload_namespace="$namespace", reporter="destination"}[$window]), "service", "$$1", "destination_workload", "(.*)"))',
+}
+
+
+class MetricsSource:
+    """
+    Source of monitoring data. get_data returns (ok, response) like SdMonitorClient.get_data, where the
+    response is in the Sysdig format {"start", "end", "data": [{"t": timestamp, "d": [service, value]}]}.
+    """
+
+    def now(self):
+        """
+        :return: Current time of the source in seconds since the epoch.
+        """
+        return time.time()
+
+    def sleep(self, seconds):
+        """
+        Sleep for a number of seconds of the clock of the source.
+        """
+        time.sleep(seconds)
+
+    async def sleep_async(self, seconds):
+        await asyncio.sleep(seconds)
+
+    def finished(self, at=None):
+        """
+        :param at: Time of the source, now by default.
+        :return: Whether the source has no data after that time (only a replay ends).
+        """
+        return False
+
+    def scheduler(self, interval, align=None):
+        """
+        :return: CycleScheduler firing on the clock of the source, so every cycle covers interval seconds of data
+                 (also when a replay runs faster than real time).
+        """
+        from scheduler import CycleScheduler
+        return CycleScheduler(interval, align, time_fn=self.now, sleep_fn=self.sleep, async_sleep_fn=self.sleep_async)
+
+    def get_data(self, metric_id, aggregation, start_ts, end_ts, sampling):
+        """
+        Fetch one metric segmented by deployment.
+
+        :param metric_id: Sysdig metric id (e.g. "cpu.quota.used.percent").
+        :param aggregation: Time aggregation ("avg", "max" or "sum").
+        :param start_ts: Start in seconds since the epoch, or relative to now when <= 0.
+        :param end_ts: End in seconds since the epoch, or relative to now when <= 0.
+        :param sampling: Sampling interval in seconds.
+        :return: (ok, response or error message)
+        """
+        raise NotImplementedError
+
+    def _absolute(self, start_ts, end_ts):
+        now = self.now()
+        start_ts = now + start_ts if start_ts <= 0 else start_ts
+        end_ts = now + end_ts if end_ts <= 0 else end_ts
+        return int(start_ts), int(end_ts)
+
+
+class SysdigMetricsSource(MetricsSource):
+    def __init__(self, url, api_key, guid, filter=None):
+        """
+        Metrics from IBM Cloud Monitoring (Sysdig).
+
+        :param filter: Sysdig scope filter, e.g. 'kube_namespace_name="group-4"'.
+        """
+        from sdcclient import IbmAuthHelper, SdMonitorClient
+
+        # Create a client object using the IBM Cloud API credentials
+        ibm_headers = IbmAuthHelper.get_headers(url, api_key, guid)
+        self.sdclient = SdMonitorClient(sdc_url=url, custom_headers=ibm_headers)
+        self.filter = filter
+
+    def get_data(self, metric_id, aggregation, start_ts, end_ts, sampling):
+        metric = [
+            # segmentation metric
+            {"id": "kubernetes.deployment.name"},
+            # Specify the ID for keys, and ID with aggregation for values
+            {"id": metric_id,
+             "aggregations": {
+                 "time": aggregation,
+                 "group": "avg"
+             }}
+        ]
+        return self.sdclient.get_data(metrics=metric, start_ts=start_ts, end_ts=end_ts,
+                                      sampling_s=sampling, filter=self.filter)
+
+
+class PrometheusMetricsSource(MetricsSource):
+    def __init__(self, url, namespace, queries=None, pool_size=10, timeout=10):
+        """
+        Metrics from Prometheus with query_range, over a pooled keep-alive HTTP session.
+
+        :param url: Base URL of Prometheus, e.g. the /prometheus route of the ingress gateway.
+        :param namespace: Kubernetes namespace of the services.
+        :param queries: PromQL templates keyed by (metric id, aggregation), defaults to PROMQL_QUERIES.
+        :param pool_size: Number of pooled connections.
+        :param timeout: Request timeout in seconds.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = url.rstrip("/") + "/api/v1/query_range"
+        self.namespace = namespace
+        self.queries = queries or PROMQL_QUERIES
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get_data(self, metric_id, aggregation, start_ts, end_ts, sampling):
+        if (metric_id, aggregation) not in self.queries:
+            return False, f"No PromQL query defined for {metric_id} ({aggregation})"
+        start_ts, end_ts = self._absolute(start_ts, end_ts)
+        query = Template(self.queries[(metric_id, aggregation)]).substitute(namespace=self.namespace,
+                                                                            window=f"{sampling}s")
+        try:
+            response = self.session.get(self.url, params={"query": query, "start": start_ts, "end": end_ts,
+                                                          "step": sampling}, timeout=self.timeout)
+            res = response.json()
+        except Exception as e:
+            return False, f"Prometheus query for {metric_id} failed: {e}"
+        if res.get("status") != "success":
+            return False, res.get("error", res)
+
+        data = []
+        for series in res["data"]["result"]:
+            service = series["metric"].get("service")
+            for t, value in series["values"]:
+                value = float(value)
+                data.append({"t": int(t), "d": [service, None if value != value else value]})
+        data.sort(key=lambda entry: entry['t'])
+        return True, {"start": start_ts, "end": end_ts, "data": data}
+
+
+class HarnessMetricsSource(MetricsSource):
+    def __init__(self, url, pool_size=4, timeout=10):
+        """
+        Metrics of the local stand-in services (Harness/harness.py), already in the Sysdig format.
+
+        :param url: Base URL of the harness metrics endpoint, e.g. http://127.0.0.1:8090.
+        :param pool_size: Number of pooled connections.
+        :param timeout: Request timeout in seconds.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = url.rstrip("/") + "/api/data"
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def get_data(self, metric_id, aggregation, start_ts, end_ts, sampling):
+        start_ts, end_ts = self._absolute(start_ts, end_ts)
+        try:
+            response = self.session.get(self.url, params={"metric": metric_id, "aggregation": aggregation,
+                                                          "start": start_ts, "end": end_ts}, timeout=self.timeout)
+            res = response.json()
+        except Exception as e:
+            return False, f"Harness query for {metric_id} failed: {e}"
+        if response.status_code != 200:
+            return False, res.get("error", res)
+        return True, res
+
+
+class ReplayMetricsSource(MetricsSource):
+    def __init__(self, data_dir, speedup=100, clock=None, start_offset=0):
+        """
+        Replay recorded datasets (the *_metric.json files and the per-service CSV files) as if they
+        were live, on a clock running `speedup` times faster than real time.
+
+        :param data_dir: Dataset directory, e.g. "datasets" or "RL_model_training/Agent/datasets_train".
+        :param speedup: How much faster than real time the recorded data is streamed.
+        :param clock: Optional function returning the replay time; overrides speedup.
+        :param start_offset: Seconds after the first recorded sample at which the replay starts.
+        """
+        self.data_dir = data_dir
+        self.series = self._load(data_dir)
+        if not self.series:
+            raise FileNotFoundError(f"No recorded metrics found in {data_dir}")
+        self.first_timestamp = min(int(t[0]) for t, _, _ in self.series.values())
+        self.last_timestamp = max(int(t[-1]) for t, _, _ in self.series.values())
+        self.speedup = speedup
+        # A recording shorter than the offset still gets one cycle, over all of it
+        self.start_offset = min(start_offset, self.last_timestamp - self.first_timestamp)
+        self.clock = clock
+        self._wall_start = time.monotonic()
+
+    @staticmethod
+    def _load(data_dir):
+        """
+        Load every recorded metric into sorted arrays keyed by (metric id, aggregation).
+        """
+        import pandas as pd
+        frames = {}
+        for file_name in sorted(os.listdir(data_dir)):
+            path = os.path.join(data_dir, file_name)
+            if file_name.endswith("_metric.json"):
+                with open(path, 'r') as file:
+                    data = json.load(file)["data"]
+                key = file_name[:-len("_metric.json")]
+                frames.setdefault(key, []).append(pd.DataFrame(
+                    [{"timestamp": entry['t'], "service": entry['d'][0], "value": entry['d'][1]} for entry in data]))
+            elif os.path.isdir(path):
+                for csv_name in sorted(os.listdir(path)):
+                    if csv_name.endswith(".csv"):
+                        df = pd.read_csv(os.path.join(path, csv_name), usecols=["timestamp", "service", "value"])
+                        if not pd.api.types.is_numeric_dtype(df["timestamp"]):
+                            df["timestamp"] = (pd.to_datetime(df["timestamp"]) - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+                        frames.setdefault(csv_name[:-len(".csv")], []).append(df)
+
+        series = {}
+        for key, dfs in frames.items():
+            df = pd.concat(dfs).drop_duplicates(subset=["timestamp", "service"]).sort_values(by="timestamp")
+            if df.empty:
+                continue
+            series[key] = (df["timestamp"].to_numpy(dtype=np.int64), df["service"].to_numpy(dtype=object),
+                           df["value"].to_numpy(dtype=np.float64))
+        return series
+
+    def now(self):
+        if self.clock is not None:
+            return self.clock()
+        return self.first_timestamp + self.start_offset + (time.monotonic() - self._wall_start) * self.speedup
+
+    def sleep(self, seconds):
+        # With a clock given to the constructor, its owner moves it (e.g. replay.VirtualClock.sleep)
+        time.sleep(seconds / self.speedup)
+
+    async def sleep_async(self, seconds):
+        await asyncio.sleep(seconds / self.speedup)
+
+    def finished(self, at=None):
+        """
+        :param at: Replay time, now by default.
+        :return: Whether that time is at or past the last recorded sample.
+        """
+        return (self.now() if at is None else at) >= self.last_timestamp
+
+    def get_data(self, metric_id, aggregation, start_ts, end_ts, sampling):
+        key = metric_id.replace(".", "_") + "_" + aggregation
+        if key not in self.series:
+            return False, f"No recorded data for {metric_id} ({aggregation}) in {self.data_dir}"
+        start_ts, end_ts = self._absolute(start_ts, end_ts)
+        timestamps, services, values = self.series[key]
+        lo = np.searchsorted(timestamps, start_ts, side="left")
+        hi = np.searchsorted(timestamps, end_ts, side="right")
+        data = [{"t": int(t), "d": [service, None if v != v else float(v)]}
+                for t, service, v in zip(timestamps[lo:hi], services[lo:hi], values[lo:hi])]
+        return True, {"start": start_ts, "end": end_ts, "data": data}
+
+
+def create_metrics_source(kind, **kwargs):
+    """
+    Create a metrics source by name ("sysdig", "prometheus", "harness" or "replay").
+    """
+    sources = {
+        "sysdig": SysdigMetricsSource,
+        "prometheus": PrometheusMetricsSource,
+        "harness": HarnessMetricsSource,
+        "replay": ReplayMetricsSource,
+    }
+    if kind not in sources:
+        raise ValueError(f"Unknown metrics source {kind}. Available sources: {list(sources)}")
+    return sources[kind](**kwargs)
+
+
+def benchmark(source, metrics, duration, sampling, rounds):
+    """
+    Measure the query latency of a metrics source.
+
+    :return: Dictionary with the number of queries and the mean, p50 and max latency in milliseconds.
+    """
+    latencies = []
+    for _ in range(rounds):
+        for metric_id, aggregation in metrics:
+            start = time.perf_counter()
+            ok, res = source.get_data(metric_id, aggregation, -duration, 0, sampling)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                print(res)
+    latencies = np.array(latencies)
+    return {"queries": len(latencies), "mean_ms": latencies.mean(), "p50_ms": np.percentile(latencies, 50),
+            "max_ms": latencies.max()}
+
+
+def main():
+    import global_var
+
+    parser = argparse.ArgumentParser(description="Benchmark the query latency of the metrics sources.")
+    parser.add_argument("sources", nargs="+", choices=["sysdig", "prometheus", "harness", "replay"])
+    parser.add_argument("--rounds", type=int, default=10, help="Queries per metric")
+    args = parser.parse_args()
+
+    metrics = [("cpu.quota.used.percent", "avg"), ("memory.limit.used.percent", "avg"),
+               ("net.http.request.time", "max"), ("net.request.count.in", "sum")]
+    options = {
+        "sysdig": dict(url=global_var.URL, api_key=global_var.APIKEY, guid=global_var.GUID,
+                       filter=f'kube_namespace_name="{global_var.NAMESPACE}"'),
+        "prometheus": dict(url=global_var.PROMETHEUS_URL, namespace=global_var.NAMESPACE),
+        "harness": dict(url=global_var.HARNESS_URL),
+        "replay": dict(data_dir=global_var.REPLAY_DIR, speedup=global_var.REPLAY_SPEEDUP,
+                       start_offset=global_var.DURATION),
+    }
+    for kind in args.sources:
+        source = create_metrics_source(kind, **options[kind])
+        result = benchmark(source, metrics, global_var.DURATION, global_var.SAMPLING, args.rounds)
+        print(f"{kind}: {result['queries']} queries, mean {result['mean_ms']:.2f} ms, "
+              f"p50 {result['p50_ms']:.2f} ms, max {result['max_ms']:.2f} ms")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,50 +1,170 @@
-from stable_baselines3 import SAC, PPO, DDPG, A2C
-from RL_model_training.Agent import Environment_test as Environment
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import instrumentation as metrics
+import global_var as gv
+# stable_baselines3 (torch) and the environment (gymnasium, pandas) are imported when first needed,
+# so the controller can start monitoring while the models load
+from RL_model_training.Agent.Normalization import NormalizationStats, StreamingNormalizer, stats_path, observation_vector
+
+# Algorithm of each model, loaded from "{model_path}/{name}_service_mesh_model.zip"
+MODEL_CLASSES = {
+    "sac": "SAC",
+    "ppo": "PPO",
+    "ddpg": "DDPG",
+    "a2c": "A2C"  # A3C uses A2C in Stable-Baselines3
+}
 
 class ModelManager:
-    def __init__(self, model_path):
+    # Environment attributes that change while the controller runs, kept by snapshot()
+    ENV_STATE = ("traffic_weights", "nr1", "nr2", "total_requests", "epsilon")
+
+    def __init__(self, model_path, models=None, normalization_half_life=None):
         """
         Initialize the ModelManager class, load models dynamically, and initialize the environment.
 
+        The models are deserialized in parallel in the background and the environment is built on first use,
+        so the constructor returns immediately; the first access to models or env waits for them.
+
         :param model_path: Base directory for model files (e.g., "RL_model_training/Agent").
+        :param models: Already loaded models to share with another ModelManager, instead of loading them again.
+        :param normalization_half_life: Half-life (in cycles) of the streaming normalization of the live metrics,
+                                        0 keeps the training statistics. Defaults to gv.NORMALIZATION_HALF_LIFE.
         """
         self.base_model_path = model_path
-        self.models = {}
-        self.env = None
-
-        # Initialize the environment
-        self._initialize_environment()
+        self._models = None
+        self._model_futures = {}
+        self._env = None
+        self._env_state = None  # Restored environment state, applied when the environment is built
+        self.train_updates = 0  # Number of fine-tuning runs, to know when the models have to be saved again
+
+        if normalization_half_life is None:
+            normalization_half_life = gv.NORMALIZATION_HALF_LIFE
+        self.normalization_half_life = normalization_half_life
+        self.normalization = self._load_normalization()
+        # Without saved statistics, the streaming normalization starts with the environment
+        self.streaming_normalizer = None
+        if self.normalization is not None and normalization_half_life:
+            self.streaming_normalizer = StreamingNormalizer(self.normalization, normalization_half_life)
 
         # Load the models
-        self._load_models()
+        if models is None:
+            self._load_models()
+        else:
+            self._models = models
+
+    @property
+    def models(self):
+        """
+        Loaded models by name, waiting for the background loading on first access.
+        """
+        if self._models is None:
+            models = {}
+            for model_name, future in self._model_futures.items():
+                try:
+                    models[model_name] = future.result()
+                except Exception as e:
+                    print(f"Failed to load {model_name} model: {e}")
+            self._models = models
+            self._model_futures = {}
+        return self._models
+
+    @property
+    def env(self):
+        """
+        Environment used to observe and step, built on first access.
+        """
+        if self._env is None:
+            self._initialize_environment()
+        return self._env
 
     def _initialize_environment(self):
         """
-        Initialize the environment.
+        Initialize the environment, normalizing with the statistics saved with the models.
         """
-        self.env = Environment.ServiceMeshEnv(action_type="discrete")
+        from RL_model_training.Agent import Environment_test as Environment
+        self._env = Environment.ServiceMeshEnv(action_type="discrete", normalization=self.normalization)
+        if self.streaming_normalizer is not None:
+            self._env.streaming_normalizer = self.streaming_normalizer
+        elif self.normalization_half_life:
+            self._env.enable_streaming_normalization(self.normalization_half_life)
+            self.streaming_normalizer = self._env.streaming_normalizer
+        if self._env_state is not None:
+            for name, value in self._env_state.items():
+                setattr(self._env, name, value)
+            self._env_state = None
         print("Environment initialized successfully.")
 
-    def _load_models(self):
+    def _load_normalization(self):
         """
-        Dynamically generate model paths and load models.
+        Load the normalization statistics saved next to the models (all models are trained with the same ones).
+        :return: NormalizationStats, or None if no model was saved with them.
         """
-        # Define model names and their corresponding classes
-        model_map = {
-            "sac": SAC,
-            "ppo": PPO,
-            "ddpg": DDPG,
-            "a2c": A2C  # A3C uses A2C in Stable-Baselines3
-        }
+        for model_name in ["sac", "ppo", "ddpg", "a2c"]:
+            path = stats_path(f"{self.base_model_path}/{model_name}_service_mesh_model")
+            if os.path.exists(path):
+                print(f"Normalization statistics loaded from {path}.")
+                return NormalizationStats.load(path)
+        print("No normalization statistics found next to the models, the environment normalizes with its own data.")
+        return None
 
-        for model_name, model_class in model_map.items():
+    def _load_models(self):
+        """
+        Dynamically generate model paths and start loading the models, one thread per model.
+        """
+        pool = ThreadPoolExecutor(max_workers=len(MODEL_CLASSES), thread_name_prefix="smart-mars-load")
+        for model_name, class_name in MODEL_CLASSES.items():
             # Construct the full path dynamically
             model_path = f"{self.base_model_path}/{model_name}_service_mesh_model.zip"
-            try:
-                self.models[model_name] = model_class.load(model_path)
-                print(f"{model_name} model loaded successfully from {model_path}.")
-            except Exception as e:
-                print(f"Failed to load {model_name} model from {model_path}: {e}")
+            self._model_futures[model_name] = pool.submit(self._load_model, model_name, class_name, model_path)
+        pool.shutdown(wait=False)
+
+    @staticmethod
+    def _load_model(model_name, class_name, model_path):
+        import stable_baselines3
+        model = getattr(stable_baselines3, class_name).load(model_path)
+        print(f"{model_name} model loaded successfully from {model_path}.")
+        return model
+
+    def save_models(self, path):
+        """
+        Save the (fine-tuned) models and their normalization statistics so that a ModelManager can load them from path.
+        With streaming normalization, the statistics are its current bounds, the ones the models were fine-tuned under.
+        Each file is written next to its destination and renamed, so a crash never leaves a truncated model.
+        """
+        os.makedirs(path, exist_ok=True)
+        normalization = self.streaming_normalizer.to_stats() if self.streaming_normalizer is not None else self.normalization
+        for model_name, model in self.models.items():
+            model_path = f"{path}/{model_name}_service_mesh_model.zip"
+            model.save(model_path + ".tmp.zip")
+            os.replace(model_path + ".tmp.zip", model_path)
+            if normalization is not None:
+                normalization.save(stats_path(model_path))
+        print(f"Models saved to {path}.")
+
+    def snapshot(self):
+        """
+        :return: Picklable state of the streaming normalization and of the environment.
+        """
+        if self._env is not None:
+            env_state = {name: getattr(self._env, name) for name in self.ENV_STATE if hasattr(self._env, name)}
+        else:
+            env_state = self._env_state
+        return {"normalizer": None if self.streaming_normalizer is None else self.streaming_normalizer.snapshot(),
+                "env": env_state}
+
+    def restore(self, state):
+        """
+        Restore a state returned by snapshot(). The environment state is applied when the environment is built.
+        """
+        if state["normalizer"] is not None and self.streaming_normalizer is not None:
+            self.streaming_normalizer.restore(state["normalizer"])
+        if state["env"] is not None:
+            if self._env is not None:
+                for name, value in state["env"].items():
+                    setattr(self._env, name, value)
+            else:
+                self._env_state = dict(state["env"])
 
     def get_model(self, model_name):
         """
@@ -65,6 +185,21 @@ class ModelManager:
         """
         return self.env.reset()
 
+    def update_normalization(self, latest_metrics):
+        """
+        Feed the latest live metrics to the streaming normalization of the environment.
+        """
+        if self.streaming_normalizer is not None:
+            self.streaming_normalizer.update(observation_vector(self.streaming_normalizer.layout, latest_metrics))
+
+    def observe(self, latest_metrics):
+        """
+        Build the observation of the environment from live metrics, without reloading any data.
+        :param latest_metrics: Latest raw values keyed by service, then by metric name.
+        :return: The normalized observation.
+        """
+        return self.env.observe(latest_metrics)
+
     def get_best_action(self, obs):
         """
         Iterate through all loaded models, evaluate their actions on the given observation,
@@ -81,7 +216,8 @@ class ModelManager:
         for model_name, model in self.models.items():
             try:
                 # Predict the action for the given observation
-                action, _states = model.predict(obs, deterministic=True)
+                with metrics.INFERENCE_LATENCY.time(model=model_name):
+                    action, _states = model.predict(obs, deterministic=True)
                 action = int(action)
                 
                 # Here, you can evaluate the "score" for the action. 
@@ -97,6 +233,7 @@ class ModelManager:
                     best_action = action
                     best_model_name = model_name
             except Exception as e:
+                metrics.FAILURES.inc(stage="predict", model=model_name)
                 print(f"Failed to predict using model {model_name}: {e}")
 
         print(f"Best Model: {best_model_name}, Best Action: {best_action}, Best Score: {best_score}")
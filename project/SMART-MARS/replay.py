@@ -0,0 +1,188 @@
+import sys
+import io
+import csv
+import json
+import time
+import random
+import argparse
+import tempfile
+from collections import defaultdict, deque
+from contextlib import redirect_stdout
+import numpy as np
+
+import global_var as gv
+import instrumentation as metrics
+from metrics_source import ReplayMetricsSource
+from scenario_monitor import ScenarioMonitor, DataProcessor
+from scenario_manager import ScenarioManager
+from load_forecaster import LoadForecaster
+from model_manager import ModelManager
+import main as controller
+from scheduler import CycleScheduler
+
+
+class VirtualClock:
+    def __init__(self, start):
+        """
+        Clock of a replay. Time only moves when sleep() is called, so a replay runs as fast as the
+        controller can process the cycles and is independent of the machine load.
+
+        :param start: Initial time in seconds since the epoch.
+        """
+        self.current = float(start)
+
+    def now(self):
+        return self.current
+
+    def sleep(self, seconds):
+        self.current += seconds
+
+
+class FakeExecutor:
+    def __init__(self, clock):
+        """
+        Stand-in for Executor that records the weights instead of writing and applying the virtual service.
+
+        :param clock: Clock used to timestamp the applied weights.
+        """
+        self.clock = clock
+        self.weights = None
+        self.trace = []
+
+    def update_weights(self, actions):
+        if len(actions) != 2:
+            raise ValueError("Actions must contain exactly two numbers, and there must be exactly two routes.")
+        self.weights = list(actions)
+
+    def current_weights(self):
+        return self.weights
+
+    def save_and_apply(self):
+        self.trace.append({"timestamp": self.clock.now(), "weights": list(self.weights)})
+
+
+def summarize(values):
+    """
+    :return: Mean, p50, p95 and max of a list of durations, in milliseconds.
+    """
+    values = np.asarray(values) * 1000
+    return {"mean_ms": float(values.mean()), "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)), "max_ms": float(values.max()), "count": len(values)}
+
+
+def replay(data_dir, cycles=None, train_steps=0, seed=0, quiet=True, output_dir=None):
+    """
+    Drive ScenarioMonitor -> DataProcessor -> ScenarioManager -> ModelManager -> Executor from a recorded
+    dataset on a virtual clock.
+
+    :param data_dir: Recorded dataset directory.
+    :param cycles: Number of cycles to run, by default until the recorded data is exhausted.
+    :param train_steps: Fine-tuning steps per decision (0 disables fine-tuning and keeps the models unchanged).
+    :param seed: Seed of the random generators used by the environment and the models.
+    :param quiet: Hide the output of the controller.
+    :param output_dir: Where the processed windows are written, a temporary directory by default.
+    :return: Report dictionary with the per-stage latency, the decision rate and the action trace.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    try:
+        from stable_baselines3.common.utils import set_random_seed
+        set_random_seed(seed)
+    except ImportError:
+        pass
+
+    source = ReplayMetricsSource(data_dir)
+    clock = VirtualClock(source.first_timestamp + gv.DURATION)
+    source.clock = clock.now
+    output_dir = output_dir or tempfile.mkdtemp(prefix="smart_mars_replay_")
+
+    stdout = io.StringIO() if quiet else sys.stdout
+    with redirect_stdout(stdout):
+        scenario_monitor = ScenarioMonitor(None, None, None, source=source, data_dir=output_dir)
+        data_processor = DataProcessor(controller.CORE_METRICS, output_dir, store=scenario_monitor.cache.store)
+        model_manager = ModelManager(gv.MODEL_PATH)
+    executor = FakeExecutor(clock)
+    scheduler = CycleScheduler(gv.SLEEP, gv.SAMPLING, time_fn=clock.now, sleep_fn=clock.sleep)
+    recent_loads_dict = defaultdict(lambda: deque(maxlen=30))
+    scenario_manager = ScenarioManager(ema_alpha=0.2, ema_threshold=5, variance_threshold=10, concurrency_threshold=100)
+    load_forecaster = LoadForecaster(horizon=gv.FORECAST_CYCLES * gv.SLEEP // gv.SAMPLING)
+
+    stage_timings = defaultdict(list)
+    cycle_timings = []
+    actions = []
+    n_cycles = 0
+    start = time.perf_counter()
+    while (n_cycles < cycles) if cycles is not None else not source.finished():
+        tick = scheduler.wait()
+        timings = {}
+        cycle_start = time.perf_counter()
+        with redirect_stdout(stdout):
+            action = controller.run_cycle(scenario_monitor, data_processor, scenario_manager, model_manager, executor,
+                                          recent_loads_dict, load_forecaster, train_steps=train_steps, timings=timings, tick=tick)
+        cycle_timings.append(time.perf_counter() - cycle_start)
+        for stage, seconds in timings.items():
+            stage_timings[stage].append(seconds)
+        if action is not None:
+            actions.append({"timestamp": clock.now(), "action": int(action), "weights": executor.weights})
+        if quiet:
+            stdout.seek(0)
+            stdout.truncate()
+        scheduler.finish(tick)
+        n_cycles += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        "data_dir": data_dir,
+        "cycles": n_cycles,
+        "decisions": len(actions),
+        "elapsed_s": elapsed,
+        "cycles_per_s": n_cycles / elapsed if elapsed > 0 else 0.0,
+        "decisions_per_s": len(actions) / elapsed if elapsed > 0 else 0.0,
+        "replayed_s": n_cycles * gv.SLEEP,
+        "cycle": summarize(cycle_timings) if cycle_timings else {},
+        "stages": {stage: summarize(values) for stage, values in stage_timings.items()},
+        "actions": actions,
+        "metrics": metrics.REGISTRY.to_dict(),
+    }
+
+
+def write_trace(actions, path):
+    """
+    Write the action trace as CSV (timestamp, action, weight of each route).
+    """
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["timestamp", "action", "weight_0", "weight_1"])
+        for entry in actions:
+            writer.writerow([int(entry["timestamp"]), entry["action"]] + list(entry["weights"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded dataset through the SMART-MARS MAPE-K loop.")
+    parser.add_argument("--data-dir", default=gv.REPLAY_DIR, help="Recorded dataset directory")
+    parser.add_argument("--cycles", type=int, default=None, help="Number of cycles (default: whole dataset)")
+    parser.add_argument("--train-steps", type=int, default=0, help="Fine-tuning steps per decision")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the controller")
+    parser.add_argument("--report", default=None, help="Write the report as JSON to this file")
+    parser.add_argument("--trace", default=None, help="Write the action trace as CSV to this file")
+    args = parser.parse_args()
+
+    report = replay(args.data_dir, args.cycles, args.train_steps, args.seed, quiet=not args.verbose)
+
+    print(f"Replayed {report['replayed_s']} s of {report['data_dir']} in {report['elapsed_s']:.2f} s: "
+          f"{report['cycles']} cycles, {report['decisions']} decisions, "
+          f"{report['decisions_per_s']:.2f} decisions/s")
+    for stage, stats in report["stages"].items():
+        print(f"  {stage:<8} mean {stats['mean_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  max {stats['max_ms']:8.2f} ms")
+    for entry in report["actions"]:
+        print(f"  {int(entry['timestamp'])}: action {entry['action']}, weights {entry['weights']}")
+
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(report, file, indent=4)
+    if args.trace:
+        write_trace(report["actions"], args.trace)
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,19 @@ class ScenarioManager:
 		self.variance_threshold = variance_threshold
 		self.concurrency_threshold = concurrency_threshold
 
+	def snapshot(self):
+		"""
+		State of the scenario manager, to resume after a restart
+		:return: A dictionary with the EMA value
+		"""
+		return {"ema_value": self.ema_value}
+
+	def restore(self, state):
+		"""
+		Restore a state returned by snapshot()
+		"""
+		self.ema_value = state["ema_value"]
+
 	def calculate_combined_load(self, metrics):
 		"""
 		Calculate the combined load value
@@ -87,6 +100,17 @@ class ScenarioManager:
 		"""
 		return metrics["connections"] > self.concurrency_threshold
 
+	def detect_predicted_fluctuation(self, forecast_metrics):
+		"""
+		Detect a load fluctuation that has not happened yet
+		:param forecast_metrics: A dictionary of metrics with the forecasted request count
+		:return: Whether the forecasted load deviates from the current EMA (True/False)
+		"""
+		if self.ema_value is None:
+			return False
+		forecast_load = self.calculate_combined_load(forecast_metrics)
+		return abs(forecast_load - self.ema_value) > self.ema_threshold
+
 	def analyze_scenario(self, metrics, load_list):
 		"""
 		Analyze the current scenario
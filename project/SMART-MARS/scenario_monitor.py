@@ -1,148 +1,156 @@
 import os
 import sys
 import json
-import time
-import pandas as pd
-from sdcclient import IbmAuthHelper, SdMonitorClient
-from datetime import datetime
+import csv
+import numpy as np
+from metric_cache import MetricCache
+from timeseries import TimeSeriesStore
+from metrics_source import create_metrics_source
 import global_var
 
+def create_source_from_config(url, api_key, guid, namespace):
+	"""
+	Create the metrics source selected by global_var.METRICS_SOURCE.
+	"""
+	if global_var.METRICS_SOURCE == "sysdig":
+		return create_metrics_source("sysdig", url=url, api_key=api_key, guid=guid,
+									 filter=f'kube_namespace_name="{namespace}"')
+	if global_var.METRICS_SOURCE == "prometheus":
+		return create_metrics_source("prometheus", url=global_var.PROMETHEUS_URL, namespace=namespace)
+	if global_var.METRICS_SOURCE == "harness":
+		return create_metrics_source("harness", url=global_var.HARNESS_URL)
+	return create_metrics_source("replay", data_dir=global_var.REPLAY_DIR, speedup=global_var.REPLAY_SPEEDUP,
+								 start_offset=global_var.DURATION)
+
 class ScenarioMonitor:
-	def __init__(self, url, api_key, guid):
-		# Create a client object using the IBM Cloud API credentials
-		ibm_headers = IbmAuthHelper.get_headers(url, api_key, guid)
-		self.sdclient = SdMonitorClient(sdc_url=url, custom_headers=ibm_headers)
+	def __init__(self, url, api_key, guid, source=None, data_dir="datasets", namespace=None):
+		# Namespace whose services are monitored
+		self.namespace = namespace or global_var.NAMESPACE
+		# Metrics source: IBM Cloud Monitoring (Sysdig), Prometheus, the local harness or a replay of recorded datasets
+		self.source = source or create_source_from_config(url, api_key, guid, self.namespace)
+		self.data_dir = data_dir
 
 		# Sysdig Data API Query Parameters
 		# Pull the latest 5 minutes of data
 		self.START = -global_var.DURATION
 		self.END = 0
-		self.SAMPLING = 10
-		self.FILTER = 'kube_namespace_name="group-4"' # None
+		self.SAMPLING = global_var.SAMPLING
+
+		# Samples already fetched, only the delta since the last seen sample is queried
+		self.cache = MetricCache(global_var.DURATION, self.SAMPLING)
 	
 	# Function to fetch data from IBM Cloud
 	def fetch_data_from_ibm(self, id, aggregation):
-		# Specify the metric to query
-		metric = [
-			# segmentation metric
-			{"id": "kubernetes.deployment.name"},
-			# Specify the ID for keys, and ID with aggregation for values
-			{"id": id,
-			"aggregations": {
-				"time": aggregation,
-				"group": "avg"
-			}}
-			# {"id": "cpu.used.percent", "aggregations": {"time": "timeAvg", "group": "avg"}}
-			]
-
-		# Query the metric
-		ok, res = self.sdclient.get_data(metrics=metric,  # metrics list
-										start_ts=self.START,  # start_ts = 600 seconds ago
-										end_ts=self.END,
-										sampling_s=self.SAMPLING,
-										filter=self.FILTER)  # end_ts = now
-		# print("Raw response data:", res)
-		# Check if the query was successful
-		if ok:
-			data = res
-		else:
-			print(res)
-			sys.exit(1)
+		key = id + "_" + aggregation
+		query_range = self.cache.query_range(key, self.source.now())
+
+		# Query the metric, unless the cached window is already up to date
+		if query_range is not None:
+			start_ts, end_ts = query_range
+			ok, res = self.source.get_data(id, aggregation,
+										   start_ts,  # last cached sample, or DURATION seconds ago
+										   end_ts,  # now
+										   self.SAMPLING)
+			# print("Raw response data:", res)
+			# Check if the query was successful
+			if ok:
+				self.cache.ingest(key, res)
+			else:
+				print(res)
+				sys.exit(1)
+		# The analysis sees the full window from the cache
+		data = self.cache.get_window(key)
 		
 		# Create a directory to store the datasets if it does not exist
-		if not os.path.exists('datasets'):
-			os.mkdir('datasets')
-			print("The 'datasets' directory is created.")
+		if not os.path.exists(self.data_dir):
+			os.mkdir(self.data_dir)
+			print(f"The '{self.data_dir}' directory is created.")
 
 		# Write the data to a json file
-		filename = "datasets/" + id.replace(".", "_") + "_" + aggregation + "_metric.json"
+		filename = os.path.join(self.data_dir, id.replace(".", "_") + "_" + aggregation + "_metric.json")
 		with open(filename, "w") as outfile: 
 			json.dump(data, outfile)
 
 class DataProcessor:
-	def __init__(self, metrics):
+	def __init__(self, metrics, data_dir="datasets", services=None, store=None):
 		# set relative weight for each property
 		# Set relative weights for each metric
 		
 		# Add weight for cost (CPU, memory, pod cost)
 		self.metrics = metrics
-		self.services = global_var.SERVICE_TO_USE
-
-	def create_dataframe(self, filename):
-		# Create a DataFrame from a JSON file
-		with open(filename, 'r') as file:
-			data = json.load(file)
-		new_data = []
-		for entry in data["data"]:
-			new_entry = {}
-			new_entry["timestamp"] = entry['t']
-			new_entry["service"] = entry['d'][0]
-			new_entry["value"] = entry['d'][1]
-			new_data.append(new_entry)
-		return pd.DataFrame(new_data)
+		self.services = services or global_var.SERVICE_TO_USE
+		self.data_dir = data_dir
+		# Metric columns, e.g. "cpu.quota.used.percent_avg"
+		self.columns = [f"{metric_id}_{aggregation}" for metric_id, aggregation in self.metrics]
+		# TimeSeriesStore of the ScenarioMonitor cache, read without a copy.
+		# Without it, the json files written by the monitor are loaded every cycle.
+		self.store = store
+		# Newest timestamp appended to the CSV of each (service, column)
+		self.recorded = {}
+
+	def load_store(self):
+		# Load the json files written by the monitor into a new store
+		store = TimeSeriesStore(global_var.SAMPLING, global_var.DURATION // global_var.SAMPLING + 2, self.services, self.columns)
+		for (metric_id, aggregation), column in zip(self.metrics, self.columns):
+			filename = os.path.join(self.data_dir, metric_id.replace('.', '_') + "_" + aggregation + "_metric.json")
+			with open(filename, 'r') as file:
+				store.ingest(column, json.load(file))
+		return store
+
+	def record(self, window, service, metric_id, aggregation, create_new_file):
+		# Append the samples of the window not recorded yet to the CSV of the service
+		column = f"{metric_id}_{aggregation}"
+		values = window.series(service, column)
+		if not np.isfinite(values).any():
+			return
+		service_folder = os.path.join(self.data_dir, service)
+		if not os.path.exists(service_folder):
+			os.makedirs(service_folder)
+		service_filename = os.path.join(service_folder, f"{metric_id.replace('.', '_')}_{aggregation}.csv")
+
+		key = (service, column)
+		if create_new_file or not os.path.exists(service_filename):
+			mode, last = "w", None
+		else:
+			mode, last = "a", self.recorded.get(key)
+			if last is None:
+				last = last_recorded_timestamp(service_filename)
+		rows = np.isfinite(values) if last is None else np.isfinite(values) & (window.timestamps > last)
+		if mode == "a" and not rows.any():
+			return
+		with open(service_filename, mode, newline="") as file:
+			writer = csv.writer(file)
+			if mode == "w":
+				writer.writerow(["timestamp", "service", "value", "metric_name"])
+			writer.writerows((int(t), service, str(v), column) for t, v in zip(window.timestamps[rows], values[rows]))
+		if rows.any():
+			self.recorded[key] = int(window.timestamps[rows][-1])
+		print(f"Data for {service} saved to {service_filename}")
 
 	def process_data(self, create_new_file = False):
-		# process data from json files
-		# return: A dictionary where keys are services and values are DataFrames grouped by timestamp.
-		service_to_index = {service: idx for idx, service in enumerate(global_var.SERVICE_TO_USE)}
-		service_data_dict = {service: pd.DataFrame() for service in global_var.SERVICE_TO_USE}
-
-		for idx, (metric_id, aggregation) in enumerate(self.metrics):
-			filename = "datasets/" + metric_id.replace('.', '_') + "_" + aggregation + "_metric.json"
-			df = self.create_dataframe(filename)
-			
-			# Print the metric_id and original dataframe for debugging
-			# print(metric_id)
-			# print(df)
-			
-			# Filter the dataframe to only include services in SERVICE_TO_USE
-			# df_filtered = df[df['service'].isin(global_var.SERVICE_TO_USE)]
-			# df_filtered['metric_name'] = f"{metric_id}_{aggregation}"  # Add a column to track metric names
-			df_filtered = df[df['service'].isin(global_var.SERVICE_TO_USE)].copy()  # 使用 .copy() 创建副本
-			df_filtered['metric_name'] = f"{metric_id}_{aggregation}"  # 添加新列
-			grouped_data = df_filtered.groupby('service')
-			# print (df_filtered)
-			for service, service_data in grouped_data:
-				# Append current metric data to the service-specific DataFrame
-				service_pivot = service_data.pivot_table(
-					index='timestamp',  # Group rows by timestamp
-					columns='metric_name',  # Metrics become columns
-					values='value',  # Values for each metric
-					aggfunc='first'  # If duplicates exist, take the first
-				).reset_index()
-
-				# Merge with existing data for the service
-				if not service_data_dict[service].empty:
-					service_data_dict[service] = pd.merge(
-						service_data_dict[service],
-						service_pivot,
-						on='timestamp',
-						how='outer'
-					)
-				else:
-					service_data_dict[service] = service_pivot
-
-				# Create repository for each service
-				service_folder = os.path.join('datasets', service)
-				if not os.path.exists(service_folder):
-					os.makedirs(service_folder)
-
-				service_filename = os.path.join(service_folder, f"{metric_id.replace('.', '_')}_{aggregation}.csv")
-				
-				if not create_new_file and os.path.exists(service_filename):
-					global_var.CREATE_NEW_FILE = False
-					existing_data = pd.read_csv(service_filename)
-					service_data = pd.concat([existing_data, service_data]).drop_duplicates().reset_index(drop=True)
-
-				service_data.to_csv(service_filename, index=False)
-				print(f"Data for {service} saved to {service_filename}")
-
-		for service in global_var.SERVICE_TO_USE:
-			if not service_data_dict[service].empty:
-				metric_columns = [f"{metric_id}_{aggregation}" for metric_id, aggregation in self.metrics]
-				service_data_dict[service] = service_data_dict[service][['timestamp'] + metric_columns]
-
-		return service_data_dict
+		# process the analysis window of each metric
+		# return: TimeSeriesWindow of the services and metrics of the processor, a view of the store (services x metrics x timestamps)
+		store = self.store if self.store is not None else self.load_store()
+		window = store.window(global_var.DURATION // global_var.SAMPLING).select(self.services, self.columns)
+
+		for metric_id, aggregation in self.metrics:
+			for service in window.services:
+				self.record(window, service, metric_id, aggregation, create_new_file)
+
+		return window
+
+def last_recorded_timestamp(filename):
+	"""
+	Timestamp of the last row of a metric CSV, read from the end of the file.
+	"""
+	with open(filename, "rb") as file:
+		file.seek(0, os.SEEK_END)
+		file.seek(max(file.tell() - 4096, 0))
+		lines = file.read().decode().strip().splitlines()
+	try:
+		return int(float(lines[-1].split(",")[0]))
+	except (IndexError, ValueError):
+		return None
 
 def main():
 	# IBM Cloud API Credentials
@@ -180,10 +188,14 @@ def main():
 		("net.request.count.in", "sum"),
 	]
 
-	monitor = ScenarioMonitor(URL, APIKEY, GUID)
-	data_processor = DataProcessor(core_metrics)
+	data_dir = global_var.REPLAY_OUTPUT_DIR if global_var.METRICS_SOURCE == "replay" else global_var.DATA_DIR
+	monitor = ScenarioMonitor(URL, APIKEY, GUID, data_dir=data_dir)
+	data_processor = DataProcessor(core_metrics, data_dir, store=monitor.cache.store)
 
+	# Cycles on the clock of the source, until the end of a replay
+	scheduler = monitor.source.scheduler(global_var.SLEEP, global_var.SAMPLING)
 	while True:
+		tick = scheduler.wait()
 		# Fetch data from IBM
 		for id in avg_metric_ids:
 			monitor.fetch_data_from_ibm(id, "avg")
@@ -195,8 +207,10 @@ def main():
 			monitor.fetch_data_from_ibm(id, "max")
 		print(f"Pulling metrics from IBM Cloud")
 		data_processor.process_data(global_var.CREATE_NEW_FILE)
-		# Sleep for customizing second
-		time.sleep(global_var.SLEEP)
+		scheduler.finish(tick)
+		# A replay stops after the cycle that saw its last sample
+		if monitor.source.finished(tick.scheduled):
+			break
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file
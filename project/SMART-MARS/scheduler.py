@@ -0,0 +1,155 @@
+import math
+import asyncio
+import time
+
+import instrumentation as metrics
+
+
+class Tick:
+    def __init__(self, scheduler, index, scheduled, started):
+        """
+        One firing of a CycleScheduler.
+
+        :param scheduler: Scheduler that fired the tick.
+        :param index: Number of the tick since the scheduler started (skipped ticks included).
+        :param scheduled: Time the tick was due.
+        :param started: Time the tick actually fired.
+        """
+        self.scheduler = scheduler
+        self.index = index
+        self.scheduled = scheduled
+        self.started = started
+        self.deadline = scheduled + scheduler.interval
+
+    @property
+    def jitter(self):
+        return self.started - self.scheduled
+
+    def remaining(self):
+        """
+        :return: Seconds left before the next tick is due.
+        """
+        return self.deadline - self.scheduler.time_fn()
+
+    def allows(self, stage, expected=0.0):
+        """
+        Decide whether an optional stage still fits in this cycle. The stage is shed when the
+        previous cycle overran or when its expected duration does not fit before the next tick.
+
+        :param stage: Name of the stage, used in the log and the shed counter.
+        :param expected: Expected duration of the stage in seconds.
+        :return: True if the stage should run.
+        """
+        if self.scheduler.last_overrun > 0:
+            print(f"Shedding {stage}: the previous cycle overran by {self.scheduler.last_overrun:.1f} s")
+        elif self.remaining() < expected:
+            print(f"Shedding {stage}: {self.remaining():.1f} s left in the cycle, {expected:.1f} s expected")
+        else:
+            return True
+        metrics.SHED_STAGES.inc(stage=stage)
+        return False
+
+
+class CycleScheduler:
+    def __init__(self, interval, align=None, time_fn=time.time, sleep_fn=time.sleep, async_sleep_fn=asyncio.sleep):
+        """
+        Fire control cycles on a fixed wall-clock grid instead of sleeping a fixed time after each cycle,
+        so the period does not drift by the processing time.
+
+        The first tick is the next multiple of align, every following tick is interval later.
+        A cycle that runs past the next tick is an overrun: the ticks it missed are skipped, so the
+        cycles stay on the grid and the samples of each window stay evenly spaced.
+
+        :param interval: Period of the cycles in seconds.
+        :param align: Ticks are aligned to multiples of this many seconds (e.g. the sampling interval), defaults to interval.
+        :param time_fn: Clock returning seconds since the epoch (time.time, or a virtual clock for replays).
+        :param sleep_fn: Function sleeping for a number of seconds on that clock.
+        :param async_sleep_fn: Coroutine function sleeping for a number of seconds on that clock.
+        """
+        if interval <= 0:
+            raise ValueError("The cycle interval must be positive.")
+        self.interval = interval
+        self.align = align or interval
+        self.time_fn = time_fn
+        self.sleep_fn = sleep_fn
+        self.async_sleep_fn = async_sleep_fn
+
+        self.first_tick = None
+        self.next_index = 0
+        self.last_overrun = 0.0
+        self.overruns = 0
+        self.skipped = 0
+
+    def _tick_time(self, index):
+        return self.first_tick + index * self.interval
+
+    def _next_tick_time(self):
+        now = self.time_fn()
+        if self.first_tick is None:
+            self.first_tick = math.ceil(now / self.align) * self.align
+        elif now > self._tick_time(self.next_index):
+            # The previous cycle overran: skip to the first tick still ahead
+            index = math.ceil((now - self.first_tick) / self.interval)
+            skipped = index - self.next_index
+            self.skipped += skipped
+            metrics.SKIPPED_TICKS.inc(skipped)
+            self.next_index = index
+        return self._tick_time(self.next_index)
+
+    def _fire(self, scheduled):
+        tick = Tick(self, self.next_index, scheduled, self.time_fn())
+        metrics.SCHEDULE_JITTER.observe(tick.jitter)
+        self.next_index += 1
+        return tick
+
+    def wait(self):
+        """
+        Sleep until the next tick is due.
+        :return: The Tick that fired.
+        """
+        scheduled = self._next_tick_time()
+        # Loop, because a sleep may wake up early
+        while (remaining := scheduled - self.time_fn()) > 0:
+            self.sleep_fn(remaining)
+        return self._fire(scheduled)
+
+    async def wait_async(self):
+        """
+        Same as wait(), for a controller running in an asyncio event loop.
+        """
+        scheduled = self._next_tick_time()
+        while (remaining := scheduled - self.time_fn()) > 0:
+            await self.async_sleep_fn(remaining)
+        return self._fire(scheduled)
+
+    def finish(self, tick):
+        """
+        Record the end of the cycle started by tick.
+        :return: Overrun of the cycle in seconds (0 if it finished before the next tick).
+        """
+        self.last_overrun = max(self.time_fn() - tick.deadline, 0.0)
+        if self.last_overrun > 0:
+            self.overruns += 1
+            metrics.OVERRUNS.inc()
+            print(f"Cycle {tick.index} overran its {self.interval} s interval by {self.last_overrun:.1f} s")
+        return self.last_overrun
+
+    def run(self, cycle, cycles=None, until=None):
+        """
+        Call cycle(tick) on every tick.
+
+        :param cycle: Function running one control cycle.
+        :param cycles: Number of cycles to run, forever by default.
+        :param until: Function of the last tick returning True when the cycles should stop (e.g. after the
+                      cycle that saw the last sample of a replay).
+        """
+        count = 0
+        while cycles is None or count < cycles:
+            tick = self.wait()
+            try:
+                cycle(tick)
+            finally:
+                self.finish(tick)
+            count += 1
+            if until is not None and until(tick):
+                break
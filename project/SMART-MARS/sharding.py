@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from collections import defaultdict, deque
+import numpy as np
+
+import global_var as gv
+import instrumentation as metrics
+from scheduler import CycleScheduler
+
+
+def partition(tenants, n_shards):
+    """
+    Spread the tenants over the shards so that each shard manages about the same number of services
+    (largest tenants first, each to the least loaded shard).
+
+    :return: List of n_shards lists of tenants (some may be empty when there are fewer tenants than shards).
+    """
+    shards = [[] for _ in range(n_shards)]
+    load = [0] * n_shards
+    for tenant in sorted(tenants, key=lambda tenant: len(tenant["services"]), reverse=True):
+        index = load.index(min(load))
+        shards[index].append(tenant)
+        load[index] += len(tenant["services"])
+    return shards
+
+
+class SharedWeights:
+    def __init__(self, name, layout):
+        """
+        Parameters of the RL policies stored once in a shared memory block, so that every shard
+        process serves the same read-only weights instead of holding its own copy.
+
+        :param name: Name of the shared memory block.
+        :param layout: List of (model name, parameter name, offset, shape), offsets in float32 elements.
+        """
+        self.name = name
+        self.layout = layout
+        self._shm = None
+
+    @classmethod
+    def create(cls, models):
+        """
+        Copy the float32 policy parameters of the loaded models into a new shared memory block.
+        The block must be released with unlink() by the process that created it.
+
+        :param models: Dictionary of Stable-Baselines3 models keyed by name.
+        """
+        layout, arrays, offset = [], [], 0
+        for model_name, model in models.items():
+            for param_name, param in model.policy.named_parameters():
+                array = param.detach().cpu().numpy()
+                if array.dtype != np.float32:
+                    continue
+                layout.append((model_name, param_name, offset, array.shape))
+                arrays.append(array)
+                offset += array.size
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1) * 4)
+        flat = np.ndarray((offset,), dtype=np.float32, buffer=shm.buf)
+        for (_, _, start, _), array in zip(layout, arrays):
+            flat[start:start + array.size] = array.ravel()
+        weights = cls(shm.name, layout)
+        weights._shm = shm
+        print(f"Shared {offset * 4 / 1024:.1f} KiB of model weights in {shm.name}")
+        return weights
+
+    def attach(self, models):
+        """
+        Point the parameters of models (loaded in this process) to the shared block, which frees their own copy.
+        The weights are shared read-only: models attached this way must not be trained.
+        """
+        import torch
+
+        self._shm = shared_memory.SharedMemory(name=self.name)
+        for model_name, param_name, offset, shape in self.layout:
+            if model_name not in models:
+                continue
+            params = dict(models[model_name].policy.named_parameters())
+            view = np.ndarray(shape, dtype=np.float32, buffer=self._shm.buf, offset=offset * 4)
+            params[param_name].data = torch.from_numpy(view)
+            params[param_name].requires_grad_(False)
+
+    def __getstate__(self):
+        # Only the name and the layout travel to the shard processes
+        return {"name": self.name, "layout": self.layout}
+
+    def __setstate__(self, state):
+        self.__init__(state["name"], state["layout"])
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+
+    def unlink(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+class TenantController:
+    def __init__(self, tenant, model_manager, data_root, source=None, executor=None):
+        """
+        Scenario state, monitor and executor of one namespace inside a shard.
+
+        :param tenant: Dictionary with "namespace", "services" and "virtual_service" (see gv.TENANTS).
+        :param model_manager: ModelManager of the tenant (own environment, models shared within the shard).
+        :param data_root: Directory under which the tenant writes its metric windows.
+        :param source: Metrics source, by default the one selected in global_var for the tenant's namespace.
+        :param executor: Executor, by default one applying the tenant's virtual service.
+        """
+        from scenario_monitor import ScenarioMonitor, DataProcessor
+        from scenario_manager import ScenarioManager
+        from load_forecaster import LoadForecaster
+        import main as controller
+
+        self.controller = controller
+        self.namespace = tenant["namespace"]
+        self.services = tenant["services"]
+        self.data_dir = os.path.join(data_root, self.namespace)
+        self.scenario_monitor = ScenarioMonitor(gv.URL, gv.APIKEY, gv.GUID, source=source, data_dir=self.data_dir,
+                                                namespace=self.namespace)
+        self.data_processor = DataProcessor(controller.CORE_METRICS, self.data_dir, services=self.services,
+                                            store=self.scenario_monitor.cache.store)
+        self.model_manager = model_manager
+        if executor is None:
+            from Executor import Executor
+            # One log per tenant, next to its datasets
+            weights_log = os.path.join(self.data_dir, gv.APPLIED_WEIGHTS_LOG) if gv.APPLIED_WEIGHTS_LOG else None
+            executor = Executor(tenant["virtual_service"], gv.APPLY_COMMAND, weights_log,
+                                clock=self.scenario_monitor.source.now)
+        self.executor = executor
+        self.recent_loads_dict = defaultdict(lambda: deque(maxlen=30))
+        self.scenario_manager = ScenarioManager(ema_alpha=0.2, ema_threshold=5, variance_threshold=10, concurrency_threshold=100)
+        self.load_forecaster = LoadForecaster(horizon=gv.FORECAST_CYCLES * gv.SLEEP // gv.SAMPLING)
+
+    def run_cycle(self, tick=None):
+        # Shared weights are read-only, so no fine-tuning
+        return self.controller.run_cycle(self.scenario_monitor, self.data_processor, self.scenario_manager,
+                                         self.model_manager, self.executor, self.recent_loads_dict,
+                                         self.load_forecaster, train_steps=0, tick=tick)
+
+
+def run_shard(index, tenants, weights, cycles=None, replay_dir=None, data_root=None, results=None):
+    """
+    Process entry point of a shard: run the MAPE-K cycles of its tenants on a common schedule.
+
+    :param index: Number of the shard.
+    :param tenants: Tenants managed by the shard.
+    :param weights: SharedWeights of the models, or None to load private copies.
+    :param cycles: Number of cycles to run, forever by default.
+    :param replay_dir: Replay this recorded dataset on a virtual clock instead of monitoring live (benchmark).
+    :param data_root: Directory under which the tenants write their metric windows.
+    :param results: Queue receiving the summary of the shard when it stops.
+    """
+    from model_manager import ModelManager
+
+    data_root = data_root or gv.DATA_DIR
+    if replay_dir is not None:
+        from metrics_source import ReplayMetricsSource
+        from replay import VirtualClock, FakeExecutor
+        source = ReplayMetricsSource(replay_dir)
+        clock = VirtualClock(source.first_timestamp + gv.DURATION)
+        source.clock = clock.now
+        scheduler = CycleScheduler(gv.SLEEP, gv.SAMPLING, time_fn=clock.now, sleep_fn=clock.sleep)
+    else:
+        source = None
+        scheduler = CycleScheduler(gv.SLEEP, gv.SAMPLING)
+
+    controllers = []
+    decisions = 0
+    count = 0
+    start = time.perf_counter()
+    try:
+        # One set of models per shard, every tenant gets its own environment
+        shard_manager = ModelManager(gv.MODEL_PATH)
+        if weights is not None:
+            weights.attach(shard_manager.models)
+        for tenant in tenants:
+            model_manager = shard_manager if not controllers else ModelManager(gv.MODEL_PATH, models=shard_manager.models)
+            executor = FakeExecutor(clock) if replay_dir is not None else None
+            controllers.append(TenantController(tenant, model_manager, data_root, source, executor))
+        print(f"Shard {index} manages {len(controllers)} namespaces, {sum(len(t['services']) for t in tenants)} services")
+
+        dump = gv.METRICS_DUMP.replace(".json", f"_shard{index}.json") if gv.METRICS_DUMP else None
+        start = time.perf_counter()
+        while cycles is None or count < cycles:
+            tick = scheduler.wait()
+            with metrics.cycle(gv.SLEEP):
+                for tenant_controller in controllers:
+                    try:
+                        if tenant_controller.run_cycle(tick) is not None:
+                            decisions += 1
+                    except Exception as e:
+                        print(f"Cycle failed for {tenant_controller.namespace}: {e}")
+            scheduler.finish(tick)
+            if dump:
+                metrics.REGISTRY.dump_json(dump)
+            count += 1
+    finally:
+        if weights is not None:
+            weights.close()
+        if results is not None:
+            results.put({"shard": index, "namespaces": len(controllers),
+                         "services": sum(len(tenant["services"]) for tenant in tenants),
+                         "cycles": count, "decisions": decisions, "elapsed_s": time.perf_counter() - start})
+
+
+def run_sharded(tenants, n_shards=None, cycles=None, replay_dir=None, data_root=None, share_weights=True):
+    """
+    Run the controller for all tenants, sharded over n_shards processes.
+
+    :return: List of the shard summaries (only returns when cycles is set).
+    """
+    n_shards = n_shards or os.cpu_count()
+    shards = [shard for shard in partition(tenants, n_shards) if shard]
+    # spawn: the shard processes must not inherit the torch state of this process
+    context = mp.get_context("spawn")
+    weights = None
+    if share_weights:
+        from model_manager import ModelManager
+        weights = SharedWeights.create(ModelManager(gv.MODEL_PATH).models)
+
+    results = context.Queue()
+    processes = [context.Process(target=run_shard, args=(index, shard, weights, cycles, replay_dir, data_root, results),
+                                 name=f"smart-mars-shard-{index}")
+                 for index, shard in enumerate(shards)]
+    try:
+        for process in processes:
+            process.start()
+        summaries = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        if weights is not None:
+            weights.unlink()
+    return sorted(summaries, key=lambda summary: summary["shard"])
+
+
+def synthetic_tenants(n_tenants, services):
+    """
+    Tenants for the benchmark: n_tenants namespaces each managing the recorded services.
+    """
+    return [{"namespace": f"bench-{i}", "services": list(services), "virtual_service": None} for i in range(n_tenants)]
+
+
+def benchmark(replay_dir, services_counts=(20, 100, 400), shard_counts=None, cycles=5):
+    """
+    Measure the controller throughput (managed services x cycles per second) against the number of
+    shards, replaying replay_dir on virtual clocks so that only the processing time is measured.
+
+    :return: List of result dictionaries.
+    """
+    shard_counts = shard_counts or sorted({1, 2, 4, os.cpu_count()} & set(range(1, os.cpu_count() + 1)))
+    services = gv.SERVICE_TO_USE
+    results = []
+    for n_services in services_counts:
+        tenants = synthetic_tenants(max(n_services // len(services), 1), services)
+        for n_shards in shard_counts:
+            with tempfile.TemporaryDirectory(prefix="smart_mars_shards_") as data_root:
+                start = time.perf_counter()
+                summaries = run_sharded(tenants, n_shards, cycles, replay_dir, data_root)
+                elapsed = time.perf_counter() - start
+            # Throughput over the cycles only, the start-up (model loading) is reported separately
+            cycle_time = max(summary["elapsed_s"] for summary in summaries)
+            managed = sum(summary["services"] for summary in summaries)
+            result = {"services": managed, "shards": len(summaries), "cycles": cycles,
+                      "service_cycles_per_s": managed * cycles / cycle_time if cycle_time > 0 else 0.0,
+                      "cycle_time_s": cycle_time, "startup_s": elapsed - cycle_time}
+            results.append(result)
+            print(f"{managed:5d} services, {len(summaries):3d} shards: "
+                  f"{result['service_cycles_per_s']:10.1f} service-cycles/s, start-up {result['startup_s']:.1f} s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the SMART-MARS controller for many namespaces, sharded over processes.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Manage the namespaces of global_var.TENANTS")
+    run_parser.add_argument("--shards", type=int, default=gv.SHARDS, help="Number of shard processes (0: one per core)")
+    run_parser.add_argument("--private-weights", action="store_true", help="Load the models in every shard instead of sharing them")
+    bench_parser = subparsers.add_parser("benchmark", help="Throughput against the number of shards on a recorded dataset")
+    bench_parser.add_argument("--data-dir", default=gv.REPLAY_DIR, help="Recorded dataset directory")
+    bench_parser.add_argument("--services", type=int, nargs="+", default=[20, 100, 400], help="Numbers of managed services")
+    bench_parser.add_argument("--shards", type=int, nargs="+", default=None, help="Numbers of shards (default: 1, 2, 4, cores)")
+    bench_parser.add_argument("--cycles", type=int, default=5)
+    bench_parser.add_argument("--output", default=None, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run_sharded(gv.TENANTS, args.shards or None, share_weights=not args.private_weights)
+    else:
+        results = benchmark(args.data_dir, args.services, args.shards, args.cycles)
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(results, file, indent=4)
+
+if __name__ == "__main__":
+    main()
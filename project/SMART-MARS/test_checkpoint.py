@@ -0,0 +1,69 @@
+import os
+import time
+
+import pytest
+
+import checkpoint
+from checkpoint import CHECKPOINT_VERSION, MODEL_NAMES, model_path_for_restart, read, read_recent, write_atomic
+
+MAX_AGE = 3600
+
+
+def state(age=0, **fields):
+    return dict({"version": CHECKPOINT_VERSION, "saved_at": time.time() - age, "tick": 3}, **fields)
+
+
+def test_roundtrip_and_failed_write(tmp_path):
+    path = str(tmp_path / "state" / "checkpoint.pkl")
+    write_atomic(path, state())
+    assert read(path)["tick"] == 3
+    # A state that can not be pickled leaves the previous checkpoint and no temporary file
+    with pytest.raises(Exception):
+        write_atomic(path, state(tick=lambda: 4))
+    assert read(path)["tick"] == 3
+    assert os.listdir(tmp_path / "state") == ["checkpoint.pkl"]
+
+
+def test_unusable_checkpoints_are_ignored(tmp_path):
+    path = str(tmp_path / "checkpoint.pkl")
+    assert read(path) is None
+    (tmp_path / "checkpoint.pkl").write_bytes(b"not a pickle")
+    assert read(path) is None
+    # Written by another version of the snapshot layout
+    write_atomic(path, state(version=CHECKPOINT_VERSION + 1))
+    assert read(path) is None
+    write_atomic(path, state(version=None))
+    assert read(path) is None
+
+
+def test_read_recent_checks_the_age(tmp_path):
+    path = str(tmp_path / "checkpoint.pkl")
+    write_atomic(path, state(age=MAX_AGE / 2))
+    assert read_recent(path, MAX_AGE)["tick"] == 3
+    write_atomic(path, state(age=2 * MAX_AGE))
+    assert read_recent(path, MAX_AGE) is None
+    # 0: no limit
+    assert read_recent(path, 0)["tick"] == 3
+    assert read_recent(str(tmp_path / "missing.pkl"), MAX_AGE) is None
+
+
+def test_models_are_only_restored_with_their_snapshot(tmp_path, monkeypatch):
+    models_dir = str(tmp_path / "models")
+    os.makedirs(models_dir)
+    for name in MODEL_NAMES[:-1]:
+        open(f"{models_dir}/{name}_service_mesh_model.zip", "w").close()
+    saved = state(models_saved_at=time.time())
+
+    assert model_path_for_restart(None, models_dir, "default") == "default"
+    assert model_path_for_restart(state(), models_dir, "default") == "default"
+    # One model is missing
+    assert model_path_for_restart(saved, models_dir, "default") == "default"
+    open(f"{models_dir}/{MODEL_NAMES[-1]}_service_mesh_model.zip", "w").close()
+    assert model_path_for_restart(saved, models_dir, "default") == models_dir
+    assert model_path_for_restart(saved, None, "default") == "default"
+
+    # The age is measured on the clock at restart
+    path = str(tmp_path / "checkpoint.pkl")
+    write_atomic(path, saved)
+    monkeypatch.setattr(checkpoint.time, "time", lambda: saved["saved_at"] + 2 * MAX_AGE)
+    assert model_path_for_restart(read_recent(path, MAX_AGE), models_dir, "default") == "default"
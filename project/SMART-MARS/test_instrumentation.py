@@ -0,0 +1,67 @@
+import json
+from urllib.request import urlopen
+
+import pytest
+
+import instrumentation
+from instrumentation import Registry
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry(prefix="test")
+    histogram = registry.histogram("latency_seconds", "Latency.", (0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, stage="fetch")
+    samples = {(name, dict(key).get("le")): value for name, key, value in histogram.samples()}
+    # A value on a bound falls in its bucket
+    assert samples[("test_latency_seconds_bucket", "0.1")] == 2
+    assert samples[("test_latency_seconds_bucket", "1.0")] == 3
+    assert samples[("test_latency_seconds_bucket", "+Inf")] == 4
+    assert samples[("test_latency_seconds_count", None)] == 4
+    assert histogram.mean(stage="fetch") == pytest.approx(0.9125) and histogram.mean(stage="train") == 0
+    assert registry.to_dict()["test_latency_seconds"]['{stage="fetch"}']["max"] == 3
+
+
+def test_prometheus_exposition():
+    registry = Registry(prefix="test")
+    counter = registry.counter("failures_total", "Failures.")
+    counter.inc(stage='say "hi"\n')
+    counter.inc(2)
+    assert registry.counter("failures_total", "Again.") is counter
+    registry.gauge("budget_ratio", "Budget.").set(0.5)
+    assert registry.render_prometheus().splitlines() == [
+        "# HELP test_failures_total Failures.",
+        "# TYPE test_failures_total counter",
+        'test_failures_total{stage="say \\"hi\\"\\n"} 1',
+        "test_failures_total 2",
+        "# HELP test_budget_ratio Budget.",
+        "# TYPE test_budget_ratio gauge",
+        "test_budget_ratio 0.5",
+    ]
+
+
+def test_stage_records_durations_and_failures():
+    timings = {}
+    failures = instrumentation.FAILURES.value(stage="test_stage")
+    count = instrumentation.STAGE_LATENCY.count(stage="test_stage")
+    with instrumentation.stage("test_stage", timings):
+        pass
+    with pytest.raises(RuntimeError):
+        with instrumentation.stage("test_stage", timings):
+            raise RuntimeError("fetch failed")
+    assert instrumentation.STAGE_LATENCY.count(stage="test_stage") == count + 2
+    assert instrumentation.FAILURES.value(stage="test_stage") == failures + 1
+    assert timings["test_stage"] >= 0
+
+
+def test_http_endpoint():
+    registry = Registry(prefix="test")
+    registry.counter("cycles_total", "Cycles.").inc()
+    server = registry.start_http_server(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        assert "test_cycles_total 1" in urlopen(f"{url}/metrics").read().decode()
+        assert json.loads(urlopen(f"{url}/metrics.json").read()) == {"test_cycles_total": {"total": 1}}
+    finally:
+        server.shutdown()
+        server.server_close()
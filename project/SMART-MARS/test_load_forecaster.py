@@ -0,0 +1,56 @@
+import numpy as np
+
+from load_forecaster import HoltWintersForecaster, LoadForecaster
+
+SERVICE = "orders"
+PERIOD = 12
+
+
+def seasonal_load(n, start=0):
+    t = np.arange(start, start + n)
+    return 100 + 40 * np.sin(2 * np.pi * t / PERIOD)
+
+
+def test_trend_without_season():
+    forecaster = HoltWintersForecaster()
+    for value in range(10, 210, 2):
+        forecaster.update(value)
+    assert forecaster.season_length is None
+    np.testing.assert_allclose(forecaster.forecast(3), [210, 212, 214], rtol=0.02)
+    # Never negative
+    for value in range(200, 0, -10):
+        forecaster.update(value)
+    assert forecaster.forecast(100).min() == 0
+
+
+def test_season_is_detected_and_forecasted():
+    forecaster = HoltWintersForecaster()
+    for value in seasonal_load(240):
+        forecaster.update(value)
+    assert forecaster.season_length == PERIOD
+    np.testing.assert_allclose(forecaster.forecast(PERIOD), seasonal_load(PERIOD, start=240), atol=4)
+
+
+def test_seen_and_missing_samples_are_skipped():
+    load = seasonal_load(120)
+    once, overlapping = LoadForecaster(), LoadForecaster()
+    once.update(SERVICE, range(120), load)
+    # Overlapping windows, with a missing sample
+    overlapping.update(SERVICE, range(80), load[:80])
+    overlapping.update(SERVICE, range(40, 120), np.where(np.arange(40, 120) == 100, np.nan, load[40:]))
+    assert overlapping.last_timestamp[SERVICE] == 119
+    assert overlapping.forecasters[SERVICE].n_updates == 119
+    assert abs(overlapping.peak(SERVICE) - once.peak(SERVICE)) < 5
+    assert once.peak("payments") is None and once.forecast("payments").size == 0
+
+
+def test_snapshot_restore():
+    forecaster = LoadForecaster(horizon=4)
+    forecaster.update(SERVICE, range(100), seasonal_load(100))
+    restored = LoadForecaster(horizon=4)
+    restored.restore(forecaster.snapshot())
+    np.testing.assert_array_equal(restored.forecast(SERVICE), forecaster.forecast(SERVICE))
+    # Both keep learning the same way
+    for model in (forecaster, restored):
+        model.update(SERVICE, range(100, 130), seasonal_load(30, start=100))
+    np.testing.assert_array_equal(restored.forecast(SERVICE), forecaster.forecast(SERVICE))
@@ -0,0 +1,54 @@
+from metric_cache import MetricCache
+
+WINDOW = 60
+SAMPLING = 10
+METRIC = "cpu.quota.used.percent"
+NOW = 10000
+
+
+def response(start, end, services=("a", "b")):
+    """
+    Sysdig data response with one sample per service every SAMPLING seconds in [start, end].
+    """
+    return {"data": [{"t": t, "d": [service, float(t + i)]}
+                     for t in range(start, end + 1, SAMPLING) for i, service in enumerate(services)]}
+
+
+def test_only_the_delta_is_queried():
+    cache = MetricCache(WINDOW, SAMPLING)
+    # Nothing cached: the full window
+    assert cache.query_range(METRIC, NOW + 5) == (NOW - WINDOW, NOW)
+    assert cache.ingest(METRIC, response(NOW - WINDOW, NOW)) == 2 * (WINDOW // SAMPLING + 1)
+
+    # Still in the same bucket: nothing to fetch
+    assert cache.query_range(METRIC, NOW + 5) is None
+    # The last sample is fetched again, it may still have been accumulating
+    assert cache.query_range(METRIC, NOW + 25) == (NOW, NOW + 20)
+    # Far behind: never more than the window
+    assert cache.query_range(METRIC, NOW + 10 * WINDOW) == (NOW + 9 * WINDOW, NOW + 10 * WINDOW)
+
+
+def test_delta_is_merged_into_the_window():
+    cache = MetricCache(WINDOW, SAMPLING)
+    cache.ingest(METRIC, response(NOW - WINDOW, NOW))
+    # The delta repeats the last sample with its final value and adds two new ones
+    delta = response(NOW, NOW + 2 * SAMPLING)
+    delta["data"][0]["d"][1] = -1.0
+    assert cache.ingest(METRIC, delta) == 4
+
+    window = cache.get_window(METRIC)
+    assert (window["start"], window["end"]) == (NOW + 2 * SAMPLING - WINDOW, NOW + 2 * SAMPLING)
+    timestamps = [entry["t"] for entry in window["data"]]
+    assert timestamps == sorted(timestamps)
+    assert timestamps[0] > window["start"] - SAMPLING and timestamps[-1] == window["end"]
+    assert {"t": NOW, "d": ["a", -1.0]} in window["data"]
+    # Same samples as a cache that fetched everything at once
+    full = MetricCache(WINDOW, SAMPLING)
+    full.ingest(METRIC, response(NOW - WINDOW, NOW + 2 * SAMPLING))
+    full.ingest(METRIC, {"data": [{"t": NOW, "d": ["a", -1.0]}]})
+    assert full.get_window(METRIC) == window
+
+
+def test_empty_window():
+    cache = MetricCache(WINDOW, SAMPLING)
+    assert cache.get_window(METRIC) == {"start": None, "end": None, "data": []}
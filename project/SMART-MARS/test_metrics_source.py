@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from metrics_source import ReplayMetricsSource, create_metrics_source
+
+START = 1700000000
+SAMPLING = 10
+
+
+def write_dataset(data_dir):
+    """
+    Record the request count of two services: a *_metric.json file and the per-service CSV files,
+    which overlap on one sample.
+    """
+    data_dir.mkdir()
+    data = [{"t": START + k * SAMPLING, "d": ["orders", float(k)]} for k in range(6)]
+    data += [{"t": START + 2 * SAMPLING, "d": ["payments", None]}, {"t": START + 5 * SAMPLING, "d": ["payments", 105.0]}]
+    (data_dir / "net_request_count_in_sum_metric.json").write_text(json.dumps({"data": data}))
+    (data_dir / "payments").mkdir()
+    rows = "".join(f"{START + k * SAMPLING},payments,{100 + k}\n" for k in range(5, 9))
+    (data_dir / "payments" / "net_request_count_in_sum.csv").write_text("timestamp,service,value\n" + rows)
+
+
+def test_recorded_samples_are_served_by_range(tmp_path):
+    write_dataset(tmp_path / "data")
+    source = ReplayMetricsSource(str(tmp_path / "data"), clock=lambda: START + 4 * SAMPLING)
+    assert (source.first_timestamp, source.last_timestamp) == (START, START + 8 * SAMPLING)
+
+    ok, response = source.get_data("net.request.count.in", "sum", START + SAMPLING, START + 2 * SAMPLING, SAMPLING)
+    assert ok and response["data"] == [{"t": START + 10, "d": ["orders", 1.0]}, {"t": START + 20, "d": ["orders", 2.0]},
+                                       {"t": START + 20, "d": ["payments", None]}]
+    # Relative to the replay clock
+    ok, response = source.get_data("net.request.count.in", "sum", -SAMPLING, 0, SAMPLING)
+    assert [entry["t"] for entry in response["data"]] == [START + 30, START + 40]
+    # Both files merged, the sample recorded twice is served once
+    ok, response = source.get_data("net.request.count.in", "sum", START + 50, START + 100, SAMPLING)
+    assert [entry["d"] for entry in response["data"]] == \
+        [["orders", 5.0], ["payments", 105.0], ["payments", 106.0], ["payments", 107.0], ["payments", 108.0]]
+
+    ok, message = source.get_data("cpu.quota.used.percent", "avg", START, START + 50, SAMPLING)
+    assert not ok and "No recorded data" in message
+
+
+def test_replay_clock_and_end(tmp_path):
+    write_dataset(tmp_path / "data")
+    now = [START]
+    source = ReplayMetricsSource(str(tmp_path / "data"), clock=lambda: now[0])
+    assert not source.finished()
+    assert source.finished(at=START + 8 * SAMPLING)
+
+    # The scheduler fires on the replay clock
+    scheduler = source.scheduler(SAMPLING)
+    scheduler.sleep_fn = lambda seconds: now.__setitem__(0, now[0] + seconds)
+    ticks = []
+    scheduler.run(ticks.append, until=lambda tick: source.finished(tick.started))
+    assert [tick.started for tick in ticks] == [START + k * SAMPLING for k in range(9)]
+
+    # An offset past the end still leaves one cycle over the whole recording
+    late = ReplayMetricsSource(str(tmp_path / "data"), start_offset=3600)
+    assert late.start_offset == 8 * SAMPLING
+
+
+def test_unknown_sources(tmp_path):
+    with pytest.raises(ValueError):
+        create_metrics_source("graphite")
+    with pytest.raises(FileNotFoundError):
+        ReplayMetricsSource(str(tmp_path))
@@ -0,0 +1,76 @@
+from scheduler import CycleScheduler
+
+INTERVAL = 10
+
+
+class FakeClock:
+    """
+    Virtual clock: sleeping advances it exactly, running a cycle advances it by the cycle duration.
+    """
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def scheduler_at(now, align=None):
+    clock = FakeClock(now)
+    return clock, CycleScheduler(INTERVAL, align, time_fn=clock.time, sleep_fn=clock.sleep)
+
+
+def test_ticks_do_not_drift_with_the_processing_time():
+    clock, scheduler = scheduler_at(1003.5)
+    started = []
+
+    def cycle(tick):
+        started.append(tick.started)
+        clock.now += 3  # Processing time of the cycle
+
+    scheduler.run(cycle, cycles=5)
+    # Aligned to the interval and exactly one interval apart
+    assert started == [1010, 1020, 1030, 1040, 1050]
+    assert scheduler.overruns == 0 and scheduler.skipped == 0
+
+
+def test_overrun_skips_the_missed_ticks():
+    clock, scheduler = scheduler_at(1000)
+    durations = iter([25, 1, 1])
+    started = []
+
+    def cycle(tick):
+        started.append((tick.index, tick.started))
+        clock.now += next(durations)
+
+    scheduler.run(cycle, cycles=3)
+    # The first cycle ran past two ticks: they are skipped and the grid is kept
+    assert started == [(0, 1000), (3, 1030), (4, 1040)]
+    assert scheduler.overruns == 1 and scheduler.skipped == 2
+
+
+def test_stages_are_shed():
+    clock, scheduler = scheduler_at(1000)
+    tick = scheduler.wait()
+    clock.now += 7
+    # 3 s left: a 2 s stage fits, a 5 s stage does not
+    assert tick.allows("train", 2.0)
+    assert not tick.allows("train", 5.0)
+
+    clock.now += 8
+    assert scheduler.finish(tick) == 5
+    # After an overrun, optional stages of the next cycle are shed whatever they cost
+    tick = scheduler.wait()
+    assert not tick.allows("train", 0.0)
+    scheduler.finish(tick)
+    tick = scheduler.wait()
+    assert tick.allows("train", 0.0)
+
+
+def test_stop_condition():
+    clock, scheduler = scheduler_at(1000)
+    ticks = []
+    scheduler.run(ticks.append, until=lambda tick: tick.index == 2)
+    assert [tick.index for tick in ticks] == [0, 1, 2]
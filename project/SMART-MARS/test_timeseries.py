@@ -0,0 +1,61 @@
+import numpy as np
+
+from timeseries import TimeSeriesStore
+
+SAMPLING = 10
+CAPACITY = 4
+BASE = 1000
+
+
+def filled_store(steps, services=("a", "b")):
+    """
+    Store with one sample per service and step: value = step (+ 100 for the second service).
+    """
+    store = TimeSeriesStore(SAMPLING, CAPACITY, services, ["cpu"])
+    for k in range(steps):
+        for offset, service in enumerate(services):
+            store.write(service, "cpu", BASE + k * SAMPLING, k + 100 * offset)
+    return store
+
+
+def test_window_wraps_around_the_capacity():
+    store = filled_store(CAPACITY + 3)
+    window = store.window()
+    # Only the last capacity steps are kept, contiguous and in order
+    assert list(window.timestamps) == [BASE + k * SAMPLING for k in range(3, CAPACITY + 3)]
+    assert list(window.series("a", "cpu")) == [3, 4, 5, 6]
+    assert list(window.series("b", "cpu")) == [103, 104, 105, 106]
+    # The window is a view of the store, not a copy
+    assert np.shares_memory(window.values, store.values)
+
+    shorter = store.window(2, end=BASE + 5 * SAMPLING)
+    assert list(shorter.series("a", "cpu")) == [4, 5]
+
+
+def test_old_and_repeated_samples():
+    store = filled_store(CAPACITY + 3)
+    # Older than the capacity: dropped
+    assert not store.write("a", "cpu", BASE, 42)
+    # Written twice: overwritten, not new
+    assert not store.write("a", "cpu", BASE + 6 * SAMPLING, 60)
+    assert store.window().series("a", "cpu")[-1] == 60
+    assert store.last_timestamp("cpu") == BASE + 6 * SAMPLING
+    assert store.last_timestamp("memory") is None
+
+
+def test_gaps_are_cleared_when_the_grid_moves():
+    store = filled_store(CAPACITY)
+    # Jump two steps ahead with one service only: the skipped and the reused slots hold no stale sample
+    store.write("a", "cpu", BASE + (CAPACITY + 1) * SAMPLING, 1.5)
+    window = store.window()
+    assert np.isnan(window.series("a", "cpu")[-2])
+    assert np.isnan(window.series("b", "cpu")[-1])
+    assert window.latest() == {"a": {"cpu": 1.5}, "b": {"cpu": 103.0}}
+
+
+def test_snapshot_restore_keeps_the_positions():
+    store = filled_store(CAPACITY + 1)
+    restored = TimeSeriesStore(SAMPLING, CAPACITY, ["b"])
+    restored.restore(store.snapshot())
+    assert list(restored.window().series("a", "cpu")) == list(store.window().series("a", "cpu"))
+    assert restored.services["b"] == 0
@@ -0,0 +1,229 @@
+import threading
+import numpy as np
+
+
+class TimeSeriesStore:
+    def __init__(self, sampling, capacity, services=(), metrics=()):
+        """
+        Compact store of the recent samples of every (service, metric), on one fixed sampling grid.
+
+        All the series share a preallocated float32 array of shape (services, metrics, 2 * capacity) and a
+        single int64 base timestamp: the sample of step k (timestamp base + k * sampling) lives in slot
+        k % capacity. Every write is mirrored into the second half of the array, so the last n <= capacity
+        steps are always a contiguous slice and windows are views of the store instead of copies.
+        A slot without a sample holds NaN.
+
+        :param sampling: Sampling interval of the series in seconds.
+        :param capacity: Number of steps kept per series.
+        :param services: Services known in advance, they get the first positions (in this order).
+        :param metrics: Metrics known in advance, they get the first positions (in this order).
+        """
+        if capacity <= 0:
+            raise ValueError("The capacity must be positive.")
+        self.sampling = int(sampling)
+        self.capacity = int(capacity)
+        self.services = {}  # service -> position on the first axis
+        self.metrics = {}  # metric -> position on the second axis
+        self.values = np.full((max(len(services), 1), max(len(metrics), 1), 2 * self.capacity), np.nan, dtype=np.float32)
+        self.last_step = np.full(self.values.shape[:2], -1, dtype=np.int64)  # Newest step written per series
+        self.base = None  # Timestamp of step 0, set by the first sample
+        self.newest = -1  # Newest step of the grid
+        # Metrics may be fetched by several threads at once (async runtime). Reentrant, so a reader can hold it
+        # while it copies a window out of the store
+        self.lock = threading.RLock()
+        for service in services:
+            self._position(self.services, service, 0)
+        for metric in metrics:
+            self._position(self.metrics, metric, 1)
+
+    def _position(self, index, name, axis):
+        if name not in index:
+            index[name] = len(index)
+            if len(index) > self.values.shape[axis]:
+                # Double the axis; views taken before keep pointing to the old array
+                self.values = np.concatenate([self.values, np.full_like(self.values, np.nan)], axis=axis)
+                self.last_step = np.concatenate([self.last_step, np.full_like(self.last_step, -1)], axis=axis)
+        return index[name]
+
+    def step(self, timestamp):
+        """
+        :return: Step of the grid a timestamp falls in.
+        """
+        if self.base is None:
+            self.base = int(timestamp) // self.sampling * self.sampling
+        return (int(timestamp) - self.base) // self.sampling
+
+    def timestamp(self, step):
+        return self.base + step * self.sampling
+
+    def _advance(self, step):
+        # Clear the slots the grid moves over, they hold samples from capacity steps ago
+        first = max(self.newest + 1, step - self.capacity + 1)
+        slots = np.arange(first, step + 1) % self.capacity
+        self.values[:, :, slots] = np.nan
+        self.values[:, :, slots + self.capacity] = np.nan
+        self.newest = step
+
+    def write(self, service, metric, timestamp, value):
+        """
+        Store one sample. A sample older than the capacity is dropped, a sample written twice overwrites itself.
+        :return: True if the series had no sample at this step yet.
+        """
+        with self.lock:
+            return self._write(service, metric, timestamp, value)
+
+    def _write(self, service, metric, timestamp, value):
+        step = self.step(timestamp)
+        if step <= self.newest - self.capacity:
+            return False
+        s = self._position(self.services, service, 0)
+        m = self._position(self.metrics, metric, 1)
+        if step > self.newest:
+            self._advance(step)
+        slot = step % self.capacity
+        new = self.last_step[s, m] < step or np.isnan(self.values[s, m, slot])
+        value = np.nan if value is None else value
+        self.values[s, m, slot] = value
+        self.values[s, m, slot + self.capacity] = value
+        self.last_step[s, m] = max(self.last_step[s, m], step)
+        return bool(new)
+
+    def ingest(self, metric, response):
+        """
+        Store the samples of a Sysdig data response ({"data": [{"t": ..., "d": [service, value]}]}).
+        :return: Number of samples that were not stored yet.
+        """
+        with self.lock:
+            return sum(self._write(entry['d'][0], metric, entry['t'], entry['d'][1]) for entry in response.get("data", []))
+
+    def last_timestamp(self, metric):
+        """
+        :return: The newest timestamp stored for a metric, or None if it has no sample.
+        """
+        with self.lock:
+            if metric not in self.metrics:
+                return None
+            step = self.last_step[:len(self.services), self.metrics[metric]].max(initial=-1)
+            return None if step < 0 or step <= self.newest - self.capacity else self.timestamp(int(step))
+
+    def snapshot(self):
+        """
+        :return: Picklable state of the store (the arrays are copied).
+        """
+        with self.lock:
+            return {"sampling": self.sampling, "capacity": self.capacity, "base": self.base, "newest": self.newest,
+                    "services": list(self.services), "metrics": list(self.metrics),
+                    "values": self.values[:len(self.services), :len(self.metrics)].copy(),
+                    "last_step": self.last_step[:len(self.services), :len(self.metrics)].copy()}
+
+    def restore(self, state):
+        """
+        Restore a state returned by snapshot(). The sampling and the capacity must match.
+        Services and metrics known in advance keep their positions.
+        """
+        if (state["sampling"], state["capacity"]) != (self.sampling, self.capacity):
+            raise ValueError("The snapshot was taken with a different sampling or capacity.")
+        with self.lock:
+            for service in state["services"]:
+                self._position(self.services, service, 0)
+            for metric in state["metrics"]:
+                self._position(self.metrics, metric, 1)
+            s = [self.services[service] for service in state["services"]]
+            m = [self.metrics[metric] for metric in state["metrics"]]
+            self.values[np.ix_(s, m)] = state["values"]
+            self.last_step[np.ix_(s, m)] = state["last_step"]
+            self.base = state["base"]
+            self.newest = state["newest"]
+
+    def window(self, steps=None, end=None):
+        """
+        Zero-copy view of the last steps of the grid.
+
+        :param steps: Number of steps (at most capacity), defaults to capacity.
+        :param end: Timestamp of the last step, defaults to the newest step.
+        :return: TimeSeriesWindow, valid until the store is written again. A reader that runs while other
+                 threads write holds lock until it is done with the window.
+        """
+        with self.lock:
+            return self._window(steps, end)
+
+    def _window(self, steps, end):
+        if self.base is None:
+            return TimeSeriesWindow(np.empty(0, dtype=np.int64), self.values[:0, :0, :0], self.services, self.metrics)
+        steps = self.capacity if steps is None else min(int(steps), self.capacity)
+        last = self.newest if end is None else min(self.step(end), self.newest)
+        first = max(last - steps + 1, self.newest - self.capacity + 1)
+        start = first % self.capacity
+        values = self.values[:len(self.services), :len(self.metrics), start:start + max(last - first + 1, 0)]
+        timestamps = self.base + np.arange(first, last + 1, dtype=np.int64) * self.sampling
+        return TimeSeriesWindow(timestamps, values, self.services, self.metrics)
+
+
+class TimeSeriesWindow:
+    def __init__(self, timestamps, values, services, metrics):
+        """
+        Window of a TimeSeriesStore shared by the stages of a cycle.
+
+        :param timestamps: int64 array of the timestamps of the window.
+        :param values: float32 array of shape (services, metrics, len(timestamps)), NaN where there is no sample.
+        :param services: Service -> position on the first axis of values.
+        :param metrics: Metric -> position on the second axis of values.
+        """
+        self.timestamps = timestamps
+        self.values = values
+        self.services = services
+        self.metrics = metrics
+
+    def select(self, services=None, metrics=None):
+        """
+        Restrict the window to some services and metrics, without copying the values.
+        Services and metrics that have no samples in the store are left out.
+        """
+        if services is not None:
+            services = {service: self.services[service] for service in services if service in self.services}
+        if metrics is not None:
+            metrics = {metric: self.metrics[metric] for metric in metrics if metric in self.metrics}
+        return TimeSeriesWindow(self.timestamps, self.values,
+                                self.services if services is None else services,
+                                self.metrics if metrics is None else metrics)
+
+    def copy(self):
+        """
+        :return: Window owning its values, for a consumer that still reads it after the store is written again.
+        """
+        return TimeSeriesWindow(self.timestamps.copy(), self.values.copy(), dict(self.services), dict(self.metrics))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def series(self, service, metric):
+        """
+        :return: float32 view of the samples of one (service, metric).
+        """
+        if metric not in self.metrics:
+            raise KeyError(f"No samples for metric {metric}.")
+        if service not in self.services:
+            return np.full(len(self.timestamps), np.nan, dtype=np.float32)
+        return self.values[self.services[service], self.metrics[metric]]
+
+    def has_data(self, service):
+        return service in self.services and bool(np.isfinite(self.values[self.services[service]]).any())
+
+    def latest(self):
+        """
+        Newest sample of every series.
+        :return: Dictionary service -> metric -> float, without the series that have no sample in the window.
+        """
+        if not len(self):
+            return {}
+        finite = np.isfinite(self.values)
+        # Position of the newest finite sample along the time axis
+        newest = self.values.shape[2] - 1 - np.argmax(finite[:, :, ::-1], axis=2)
+        found = finite.any(axis=2)
+        values = np.take_along_axis(self.values, newest[:, :, None], axis=2)[:, :, 0]
+        latest = {}
+        for service, s in self.services.items():
+            for metric, m in self.metrics.items():
+                if found[s, m]:
+                    latest.setdefault(service, {})[metric] = float(values[s, m])
+        return latest